@@ -0,0 +1,51 @@
+# admin.py
+# ────────────────────────────────────────────────────────────────────────────
+# کارهای زیرساختی که نباید در startup سرور اجرا شوند:
+#
+#   python admin.py create-index      ساخت ایندکس Pinecone (در صورت نبودن) و انتظار تا آماده شدن
+#   python admin.py ensure-indexes    ساخت ایندکس‌های MongoDB روی کالکشن listings
+#   python admin.py provision         هر دو
+# ────────────────────────────────────────────────────────────────────────────
+import time, logging, argparse
+
+from pinecone import ServerlessSpec
+
+from config    import get_pinecone, get_listings_collection, PINECONE_INDEX_NAME
+from normalize import ensure_indexes
+
+logger = logging.getLogger(__name__)
+
+
+def create_pinecone_index(name: str = PINECONE_INDEX_NAME, dimension: int = 1536) -> str:
+    """ایندکس را اگر وجود ندارد می‌سازد و host آن را برمی‌گرداند (برای PINECONE_INDEX_HOST)."""
+    pc = get_pinecone()
+    if name not in [i["name"] for i in pc.list_indexes()]:
+        logger.info(f"Creating Pinecone index '{name}' …")
+        pc.create_index(
+            name      = name,
+            dimension = dimension,
+            metric    = "cosine",
+            spec      = ServerlessSpec(cloud="aws", region="us-east-1")
+        )
+    while not pc.describe_index(name).status["ready"]:
+        time.sleep(1)
+    host = pc.describe_index(name).host
+    logger.info(f"✅ Pinecone index '{name}' is ready (host: {host})")
+    return host
+
+
+def ensure_mongo_indexes() -> None:
+    ensure_indexes(get_listings_collection())
+    logger.info("✅ MongoDB indexes are in place.")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    parser = argparse.ArgumentParser(description="Provision search infrastructure")
+    parser.add_argument("command", choices=["create-index", "ensure-indexes", "provision"])
+    args = parser.parse_args()
+
+    if args.command in ("create-index", "provision"):
+        create_pinecone_index()
+    if args.command in ("ensure-indexes", "provision"):
+        ensure_mongo_indexes()
@@ -2,20 +2,18 @@
 # ────────────────────────────────────────────────────────────────────────────
 from __future__ import annotations
 import json, asyncio
-from typing import Optional, Any
+from typing import Optional, Any, AsyncIterator, Tuple
 
-from config          import listings_collection, vector_store
 from search_service  import SearchService
-from search_semantic import SemanticSearch
-from models          import Model, MODELS
+from models          import get_model
 
 from langchain.llms.base import LLM
 from langchain.agents    import initialize_agent, AgentType
-from langchain.tools     import Tool
+from langchain.tools     import StructuredTool
 
 # ───────────────── ۱) لایهٔ جست‌وجو ─────────────────────────────────────────
-semantic_layer  = SemanticSearch(vector_store)
-search_service  = SearchService(listings_collection, vector_store, semantic_layer)
+# SearchService از بیرون (AppContainer در container.py) تزریق می‌شود؛
+# این ماژول خودش هیچ کلاینت یا کشی نمی‌سازد.
 
 # ───────────────── ۲) رَپِر LLM برای LangChain ─────────────────────────────
 class OpenRouterLangChain(LLM):
@@ -45,57 +43,86 @@ class OpenRouterLangChain(LLM):
             )
         except RuntimeError:  # یعنی هیچ loop فعالی وجود ندارد → مشکلی نیست
             return asyncio.run(
-                Model(model_type=self.model_name).generate_response(prompt)
+                get_model(self.model_name).generate_response(prompt)
             )
 
     # — مسیر «ناهمگام» (Async) —---------------------------------------------
     async def _acall(self, prompt: str, stop: Optional[list[str]] = None, **kw: Any) -> str:
-        return await Model(model_type=self.model_name).generate_response(prompt)
-
-# نمونهٔ LLM
-llm = OpenRouterLangChain()
+        return await get_model(self.model_name).generate_response(prompt)
 
 # ───────────────── ۳) تعریف ابزارها ─────────────────────────────────────────
-structured_tool = Tool(
-    name        = "structured_search",
-    func        = search_service.structured_search,
-    description = "Structured Mongo search (neighborhood, max_price, min_sqft)",
-)
-
-semantic_tool = Tool(
-    name        = "semantic_search",
-    func        = search_service.semantic_search,
-    description = "Semantic similarity search over listing descriptions",
-)
+def build_tools(search_service: SearchService) -> list[StructuredTool]:
+    async def _structured_search(
+        neighborhood: Optional[str]   = None,
+        max_price:    Optional[float] = None,
+        min_sqft:     Optional[float] = None,
+    ) -> list[dict]:
+        return await search_service.astructured_search(
+            neighborhood=neighborhood, max_price=max_price, min_sqft=min_sqft, limit=10
+        )
+
+    async def _semantic_search(query: str, k: int = 5) -> list[dict]:
+        # با ایندکس واژگانی پر: BM25 + برداری (آدرس، ZIP و کد کلاس ساختمان هم دقیق پیدا می‌شوند)
+        if search_service.hybrid_ready():
+            return await search_service.ahybrid_search(query, k)
+        return await search_service.asemantic_search(query, k)
+
+    structured_tool = StructuredTool.from_function(
+        coroutine   = _structured_search,
+        name        = "structured_search",
+        description = "Structured Mongo search (neighborhood, max_price, min_sqft)",
+    )
+    semantic_tool = StructuredTool.from_function(
+        coroutine   = _semantic_search,
+        name        = "semantic_search",
+        description = "Keyword + semantic search over listing descriptions and addresses "
+                      "(street addresses, ZIP codes, building class codes)",
+    )
+    return [structured_tool, semantic_tool]
 
 # ───────────────── ۴) ساخت Agent ────────────────────────────────────────────
-agent = initialize_agent(
-    tools  = [structured_tool, semantic_tool],
-    llm    = llm,
-    agent  = AgentType.OPENAI_FUNCTIONS,
-    verbose=False,
-)
+def build_agent(search_service: SearchService, llm: Optional[LLM] = None):
+    return initialize_agent(
+        tools  = build_tools(search_service),
+        llm    = llm or OpenRouterLangChain(),
+        agent  = AgentType.OPENAI_FUNCTIONS,
+        verbose=False,
+    )
 
 # ───────────────── ۵) توابع کمکی برای فراخوان Agent ────────────────────────
-async def run_agent(prompt: str) -> str:
+async def run_agent(agent, prompt: str) -> str:
     """فراخوان آزاد Agent به‌صورت ناهمگام"""
     return await agent.ainvoke(prompt)
 
-async def run_agent_with_filters(
+def _filters_prompt(
     neighborhood: str  | None = None,
     max_price:    float | None = None,
     min_sqft:     float | None = None,
     text:         str   | None = None,
 ) -> str:
-    """فراخوان Agent همراه با فیلترهای ساختاری"""
     payload = {
         "neighborhood": neighborhood,
         "max_price":    max_price,
         "min_sqft":     min_sqft,
     }
-    prompt = text or json.dumps(payload, ensure_ascii=False)
-    return await agent.ainvoke(prompt)
+    return text or json.dumps(payload, ensure_ascii=False)
+
+async def run_agent_with_filters(agent, **filters) -> str:
+    """فراخوان Agent همراه با فیلترهای ساختاری (neighborhood, max_price, min_sqft, text)"""
+    return await agent.ainvoke(_filters_prompt(**filters))
 
+async def stream_agent_with_filters(agent, **filters) -> AsyncIterator[Tuple[str, Any]]:
+    """
+    همان فراخوان run_agent_with_filters، گام‌به‌گام (AgentExecutor.astream):
+    ("tool", نام ابزار) برای هر فراخوانی ابزار و در پایان ("answer", پاسخ نهایی).
+    توکن‌های خود LLM استریم نمی‌شوند چون گام‌های میانی (انتخاب ابزار) هم از
+    همان LLM می‌آیند.
+    """
+    async for chunk in agent.astream(_filters_prompt(**filters)):
+        for action in chunk.get("actions", []):
+            yield "tool", action.tool
+        if "output" in chunk:
+            yield "answer", chunk["output"]
 
 
 
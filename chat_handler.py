@@ -2,30 +2,30 @@ import os, asyncio
 from typing import List, Dict
 from dotenv import load_dotenv
 
-from config import listings_collection, vector_store
-from search_service import SearchService
-from search_semantic import SemanticSearch
-from models import Model, MODELS
+from container import AppContainer
 
 load_dotenv()
-# MODEL_TYPE = os.getenv("MODEL_TYPE", "gpt-4o")
-
-search_service = SearchService(listings_collection, vector_store, SemanticSearch(vector_store))
-llm_model      = Model(model_type=MODELS)
 
 Message = Dict[str, str]
 
 async def handle_user_message(
+    container: AppContainer,
     user_message: str,
     filters: Dict[str, str],
     conversation_history: List[Message]
 ) -> str:
-    structured = search_service.structured_search(
-        neighborhood = filters.get("neighborhood"),
-        max_price    = float(filters["max_price"]) if filters.get("max_price") else None,
-        min_sqft     = float(filters["min_sqft"])  if filters.get("min_sqft")  else None
+    # بازیابی ساختاری و معنایی به‌صورت هم‌زمان (هر کدام با timeout خودش)
+    # SearchService و مدل از AppContainer مشترک می‌آیند (نه نمونهٔ جداگانهٔ این ماژول)
+    retrieved = await container.search_service.aretrieve(
+        user_message,
+        filters = {
+            "neighborhood": filters.get("neighborhood"),
+            "max_price":    float(filters["max_price"]) if filters.get("max_price") else None,
+            "min_sqft":     float(filters["min_sqft"])  if filters.get("min_sqft")  else None,
+        },
     )
-    semantic = search_service.semantic_search(user_message)
+    structured = retrieved["structured"]
+    semantic   = retrieved["semantic"]
 
     ctx_lines = (
         [f"{d['id']}: {d.get('address','')}"        for d in structured[:5]] +
@@ -39,7 +39,7 @@ async def handle_user_message(
     )
 
     messages = conversation_history + [{"role": "user", "content": prompt}]
-    return await llm_model.generate_response(prompt, conversation_history=messages)
+    return await container.llm_model.generate_response(prompt, conversation_history=messages)
 
 
 
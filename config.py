@@ -1,10 +1,20 @@
 # config.py
-import os, time
+# ────────────────────────────────────────────────────────────────────────────
+# منابع مشترک (Mongo، Pinecone، embeddings) به‌صورت lazy: import این ماژول هیچ
+# کار شبکه‌ای انجام نمی‌دهد و هر منبع با اولین فراخوانی getter خودش ساخته و
+# برای کل پروسه نگه داشته می‌شود. ساخت ایندکس Pinecone و ایندکس‌های Mongo
+# کار admin.py است، نه startup سرور.
+# ────────────────────────────────────────────────────────────────────────────
+import os
+from functools import lru_cache
 from dotenv import load_dotenv
-from pymongo import MongoClient
-from pinecone import Pinecone, ServerlessSpec
+from pymongo import MongoClient, AsyncMongoClient
+from pymongo.collection import Collection
+from pinecone import Pinecone
 from langchain_openai import OpenAIEmbeddings
-from langchain_pinecone import PineconeVectorStore
+
+from embedding_cache import CachedEmbeddings
+from vector_backend  import open_backend
 
 load_dotenv()
 
@@ -17,32 +27,68 @@ OPENAI_API_KEY       = os.getenv("OPENAI_API_KEY")
 PINECONE_API_KEY     = os.getenv("PINECONE_API_KEY")
 PINECONE_ENVIRONMENT = os.getenv("PINECONE_ENVIRONMENT")
 PINECONE_INDEX_NAME  = os.getenv("PINECONE_INDEX_NAME", "listings-index")
+# با داشتن host، ساخت handle ایندکس بدون describe_index (بدون رفت‌وبرگشت) انجام می‌شود
+PINECONE_INDEX_HOST  = os.getenv("PINECONE_INDEX_HOST", "")
 
 
-if not (MONGODB_URI and OPENAI_API_KEY and PINECONE_API_KEY and PINECONE_ENVIRONMENT):
-    raise RuntimeError("⛔️ یکی از متغیرهای ضروری در .env تنظیم نشده است")
+def _require(**values) -> None:
+    missing = [name for name, value in values.items() if not value]
+    if missing:
+        raise RuntimeError(f"⛔️ متغیرهای ضروری در .env تنظیم نشده‌اند: {', '.join(missing)}")
 
 # ── اتصال MongoDB ──────────────────────────────────────
-mongo_client        = MongoClient(MONGODB_URI)
-db                  = mongo_client[MONGO_DB_NAME]
-listings_collection = db["listings"]   # کالکشن اصلی
+# (سازندهٔ MongoClient متصل نمی‌شود؛ اتصال با اولین عملیات برقرار می‌شود)
+@lru_cache(maxsize=None)
+def get_mongo_client() -> MongoClient:
+    _require(MONGODB_URI=MONGODB_URI)
+    return MongoClient(MONGODB_URI)
 
-# ── Pinecone + VectorStore ─────────────────────────────
-pc = Pinecone(api_key=PINECONE_API_KEY, environment=PINECONE_ENVIRONMENT)
-if PINECONE_INDEX_NAME not in [i["name"] for i in pc.list_indexes()]:
-    pc.create_index(
-        name      = PINECONE_INDEX_NAME,
-        dimension = 1536,
-        metric    = "cosine",
-        spec      = ServerlessSpec(cloud="aws", region="us-east-1")
-    )
-    while not pc.describe_index(PINECONE_INDEX_NAME).status["ready"]:
-        time.sleep(1)
-
-index        = pc.Index(PINECONE_INDEX_NAME)
-embeddings   = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
-vector_store = PineconeVectorStore(index=index, embedding=embeddings, text_key="text")
+def get_listings_collection() -> Collection:
+    return get_mongo_client()[MONGO_DB_NAME]["listings"]   # کالکشن اصلی
+
+# کلاینت ناهمگام برای اندپوینت‌های FastAPI (PyMongo async API)
+@lru_cache(maxsize=None)
+def get_async_mongo_client() -> AsyncMongoClient:
+    _require(MONGODB_URI=MONGODB_URI)
+    return AsyncMongoClient(MONGODB_URI)
 
+def get_async_listings_collection():
+    return get_async_mongo_client()[MONGO_DB_NAME]["listings"]
+
+# ── Pinecone + VectorStore ─────────────────────────────
+@lru_cache(maxsize=None)
+def get_pinecone() -> Pinecone:
+    _require(PINECONE_API_KEY=PINECONE_API_KEY)
+    return Pinecone(api_key=PINECONE_API_KEY, environment=PINECONE_ENVIRONMENT)
+
+@lru_cache(maxsize=None)
+def get_index():
+    """handle ایندکس؛ فرض بر این است که ایندکس قبلاً با admin.py ساخته شده است."""
+    return get_pinecone().Index(PINECONE_INDEX_NAME, host=PINECONE_INDEX_HOST)
+
+@lru_cache(maxsize=None)
+def get_embeddings() -> CachedEmbeddings:
+    # embedding پرسش‌ها هم از کش embedding (حافظه/دیسک) می‌خواند
+    _require(OPENAI_API_KEY=OPENAI_API_KEY)
+    openai_embeddings = OpenAIEmbeddings(openai_api_key=OPENAI_API_KEY)
+    return CachedEmbeddings(openai_embeddings, model=openai_embeddings.model)
+
+@lru_cache(maxsize=None)
+def get_vector_backend():
+    """backend جستجوی معنایی بر اساس VECTOR_BACKEND؛ برای «local» به Pinecone وصل نمی‌شود."""
+    return open_backend(get_index, client_factory=get_pinecone)
+
+
+async def close_clients() -> None:
+    """در shutdown اپلیکیشن؛ فقط کلاینت‌هایی که واقعاً ساخته شده‌اند بسته می‌شوند."""
+    if get_async_mongo_client.cache_info().currsize:
+        await get_async_mongo_client().close()
+        get_async_mongo_client.cache_clear()
+    if get_mongo_client.cache_info().currsize:
+        get_mongo_client().close()
+        get_mongo_client.cache_clear()
+    if get_vector_backend.cache_info().currsize:
+        await get_vector_backend().aclose()
 
 
 
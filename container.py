@@ -0,0 +1,191 @@
+# container.py
+# ────────────────────────────────────────────────────────────────────────────
+# AppContainer: تنها مالک منابع مشترک در هر worker —
+#   کلاینت‌های Mongo (sync/async)، backend برداری، ایندکس واژگانی، embeddings، مدل LLM،
+#   کش نتایج، SearchService و Agent.
+# در lifespan اپلیکیشن یک‌بار ساخته و در app.state نگه داشته می‌شود (منابع
+# شبکه‌ای در پس‌زمینه گرم می‌شوند و startup را متوقف نمی‌کنند)؛ آمادگی به
+# تفکیک سطح است (SEARCH ⊂ SEMANTIC ⊂ AGENT): /api/search فقط به Mongo نیاز دارد
+# (Depends(get_container))، چت باز به Agent (require_level(..., AGENT)) و ابزارهای Agent
+# همان SearchService را استفاده می‌کنند. پس تعداد اتصال‌ها و حجم کش‌ها با
+# تعداد worker رشد می‌کند، نه با تعداد ماژول‌ها.
+# ────────────────────────────────────────────────────────────────────────────
+import os, time, asyncio, logging, threading
+from functools import cached_property
+from typing import Dict, Optional, Set
+
+from fastapi import HTTPException, Request
+
+import config
+from search_service  import SearchService
+from search_semantic import SemanticSearch
+from result_cache    import ResultCache
+from embedding_cache import get_embedding_cache
+from lexical_index   import LexicalIndex, get_lexical_index
+from models          import Model, get_model, get_http_client, close_http_client
+from agent_manager   import OpenRouterLangChain, build_agent
+
+logger = logging.getLogger(__name__)
+
+MODEL_TYPE = os.getenv("MODEL_TYPE", "gpt-4o")
+
+
+# سطوح آمادگی؛ هر سطح سطح‌های قبلی را لازم دارد
+SEARCH   = "search"     # Mongo + SearchService ساختاری
+SEMANTIC = "semantic"   # backend برداری + embeddings + ایندکس واژگانی وصل به SearchService
+AGENT    = "agent"      # Agent با ابزارهای جستجو
+LEVELS   = (SEARCH, SEMANTIC, AGENT)
+
+# بعد از شکست ساخت یک سطح، تا این مدت (ثانیه) درخواست‌ها بدون تلاش دوباره 503 می‌گیرند
+RETRY_INTERVAL = float(os.getenv("CONTAINER_RETRY_INTERVAL", "15"))
+
+
+class AppContainer:
+    """
+    منابع شبکه‌ای/دیسکی (backend برداری، ایندکس واژگانی، SearchService، Agent)
+    lazy هستند: start آن‌ها را در پس‌زمینه گرم می‌کند و سرور منتظر نمی‌ماند.
+    هر سطح جدا آماده می‌شود: خطای backend برداری یا Agent جستجوی ساختاری را
+    از کار نمی‌اندازد. سطحی که ساختش شکست خورده حداکثر هر RETRY_INTERVAL
+    یک‌بار (در thread) دوباره امتحان می‌شود، نه در هر درخواست.
+    """
+    def __init__(self, llm_model: Model, result_cache: ResultCache | None = None):
+        self.embedding_cache = get_embedding_cache()
+        self.result_cache    = result_cache or ResultCache()
+        self.llm_model       = llm_model
+        self.llm             = OpenRouterLangChain(model_name=llm_model.model_type)
+        self._lock           = threading.Lock()
+        self._warm_up: Optional[asyncio.Task] = None
+        self._ready: Set[str] = set()
+        self._failed_at: Dict[str, float] = {}
+
+    # ── منابع lazy (فقط از داخل _build، زیر قفل، ساخته می‌شوند) ─────────────
+    @cached_property
+    def listings_collection(self):
+        return config.get_listings_collection()
+
+    @cached_property
+    def async_listings_collection(self):
+        return config.get_async_listings_collection()
+
+    @cached_property
+    def vector_backend(self):
+        """Pinecone (describe_index وقتی PINECONE_INDEX_HOST خالی است) یا ایندکس محلی از دیسک."""
+        return config.get_vector_backend()
+
+    @cached_property
+    def embeddings(self):
+        return config.get_embeddings()
+
+    @cached_property
+    def lexical_index(self) -> LexicalIndex:
+        return get_lexical_index()
+
+    @cached_property
+    def search_service(self) -> SearchService:
+        """فقط با Mongo؛ لایهٔ معنایی در سطح SEMANTIC وصل می‌شود."""
+        return SearchService(
+            self.listings_collection,
+            None,
+            None,
+            self.async_listings_collection,
+            result_cache=self.result_cache,
+        )
+
+    @cached_property
+    def agent(self):
+        return build_agent(self.search_service, self.llm)
+
+    def _build_level(self, level: str) -> None:
+        if level == SEARCH:
+            self.search_service
+        elif level == SEMANTIC:
+            backend = self.vector_backend
+            self.search_service.attach_semantic(
+                backend, SemanticSearch(backend, self.embeddings), self.lexical_index
+            )
+        else:
+            self.agent
+
+    def build(self, level: str = AGENT) -> None:
+        """ساخت منابع تا سطح level (sync؛ در thread اجرا می‌شود). سطوح آماده دوباره ساخته نمی‌شوند."""
+        with self._lock:
+            for lv in LEVELS[: LEVELS.index(level) + 1]:
+                if lv in self._ready:
+                    continue
+                try:
+                    self._build_level(lv)
+                except Exception:
+                    self._failed_at[lv] = time.monotonic()
+                    raise
+                self._ready.add(lv)
+                self._failed_at.pop(lv, None)
+
+    def is_ready(self, level: str = SEARCH) -> bool:
+        return level in self._ready
+
+    def _backing_off(self, level: str) -> bool:
+        """آیا این سطح (یا سطحی که به آن نیاز دارد) به‌تازگی شکست خورده؟"""
+        now = time.monotonic()
+        return any(
+            now - self._failed_at.get(lv, float("-inf")) < RETRY_INTERVAL
+            for lv in LEVELS[: LEVELS.index(level) + 1]
+        )
+
+    async def _warm(self) -> None:
+        try:
+            await asyncio.to_thread(self.build, AGENT)
+        except Exception as e:
+            logger.warning(f"Container warm-up stopped ({sorted(self._ready)} ready); the rest is retried on demand: {e}")
+
+    async def ready(self, level: str = SEARCH) -> None:
+        """
+        منتظر آماده شدن سطح level بدون قفل کردن event-loop. اگر ساخت آن
+        به‌تازگی شکست خورده، بدون تلاش دوباره RuntimeError می‌دهد.
+        """
+        if self.is_ready(level):
+            return
+        if self._warm_up is not None and not self._warm_up.done():
+            await asyncio.shield(self._warm_up)
+            if self.is_ready(level):
+                return
+        if self._backing_off(level):
+            raise RuntimeError(f"{level} resources unavailable; retrying in at most {RETRY_INTERVAL:.0f}s")
+        await asyncio.to_thread(self.build, level)
+
+    @classmethod
+    def from_config(cls) -> "AppContainer":
+        """ساخت از تنظیمات config بدون هیچ کار شبکه‌ای یا دیسکی؛ منابع در build ساخته می‌شوند."""
+        return cls(get_model(MODEL_TYPE))
+
+    @classmethod
+    async def start(cls) -> "AppContainer":
+        get_http_client()   # کلاینت HTTP مشترک LLM روی event-loop فعلی
+        container = cls.from_config()
+        container._warm_up = asyncio.create_task(container._warm())
+        return container
+
+    async def close(self) -> None:
+        if self._warm_up is not None:
+            self._warm_up.cancel()
+        await close_http_client()
+        await config.close_clients()
+
+
+async def require_level(container: AppContainer, level: str) -> None:
+    """آماده کردن سطح level یا HTTPException 503 (برای اندپوینت‌هایی که بسته به مسیر به سطح بالاتر نیاز دارند)."""
+    try:
+        await container.ready(level)
+    except Exception as e:
+        logger.error(f"{level} resources unavailable: {e}")
+        raise HTTPException(status_code=503, detail="سرویس موقتاً در دسترس نیست")
+
+
+async def get_container(request: Request) -> AppContainer:
+    """dependency فست‌ای‌پی‌آی: Depends(get_container)؛ فقط سطح SEARCH (جستجوی ساختاری) لازم است."""
+    container: AppContainer = request.app.state.container
+    try:
+        await container.ready(SEARCH)
+    except Exception as e:
+        logger.error(f"Search resources unavailable: {e}")
+        raise HTTPException(status_code=503, detail="سرویس جستجو موقتاً در دسترس نیست")
+    return container
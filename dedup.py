@@ -0,0 +1,167 @@
+# dedup.py
+# ────────────────────────────────────────────────────────────────────────────
+# تشخیص توضیحات تکراری/تقریباً تکراری قبل از embed (ساختمان یکسان، واحدهای
+# مختلف): برای هر خوشه فقط متن «نماینده» embed می‌شود و بقیهٔ اعضا همان
+# بردار را می‌گیرند (متن نماینده از کش embedding خوانده می‌شود).
+#
+#   • تکرار دقیق : hash متن نرمال‌شده = شناسهٔ خوشه
+#   • تقریباً تکراری : MinHash روی shingle های سه‌کلمه‌ای + LSH (باند/سطر)،
+#     و تأیید نامزدها با شباهت Jaccard تخمینی ≥ DEDUP_THRESHOLD
+#
+# نگاشت آگهی ← خوشه و امضای نماینده‌ها در SQLite (DEDUP_STATE_PATH) ماندگار
+# است تا اجراهای افزایشی (و live_indexer) همان خوشه‌ها را ببینند. خوشه‌ها
+# تغییرناپذیرند: اگر متن آگهی نماینده عوض شود خود آن آگهی دوباره خوشه‌بندی
+# می‌شود و بردار بقیهٔ اعضا تغییری نمی‌کند.
+# ────────────────────────────────────────────────────────────────────────────
+import os, re, zlib, sqlite3, hashlib, logging, threading
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from embedding_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+DEDUP_STATE_PATH = os.getenv("DEDUP_STATE_PATH", "dedup_state.sqlite")
+DEDUP_ENABLED    = os.getenv("INGEST_DEDUP", "1") not in ("0", "false", "no")
+DEDUP_THRESHOLD  = float(os.getenv("DEDUP_THRESHOLD", "0.8"))
+
+# امضای MinHash: NUM_PERM = BANDS × ROWS (آستانهٔ تقریبی LSH ≈ (1/BANDS)^(1/ROWS) ≈ 0.7)
+NUM_PERM  = 128
+BANDS     = 16
+ROWS      = NUM_PERM // BANDS
+SHINGLE   = 3
+
+_PRIME = (1 << 31) - 1
+_rng   = np.random.default_rng(20240601)      # ثابت: امضاها بین اجراها قابل مقایسه‌اند
+_A     = _rng.integers(1, _PRIME, NUM_PERM, dtype=np.uint64)
+_B     = _rng.integers(0, _PRIME, NUM_PERM, dtype=np.uint64)
+_WORDS = re.compile(r"\w+")
+
+
+def text_id(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).casefold().encode("utf-8")).hexdigest()
+
+
+def shingles(text: str) -> set:
+    words = _WORDS.findall(text.casefold())
+    if len(words) <= SHINGLE:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE]) for i in range(len(words) - SHINGLE + 1)}
+
+
+def minhash(text: str) -> np.ndarray:
+    """امضای NUM_PERM تایی (uint32) با hash جهانی (a·x + b) mod p روی crc32 هر shingle."""
+    h = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles(text)), dtype=np.uint64)
+    return ((_A[:, None] * (h[None, :] % _PRIME) + _B[:, None]) % _PRIME).min(axis=1).astype(np.uint32)
+
+
+def similarity(a: np.ndarray, b: np.ndarray) -> float:
+    """Jaccard تخمینی دو امضا."""
+    return float(np.mean(a == b))
+
+
+def band_keys(sig: np.ndarray) -> List[Tuple[int, str]]:
+    return [
+        (band, hashlib.blake2b(sig[band * ROWS:(band + 1) * ROWS].tobytes(), digest_size=8).hexdigest())
+        for band in range(BANDS)
+    ]
+
+
+class Deduper:
+    """دسترسی thread-safe به خوشه‌ها (مثل CheckpointStore در ingest_state.py)."""
+
+    def __init__(self, path: str = DEDUP_STATE_PATH, threshold: float = DEDUP_THRESHOLD):
+        self.threshold = threshold
+        self._lock = threading.Lock()
+        self._db   = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS clusters (
+                id        TEXT PRIMARY KEY,
+                text      TEXT NOT NULL,
+                tokens    INTEGER NOT NULL,
+                signature BLOB NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS buckets (
+                band    INTEGER NOT NULL,
+                key     TEXT NOT NULL,
+                cluster TEXT NOT NULL,
+                PRIMARY KEY (band, key, cluster)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS members (
+                id      TEXT PRIMARY KEY,
+                cluster TEXT NOT NULL
+            );
+        """)
+        self._db.commit()
+
+    def _cluster(self, cid: str) -> Optional[Tuple[str, int, np.ndarray]]:
+        row = self._db.execute("SELECT text, tokens, signature FROM clusters WHERE id = ?", (cid,)).fetchone()
+        if row is None:
+            return None
+        return row[0], row[1], np.frombuffer(row[2], dtype=np.uint32)
+
+    def _nearest(self, sig: np.ndarray, prefer: Optional[str]) -> Optional[str]:
+        """خوشهٔ موجود با شباهت ≥ threshold؛ خوشهٔ قبلی همان آگهی (prefer) در صورت تساوی اولویت دارد."""
+        candidates = {prefer} if prefer else set()
+        for band, key in band_keys(sig):
+            candidates.update(c for (c,) in self._db.execute(
+                "SELECT cluster FROM buckets WHERE band = ? AND key = ?", (band, key)
+            ))
+        best, best_sim = None, self.threshold
+        for cid in candidates:
+            cluster = self._cluster(cid)
+            if cluster is None:
+                continue
+            sim = similarity(sig, cluster[2])
+            if sim > best_sim or (sim >= best_sim and (best is None or cid == prefer)):
+                best, best_sim = cid, sim
+        return best
+
+    def assign(self, records: List[Dict]) -> int:
+        """
+        برای هر رکورد (id, text, tokens) خوشه را پیدا یا ایجاد می‌کند و embed_text /
+        embed_tokens را به متن نمایندهٔ خوشه تنظیم می‌کند. خروجی: تعداد رکوردهایی
+        که بردار نمایندهٔ دیگری را می‌گیرند.
+        """
+        shared = 0
+        with self._lock:
+            for r in records:
+                cid = text_id(r["text"])
+                cluster = self._cluster(cid)
+                if cluster is None:
+                    sig  = minhash(r["text"])
+                    prev = self._db.execute("SELECT cluster FROM members WHERE id = ?", (r["id"],)).fetchone()
+                    near = self._nearest(sig, prev[0] if prev else None)
+                    if near is not None:
+                        cid, cluster = near, self._cluster(near)
+                    else:
+                        self._db.execute(
+                            "INSERT INTO clusters (id, text, tokens, signature) VALUES (?, ?, ?, ?)",
+                            (cid, r["text"], r["tokens"], sig.tobytes()),
+                        )
+                        self._db.executemany(
+                            "INSERT OR IGNORE INTO buckets (band, key, cluster) VALUES (?, ?, ?)",
+                            [(band, key, cid) for band, key in band_keys(sig)],
+                        )
+                        cluster = (r["text"], r["tokens"], sig)
+                self._db.execute("INSERT OR REPLACE INTO members (id, cluster) VALUES (?, ?)", (r["id"], cid))
+                if cluster[0] != r["text"]:
+                    shared += 1
+                r["embed_text"], r["embed_tokens"] = cluster[0], cluster[1]
+            self._db.commit()
+        return shared
+
+    def forget(self, ids: List[str]) -> None:
+        """حذف نگاشت آگهی‌های حذف‌شده (خوشه‌ها باقی می‌مانند تا نگاشت بقیه پایدار بماند)."""
+        with self._lock:
+            self._db.executemany("DELETE FROM members WHERE id = ?", [(i,) for i in ids])
+            self._db.commit()
+
+
+@lru_cache(maxsize=None)
+def get_deduper() -> Optional[Deduper]:
+    """Deduper مشترک پروسه؛ با INGEST_DEDUP=0 غیرفعال (None)."""
+    return Deduper() if DEDUP_ENABLED else None
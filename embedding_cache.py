@@ -0,0 +1,157 @@
+# embedding_cache.py
+# ────────────────────────────────────────────────────────────────────────────
+# کش محتوامحور embedding با کلید (نام مدل، hash متن نرمال‌شده):
+#   • لایهٔ اول: LRU درون‌پروسه
+#   • لایهٔ دوم: SQLite روی دیسک با بردارهای float32
+# هم ingest (embedding_config.get_embeddings) و هم embedding پرسش‌ها
+# (CachedEmbeddings در config.py) از همین کش می‌خوانند.
+# ────────────────────────────────────────────────────────────────────────────
+import os, asyncio, sqlite3, hashlib, threading
+from array import array
+from collections import OrderedDict
+from typing import Optional, Dict, List, Iterable
+
+from langchain_core.embeddings import Embeddings
+
+# مسیر فایل کش؛ رشتهٔ خالی یعنی فقط کش حافظه
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite")
+EMBEDDING_CACHE_LRU  = int(os.getenv("EMBEDDING_CACHE_LRU", "10000"))
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    def __init__(self, path: str = EMBEDDING_CACHE_PATH, max_items: int = EMBEDDING_CACHE_LRU):
+        self.max_items = max_items
+        self._lru: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db: Optional[sqlite3.Connection] = None
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vec BLOB NOT NULL)"
+            )
+            self._db.commit()
+
+    # ── LRU ──────────────────────────────────────────────────────────────
+    def _remember(self, key: str, vec: List[float]) -> None:
+        self._lru[key] = vec
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.max_items:
+            self._lru.popitem(last=False)
+
+    # ── API ──────────────────────────────────────────────────────────────
+    def get_many(self, keys: Iterable[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        missing: List[str] = []
+        with self._lock:
+            for k in keys:
+                if k in self._lru:
+                    self._lru.move_to_end(k)
+                    found[k] = self._lru[k]
+                elif k not in found:
+                    missing.append(k)
+
+            if missing and self._db is not None:
+                for i in range(0, len(missing), 500):
+                    chunk = missing[i:i + 500]
+                    marks = ",".join("?" * len(chunk))
+                    rows  = self._db.execute(
+                        f"SELECT key, vec FROM embeddings WHERE key IN ({marks})", chunk
+                    ).fetchall()
+                    for k, blob in rows:
+                        vec = array("f")
+                        vec.frombytes(blob)
+                        found[k] = vec.tolist()
+                        self._remember(k, found[k])
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]) -> None:
+        with self._lock:
+            for k, vec in items.items():
+                self._remember(k, vec)
+            if self._db is not None and items:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vec) VALUES (?, ?)",
+                    [(k, array("f", vec).tobytes()) for k, vec in items.items()],
+                )
+                self._db.commit()
+
+    def get(self, key: str) -> Optional[List[float]]:
+        return self.get_many([key]).get(key)
+
+    def peek(self, key: str) -> Optional[List[float]]:
+        """فقط لایهٔ حافظه (بدون I/O)؛ برای مسیرهای async قبل از رفتن به دیسک."""
+        with self._lock:
+            return self._lru.get(key)
+
+    def put(self, key: str, vec: List[float]) -> None:
+        self.put_many({key: vec})
+
+
+_default_cache: Optional[EmbeddingCache] = None
+_default_lock = threading.Lock()
+
+def get_embedding_cache() -> EmbeddingCache:
+    """نمونهٔ مشترک کش در هر پروسه (با اولین استفاده ساخته می‌شود)."""
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = EmbeddingCache()
+        return _default_cache
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    wrapper روی هر Embeddings لنگ‌چین (مثلاً OpenAIEmbeddings) که قبل از
+    فراخوانی API کش را می‌خواند و فقط متن‌های جدید را embed می‌کند.
+    """
+    def __init__(self, inner: Embeddings, model: str, cache: Optional[EmbeddingCache] = None):
+        self.inner = inner
+        self.model = model
+        self.cache = cache or get_embedding_cache()
+
+    def _split(self, texts: List[str]):
+        keys  = [cache_key(self.model, t) for t in texts]
+        found = self.cache.get_many(keys)
+        todo  = list({k: t for k, t in zip(keys, texts) if k not in found}.items())
+        return keys, found, todo
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, todo = self._split(texts)
+        if todo:
+            fresh = dict(zip([k for k, _ in todo], self.inner.embed_documents([t for _, t in todo])))
+            self.cache.put_many(fresh)
+            found.update(fresh)
+        return [found[k] for k in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = cache_key(self.model, text)
+        vec = self.cache.get(key)
+        if vec is None:
+            vec = self.inner.embed_query(text)
+            self.cache.put(key, vec)
+        return vec
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys, found, todo = await asyncio.to_thread(self._split, texts)
+        if todo:
+            fresh = dict(zip([k for k, _ in todo], await self.inner.aembed_documents([t for _, t in todo])))
+            await asyncio.to_thread(self.cache.put_many, fresh)
+            found.update(fresh)
+        return [found[k] for k in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = cache_key(self.model, text)
+        vec = self.cache.peek(key) or await asyncio.to_thread(self.cache.get, key)
+        if vec is None:
+            vec = await self.inner.aembed_query(text)
+            await asyncio.to_thread(self.cache.put, key, vec)
+        return vec
@@ -2,37 +2,116 @@
 
 # فایل: embedding_config.py
 
-import os
+import os, logging
+from functools import lru_cache
+from typing import Iterator, Optional
 from dotenv import load_dotenv
 from openai import OpenAI as OpenAIClient # تغییر نام برای جلوگیری از تداخل با Langchain OpenAI
 import tiktoken
 
+from embedding_cache import get_embedding_cache, cache_key
+
+logger = logging.getLogger(__name__)
+
 load_dotenv()
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 EMBEDDING_MODEL_NAME = os.getenv("EMBEDDING_MODEL_NAME", "text-embedding-ada-002") # [cite: 37]
 
-if not OPENAI_API_KEY:
-    raise ValueError("OPENAI_API_KEY environment variable not set for embeddings.")
-
-# کلاینت OpenAI برای embeddings
-openai_client_for_embeddings = OpenAIClient(api_key=OPENAI_API_KEY)
+# کلاینت OpenAI برای embeddings (با اولین استفاده ساخته می‌شود)
+@lru_cache(maxsize=None)
+def get_openai_client() -> OpenAIClient:
+    if not OPENAI_API_KEY:
+        raise ValueError("OPENAI_API_KEY environment variable not set for embeddings.")
+    return OpenAIClient(api_key=OPENAI_API_KEY)
 
 # اطلاعات مدل embedding
 EMBEDDING_CTX_LENGTH = 8191 # حداکثر توکن برای text-embedding-ada-002
 EMBEDDING_ENCODING = 'cl100k_base' # انکودینگ برای text-embedding-ada-002
 
+# محدودیت‌های هر درخواست embeddings (چند ورودی در یک درخواست)
+EMBEDDING_MAX_INPUTS       = int(os.getenv("EMBEDDING_MAX_INPUTS", "2048"))
+EMBEDDING_MAX_BATCH_TOKENS = int(os.getenv("EMBEDDING_MAX_BATCH_TOKENS", "300000"))
+
 def get_embedding(text: str, model: str = EMBEDDING_MODEL_NAME) -> list[float]:
     """
     تولید embedding برای متن داده شده با استفاده از مدل مشخص شده OpenAI.
+    ابتدا از کش embedding (حافظه/دیسک) خوانده می‌شود.
     """
-    text = text.replace("\n", " ")
+    text  = text.replace("\n", " ")
+    cache = get_embedding_cache()
+    key   = cache_key(model, text)
+    vec   = cache.get(key)
+    if vec is not None:
+        return vec
     try:
-        response = openai_client_for_embeddings.embeddings.create(input=[text], model=model)
-        return response.data[0].embedding
+        response = get_openai_client().embeddings.create(input=[text], model=model)
+        vec = response.data[0].embedding
     except Exception as e:
-        print(f"Error getting embedding for text: '{text[:100]}...'. Error: {e}")
+        # خطا دوباره raise می‌شود و traceback را فراخوان ثبت می‌کند
+        logger.warning(f"Error getting embedding for text: '{text[:100]}...'. Error: {e}")
         raise
+    cache.put(key, vec)
+    return vec
+
+def iter_batches(
+    token_counts: list[int],
+    max_inputs: int = EMBEDDING_MAX_INPUTS,
+    max_tokens: int = EMBEDDING_MAX_BATCH_TOKENS,
+) -> Iterator[range]:
+    """
+    تقسیم ورودی‌ها به بازه‌های پیوسته‌ای که هم سقف تعداد ورودی و هم سقف
+    مجموع توکن هر درخواست را رعایت کنند.
+    """
+    start, tokens = 0, 0
+    for i, n in enumerate(token_counts):
+        if i > start and (i - start >= max_inputs or tokens + n > max_tokens):
+            yield range(start, i)
+            start, tokens = i, 0
+        tokens += n
+    if start < len(token_counts):
+        yield range(start, len(token_counts))
+
+def get_embeddings(
+    texts: list[str],
+    model: str = EMBEDDING_MODEL_NAME,
+    token_counts: Optional[list[int]] = None,
+) -> list[list[float]]:
+    """
+    نسخهٔ دسته‌ای get_embedding: چندین متن در هر درخواست embeddings.
+    خروجی هم‌ترتیب با texts است. هر متن باید از قبل به EMBEDDING_CTX_LENGTH بریده شده باشد.
+    متن‌هایی که در کش هستند (یا در همین دسته تکرار شده‌اند) فقط یک‌بار/اصلاً embed نمی‌شوند.
+    """
+    texts = [t.replace("\n", " ") for t in texts]
+    cache = get_embedding_cache()
+    keys  = [cache_key(model, t) for t in texts]
+    found = cache.get_many(keys)
+
+    # متن‌های یکتای غیرکش‌شده (به همراه تعداد توکن)
+    todo: dict[str, int] = {}
+    for i, k in enumerate(keys):
+        if k not in found and k not in todo:
+            todo[k] = i
+    idx = list(todo.values())
+    if token_counts is None:
+        counts = [num_tokens_from_string(texts[i]) for i in idx]
+    else:
+        counts = [token_counts[i] for i in idx]
+
+    for batch in iter_batches(counts):
+        chunk = [texts[idx[j]] for j in batch]
+        try:
+            response = get_openai_client().embeddings.create(input=chunk, model=model)
+        except Exception as e:
+            logger.warning(f"Error getting embeddings for batch of {len(chunk)} texts. Error: {e}")
+            raise
+        fresh = {
+            keys[idx[batch.start + d.index]]: d.embedding
+            for d in response.data
+        }
+        cache.put_many(fresh)
+        found.update(fresh)
+    return [found[k] for k in keys]
 
 def num_tokens_from_string(string: str, encoding_name: str = EMBEDDING_ENCODING) -> int:
     """
@@ -0,0 +1,77 @@
+# hydration.py
+# ────────────────────────────────────────────────────────────────────────────
+# کامل کردن نتایج جستجوی برداری/واژگانی با فیلدهای نمایشی آگهی از Mongo.
+# ایندکس برداری فقط شناسه و فیلدهای قابل فیلتر را نگه می‌دارد (بدون متن و
+# snippet)؛ این لایه برای top-k شناسه‌ها:
+#   • آگهی‌های داغ را از یک LRU (با TTL و برچسب نسخهٔ ایندکس، مثل result_cache)
+#     برمی‌گرداند
+#   • بقیه را با یک کوئری $in و projection محدود (StructuredSearch.find_by_ids)
+#     می‌خواند؛ snippet از description همان سند ساخته می‌شود.
+# ────────────────────────────────────────────────────────────────────────────
+import os, asyncio
+from typing import Any, Dict, List, Optional, Tuple
+
+from result_cache      import ResultCache
+from search_structured import StructuredSearch, AsyncStructuredSearch
+
+HYDRATION_CACHE_SIZE = int(os.getenv("HYDRATION_CACHE_SIZE", "5000"))
+HYDRATION_CACHE_TTL  = float(os.getenv("HYDRATION_CACHE_TTL", "600"))
+
+# (id آگهی، _id مونگو)
+Ref = Tuple[str, Any]
+
+
+class Hydrator:
+    def __init__(
+        self,
+        structured:  StructuredSearch,
+        astructured: Optional[AsyncStructuredSearch] = None,
+        cache:       Optional[ResultCache] = None,
+    ):
+        self.structured  = structured
+        self.astructured = astructured
+        self.cache       = cache or ResultCache(ttl=HYDRATION_CACHE_TTL, max_items=HYDRATION_CACHE_SIZE)
+
+    def _split(self, refs: List[Ref], version: int) -> Tuple[Dict[str, Dict], List[Any]]:
+        found, missing = {}, []
+        for i, mongo_id in dict(refs).items():
+            hit = self.cache.get(i, version)
+            if hit is not None:
+                found[i] = hit
+            else:
+                missing.append(mongo_id)
+        return found, missing
+
+    def remember(self, rows: Dict[str, Dict], version: int) -> None:
+        for i, row in rows.items():
+            self.cache.put(i, version, row)
+
+    def get(self, refs: List[Ref], version: int) -> Dict[str, Dict]:
+        """id ← ردیف نمایشی؛ آگهی‌هایی که در Mongo نیستند در خروجی نمی‌آیند."""
+        found, missing = self._split(refs, version)
+        if missing:
+            rows = self.structured.find_by_ids(missing)
+            self.remember(rows, version)
+            found.update(rows)
+        return found
+
+    async def aget(self, refs: List[Ref], version: int) -> Dict[str, Dict]:
+        found, missing = self._split(refs, version)
+        if missing:
+            if self.astructured is None:
+                rows = await asyncio.to_thread(self.structured.find_by_ids, missing)
+            else:
+                rows = await self.astructured.find_by_ids(missing)
+            self.remember(rows, version)
+            found.update(rows)
+        return found
+
+
+def hydrate(results: List[Dict], rows: Dict[str, Dict]) -> List[Dict]:
+    """ادغام نتایج (id, mongo_id, score) با ردیف‌های نمایشی به همان ترتیب؛ id بدون ردیف حذف می‌شود."""
+    out = []
+    for r in results:
+        row = rows.get(r["id"])
+        if row is not None:
+            out.append({**row, "score": r["score"]})
+    return out
@@ -1,10 +1,18 @@
 # ingest.py
-import os, logging, tiktoken
+import os, logging, argparse, tiktoken
 from dotenv import load_dotenv
 from pymongo import MongoClient
-from pinecone import Pinecone, ServerlessSpec
+from ingest_pipeline import Pipeline
+from ingest_state    import CheckpointStore, RangeProgress, content_hash
+from result_cache    import bump_index_version
+from vector_backend  import open_backend, VECTOR_BACKEND
+from lexical_index   import get_lexical_index, lexical_text, LEXICAL_FIELDS
+from listing_schema  import parse_listing, filterable_metadata, vector_ref, RAW_FIELDS
+from dedup           import get_deduper
+from normalize       import refresh_norm, NORM
+from config          import get_pinecone, PINECONE_INDEX_NAME
 from embedding_config import (
-    get_embedding, num_tokens_from_string,
+    get_embeddings, num_tokens_from_string,
     EMBEDDING_CTX_LENGTH, EMBEDDING_ENCODING
 )
 
@@ -13,9 +21,24 @@ load_dotenv()
 MONGODB_URI   = os.getenv("MONGODB_URI")
 MONGO_DB_NAME = os.getenv("MONGO_DB_NAME", "manhatan")
 
-PINECONE_API_KEY   = os.getenv("PINECONE_API_KEY")
-PINECONE_ENVIRONMENT = os.getenv("PINECONE_ENVIRONMENT")
-PINECONE_INDEX_NAME  = os.getenv("PINECONE_INDEX_NAME")
+# تعداد آگهی‌هایی که با هم به embeddings فرستاده می‌شوند
+EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH", "500"))
+UPSERT_BATCH_SIZE = 100
+
+# تعداد worker هر مرحلهٔ pipeline و ظرفیت صف بین مراحل
+PREPARE_WORKERS = int(os.getenv("INGEST_PREPARE_WORKERS", "2"))
+EMBED_WORKERS   = int(os.getenv("INGEST_EMBED_WORKERS",   "4"))
+UPSERT_WORKERS  = int(os.getenv("INGEST_UPSERT_WORKERS",  "2"))
+QUEUE_SIZE      = int(os.getenv("INGEST_QUEUE_SIZE",      "8"))
+# تعداد reader هم‌زمان (هر کدام یک بازهٔ _id)
+READERS         = int(os.getenv("INGEST_READERS",         "1"))
+
+# فقط فیلدهایی که embed، در متادیتا ذخیره یا در ایندکس واژگانی می‌آیند از Mongo خوانده می‌شوند
+INGEST_PROJECTION = {
+    "id": 1, "description": 1, NORM: 1,
+    **{f: 1 for f in RAW_FIELDS},
+    **{f: 1 for f in LEXICAL_FIELDS},
+}
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
@@ -25,69 +48,279 @@ mongo = MongoClient(MONGODB_URI)
 col   = mongo[MONGO_DB_NAME]["listings"]
 
 # ── Pinecone ───────────────────────────────────────────
-pc = Pinecone(api_key=PINECONE_API_KEY, environment=PINECONE_ENVIRONMENT)
-
-def ingest_data():
-    if PINECONE_INDEX_NAME not in pc.list_indexes().names:
-        logger.info("Creating Pinecone index …")
-        pc.create_index(
-            name      = PINECONE_INDEX_NAME,
-            dimension = 1536,
-            metric    = "cosine",
-            spec      = ServerlessSpec(cloud="aws", region="us-east-1")
+# کلاینت فقط وقتی ساخته می‌شود که open_backend واقعاً Pinecone را انتخاب کند
+# (با VECTOR_BACKEND=local، ingest بدون PINECONE_API_KEY هم اجرا می‌شود)
+def _pinecone_index():
+    """ایندکس باید از قبل با admin.py ساخته شده باشد؛ ingest خودش ایندکس نمی‌سازد."""
+    pc = get_pinecone()
+    if PINECONE_INDEX_NAME not in [i["name"] for i in pc.list_indexes()]:
+        raise RuntimeError(
+            f"⛔️ Pinecone index '{PINECONE_INDEX_NAME}' not found; "
+            "create it first with: python admin.py provision"
         )
-    index = pc.Index(PINECONE_INDEX_NAME)
-
-    listings = list(col.find({}))
-    logger.info(f"Fetched {len(listings)} docs from MongoDB")
-
-    batch, B = [], 100
-    for doc in listings:
-        desc = (doc.get("description") or "").replace("\n", " ")
-        if not desc:
-            logger.warning(f"Skip {doc.get('_id')} (no description)")
-            continue
-
-        # برش متن در صورت طولانی بودن
-        tok = num_tokens_from_string(desc, EMBEDDING_ENCODING)
-        if tok > EMBEDDING_CTX_LENGTH:
-            enc  = tiktoken.get_encoding(EMBEDDING_ENCODING)
-            desc = enc.decode(enc.encode(desc)[:EMBEDDING_CTX_LENGTH - 1])
-
-        try:
-            vec = get_embedding(desc)
-        except Exception as e:
-            logger.error(f"Embedding failed for {doc.get('_id')}: {e}")
-            continue
-
-        meta = {
-            "id":        str(doc.get("_id") or doc.get("id")),
-            "text":      desc,
-            "neighborhood": doc.get("neighborhood", ""),
-            "borough":      doc.get("borough", ""),
-            "address":      doc.get("address", ""),
-            "sale_price":   float(doc.get("sale_price") or 0),
-            "gross_square_feet": float(doc.get("gross_square_feet") or 0),
-            "year_built":  doc.get("year_built"),
-            "original_description_snippet": desc[:200] + "…"
-        }
-        meta = {k: v for k, v in meta.items() if v not in ("", None)}
-
-        batch.append({"id": meta["id"], "values": vec, "metadata": meta})
-
-        if len(batch) >= B:
-            index.upsert(vectors=batch)
-            logger.info(f"Upserted {len(batch)} vectors")
-            batch = []
-
-    if batch:
-        index.upsert(vectors=batch)
-        logger.info(f"Upserted remaining {len(batch)} vectors")
-
+    return pc.Index(PINECONE_INDEX_NAME)
+
+def open_index():
+    """ایندکس مقصد بر اساس VECTOR_BACKEND (Pinecone یا ایندکس محلی روی دیسک)."""
+    return open_backend(_pinecone_index)
+
+def prepare_record(doc) -> dict | None:
+    """متن قابل embed (بریده‌شده به سقف توکن) و متادیتای یک آگهی؛ بدون توضیحات None."""
+    desc = (doc.get("description") or "").replace("\n", " ")
+    if not desc:
+        logger.warning(f"Skip {doc.get('_id')} (no description)")
+        return None
+
+    # برش متن در صورت طولانی بودن
+    tok = num_tokens_from_string(desc, EMBEDDING_ENCODING)
+    if tok > EMBEDDING_CTX_LENGTH:
+        enc  = tiktoken.get_encoding(EMBEDDING_ENCODING)
+        desc = enc.decode(enc.encode(desc)[:EMBEDDING_CTX_LENGTH - 1])
+        tok  = EMBEDDING_CTX_LENGTH - 1
+
+    # متادیتا فقط شناسه و فیلدهای قابل فیلتر (همان نام و نوع norm در listing_schema)
+    # است؛ متن و فیلدهای نمایشی هنگام جستجو از Mongo خوانده می‌شوند (hydration.py)
+    meta = {
+        **vector_ref(doc.get("_id") or doc.get("id")),
+        **filterable_metadata(parse_listing(doc)),
+    }
+    lexical = lexical_text(doc)
+    return {
+        "id":       meta["id"],
+        "mongo_id": doc.get("_id"),
+        "text":     desc,
+        "tokens":   tok,
+        "metadata": meta,
+        "lexical":  lexical,
+        "hash":     content_hash(desc, {**meta, "lexical": lexical}),
+    }
+
+def dedup_records(records: list[dict]) -> int:
+    """
+    نگاشت هر رکورد به خوشهٔ تکراری/تقریباً تکراری (dedup.py)؛ embed_text رکورد
+    متن نمایندهٔ خوشه می‌شود و get_embeddings آن را یک‌بار (یا از کش) embed می‌کند.
+    """
+    deduper = get_deduper()
+    if deduper is None or not records:
+        return 0
+    shared = deduper.assign(records)
+    if shared:
+        logger.info(f"Dedup: {shared}/{len(records)} records reuse a representative's vector")
+    return shared
+
+def embed_records(records: list[dict]) -> list[dict]:
+    """embed دسته‌ای؛ خروجی بردارهای آمادهٔ upsert در ایندکس برداری."""
+    vecs = get_embeddings(
+        [r.get("embed_text", r["text"]) for r in records],
+        token_counts=[r.get("embed_tokens", r["tokens"]) for r in records],
+    )
+    return [
+        {"id": r["id"], "values": v, "metadata": r["metadata"]}
+        for r, v in zip(records, vecs)
+    ]
+
+def upsert_vectors(index, vectors: list[dict]) -> int:
+    for i in range(0, len(vectors), UPSERT_BATCH_SIZE):
+        index.upsert(vectors=vectors[i:i + UPSERT_BATCH_SIZE])
+    logger.info(f"Upserted {len(vectors)} vectors")
+    return len(vectors)
+
+def index_lexical(records: list[dict]) -> int:
+    """به‌روزرسانی ایندکس واژگانی (BM25) هم‌زمان با upsert بردارها."""
+    return get_lexical_index().add((r["id"], r["mongo_id"], r["lexical"]) for r in records)
+
+# ── مراحل pipeline ─────────────────────────────────────
+# هر آیتم صف یک دسته است: {"progress", "seq", "docs" → "records" → "vectors"}
+# (مرحلهٔ dedup با یک worker اجرا می‌شود تا خوشه‌بندی ترتیبی و قطعی باشد)
+
+def _complete(batch: dict) -> None:
+    if batch.get("progress") is not None:
+        batch["progress"].complete(batch["seq"])
+
+def prepare_batch(store: CheckpointStore, batch: dict) -> dict | None:
+    """
+    تازه کردن norm اسنادی که فیلدهای خامشان عوض شده (فیلترهای ساختاری روی
+    norm هستند)، آماده‌سازی و حذف آگهی‌هایی که hash آن‌ها با checkpoint یکی است.
+    """
+    docs = batch.pop("docs")
+    refresh_norm(col, docs)
+    records = [r for r in map(prepare_record, docs) if r is not None]
+    stored  = store.hashes([r["id"] for r in records])
+    changed = [r for r in records if stored.get(r["id"]) != r["hash"]]
+    if not changed:
+        _complete(batch)
+        return None
+    batch["records"] = changed
+    return batch
+
+def dedup_batch(batch: dict) -> dict:
+    dedup_records(batch["records"])
+    return batch
+
+def embed_batch(batch: dict) -> dict:
+    batch["vectors"] = embed_records(batch["records"])
+    return batch
+
+def upsert_batch(index, store: CheckpointStore, batch: dict) -> int:
+    n = upsert_vectors(index, batch["vectors"])
+    index_lexical(batch["records"])
+    store.commit((r["id"], r["mongo_id"], r["hash"]) for r in batch["records"])
+    _complete(batch)
+    return n
+
+def sweep_deleted(index, store: CheckpointStore) -> int:
+    """حذف بردار آگهی‌هایی که در checkpoint هستند ولی دیگر در Mongo وجود ندارند."""
+    removed = 0
+    for chunk in store.iter_ids():
+        existing = {d["_id"] for d in col.find({"_id": {"$in": [mid for _, mid in chunk]}}, {"_id": 1})}
+        missing  = [vid for vid, mid in chunk if mid not in existing]
+        if missing:
+            index.delete(ids=missing)
+            get_lexical_index().delete(missing)
+            if get_deduper() is not None:
+                get_deduper().forget(missing)
+            store.delete(missing)
+            removed += len(missing)
+    if removed:
+        logger.info(f"Removed {removed} vectors of deleted listings")
+    return removed
+
+def id_ranges(n: int) -> list[tuple]:
+    """
+    تقسیم کالکشن به n بازهٔ تقریباً هم‌اندازه روی _id با $bucketAuto.
+    هر بازه (lo, hi) است با lo شامل و hi غیرشامل؛ None یعنی بی‌کران.
+    """
+    buckets = list(col.aggregate([
+        {"$project": {"_id": 1}},
+        {"$bucketAuto": {"groupBy": "$_id", "buckets": n}},
+    ], allowDiskUse=True))
+    mins = [b["_id"]["min"] for b in buckets]
+    return [(None if i == 0 else lo, mins[i + 1] if i + 1 < len(mins) else None)
+            for i, lo in enumerate(mins)]
+
+def plan_ranges(store: CheckpointStore, shard: tuple[int, int] | None, readers: int) -> tuple[str, list[tuple]]:
+    """
+    بازه‌های _id این اجرا و کلید ذخیرهٔ آن‌ها. مرزهای $bucketAuto بین اجراها
+    جابه‌جا می‌شوند؛ پس طرح بازه‌ها همراه اجرا ذخیره و تا پایان کامل آن (که
+    ingest_data پاکش می‌کند) دوباره استفاده می‌شود تا کلید watermark هر
+    RangeProgress بعد از crash همان بماند.
+    """
+    key = f"range_plan:{shard[0]}/{shard[1]}:{readers}" if shard else f"range_plan:{readers}"
+    plan = store.get(key)
+    if plan is not None:
+        logger.info("Resuming the _id ranges of the previous unfinished run")
+        return key, [tuple(r) for r in plan]
+    if shard:
+        i, n   = shard
+        ranges = id_ranges(n * readers)[i * readers:(i + 1) * readers]
+    else:
+        ranges = id_ranges(readers) if readers > 1 else [(None, None)]
+    if ranges:
+        store.set(key, [list(r) for r in ranges])
+    return key, ranges
+
+def read_range(lo=None, hi=None, progress: RangeProgress | None = None):
+    """
+    خواندن استریمی یک بازهٔ _id با cursor دسته‌ای و projection؛
+    مصرف حافظه به اندازهٔ کالکشن بستگی ندارد. اگر progress watermark داشته
+    باشد (اجرای قبلی نیمه‌کاره مانده) خواندن از بعد از آن ادامه پیدا می‌کند.
+    """
+    query = {}
+    resume = progress.resume_after() if progress else None
+    if resume is not None:
+        logger.info(f"Resuming range after _id={resume}")
+        query.setdefault("_id", {})["$gt"] = resume
+    elif lo is not None:
+        query.setdefault("_id", {})["$gte"] = lo
+    if hi is not None:
+        query.setdefault("_id", {})["$lt"] = hi
+
+    cursor = col.find(query, projection=INGEST_PROJECTION, batch_size=EMBED_BATCH_SIZE).sort("_id", 1)
+    docs = []
+
+    def make_batch():
+        seq = progress.issue(docs[-1]["_id"]) if progress else None
+        return {"progress": progress, "seq": seq, "docs": docs}
+
+    for doc in cursor:
+        docs.append(doc)
+        if len(docs) >= EMBED_BATCH_SIZE:
+            yield make_batch()
+            docs = []
+    if docs:
+        yield make_batch()
+
+def ingest_data(
+    shard:   tuple[int, int] | None = None,
+    readers: int  = READERS,
+    full:    bool = False,
+    sweep:   bool = True,
+):
+    """
+    pipeline پنج‌مرحله‌ای:
+      خواندن استریمی Mongo (readers بازهٔ _id هم‌زمان) → آماده‌سازی/برش توکن و
+      حذف آگهی‌های بدون تغییر → خوشه‌بندی توضیحات تکراری (dedup) → embed هم‌زمان (EMBED_WORKERS) → upsert هم‌زمان
+      در ایندکس برداری (UPSERT_WORKERS) و ثبت hash در checkpoint.
+    shard=(i, n): فقط بازهٔ i از n بازه پردازش می‌شود (برای اجرای موازی روی چند pod).
+    full=True   : checkpoint نادیده گرفته و همه دوباره embed می‌شوند.
+    sweep=True  : بعد از اجرای کامل (بدون shard) بردار آگهی‌های حذف‌شده پاک می‌شود.
+    """
+    index = open_index()
+
+    store = CheckpointStore()
+    if full:
+        store.clear()
+        get_lexical_index().clear()
+    elif store.get("vector_backend") not in (None, VECTOR_BACKEND):
+        # checkpoint ها مال backend دیگری است؛ ایندکس جدید باید کامل پر شود
+        logger.info(f"Vector backend changed to '{VECTOR_BACKEND}'; ignoring old checkpoints")
+        store.clear()
+    store.set("vector_backend", VECTOR_BACKEND)
+
+    plan_key, ranges = plan_ranges(store, shard, max(1, readers))
+    if not ranges:
+        logger.info("Nothing to ingest.")
+        return
+    logger.info(f"Reading {len(ranges)} _id range(s) from MongoDB")
+
+    progress = [RangeProgress(store, lo, hi) for lo, hi in ranges]
+    sources  = [lambda lo=lo, hi=hi, p=p: read_range(lo, hi, p) for (lo, hi), p in zip(ranges, progress)]
+    stats = (
+        Pipeline(*sources, queue_size=QUEUE_SIZE)
+            .stage("prepare", lambda b: prepare_batch(store, b),       workers=PREPARE_WORKERS)
+            .stage("dedup",   dedup_batch,                             workers=1)
+            .stage("embed",   embed_batch,                             workers=EMBED_WORKERS)
+            .stage("upsert",  lambda b: upsert_batch(index, store, b), workers=UPSERT_WORKERS)
+            .run()
+    )
+    logger.info(f"Pipeline stats: {stats}")
+
+    incomplete = [p.key for p in progress if not p.finish()]
+    if incomplete:
+        logger.warning(f"{len(incomplete)} range(s) had failed batches; the next run resumes them")
+    else:
+        store.delete_key(plan_key)
+        if sweep and not shard:
+            sweep_deleted(index, store)
+    index.save()
+    # کش نتایج جستجو (result_cache) با نسخهٔ جدید ایندکس باطل می‌شود
+    bump_index_version(col.database)
     logger.info("✅ Ingestion finished.")
 
+def _parse_shard(value: str) -> tuple[int, int]:
+    i, n = (int(x) for x in value.split("/"))
+    if not 0 <= i < n:
+        raise argparse.ArgumentTypeError("shard must be i/n with 0 <= i < n")
+    return i, n
+
 if __name__ == "__main__":
-    ingest_data()
+    parser = argparse.ArgumentParser(description="Embed listings from MongoDB into the vector index")
+    parser.add_argument("--shard",   type=_parse_shard, help="process only _id range i of n, e.g. 0/4")
+    parser.add_argument("--readers", type=int, default=READERS, help="concurrent Mongo readers")
+    parser.add_argument("--full",     action="store_true", help="ignore checkpoints and re-embed everything")
+    parser.add_argument("--no-sweep", action="store_true", help="do not remove vectors of deleted listings")
+    args = parser.parse_args()
+    ingest_data(shard=args.shard, readers=args.readers, full=args.full, sweep=not args.no_sweep)
 
 
 
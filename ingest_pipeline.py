@@ -0,0 +1,111 @@
+# ingest_pipeline.py
+# ────────────────────────────────────────────────────────────────────────────
+# اجرای مرحله‌ای (staged) برای ingest:
+#   source → stage1 → stage2 → …
+# هر مرحله چند worker (thread) دارد و مراحل با صف‌های محدود (bounded) به هم
+# وصل‌اند؛ پس انتظار شبکه‌ای OpenAI و Pinecone روی هم می‌افتد و فشار برگشتی
+# (back-pressure) مانع پر شدن حافظه می‌شود.
+# ────────────────────────────────────────────────────────────────────────────
+import queue, logging, threading
+from typing import Callable, Iterable, Any, List, Dict
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()   # نشانهٔ پایان صف
+
+
+class Stage:
+    def __init__(self, name: str, fn: Callable[[Any], Any], workers: int = 1):
+        self.name    = name
+        self.fn      = fn
+        self.workers = max(1, workers)
+        self.done    = 0        # تعداد آیتم‌های پردازش‌شده
+        self.failed  = 0
+        self._finished_workers = 0
+        self._lock   = threading.Lock()
+
+
+class Pipeline:
+    """
+    sources: یک یا چند تابع که iterable آیتم‌ها (معمولاً دسته‌ها) را تولید می‌کنند؛
+             هر source در thread خودش اجرا می‌شود (مثلاً یک reader برای هر بازهٔ _id).
+    هر stage روی یک آیتم اجرا می‌شود؛ خروجی None یعنی «به مرحلهٔ بعد نرود».
+    خطای یک آیتم لاگ و آیتم رها می‌شود؛ بقیهٔ pipeline ادامه می‌دهد.
+    """
+    def __init__(self, *sources: Callable[[], Iterable[Any]], queue_size: int = 8):
+        self.sources    = sources
+        self.queue_size = queue_size
+        self.stages: List[Stage] = []
+        self._finished_sources = 0
+        self._lock = threading.Lock()
+
+    def stage(self, name: str, fn: Callable[[Any], Any], workers: int = 1) -> "Pipeline":
+        self.stages.append(Stage(name, fn, workers))
+        return self
+
+    # ------------------------------------------------------------------ #
+    def _produce(self, source: Callable[[], Iterable[Any]], out_q: queue.Queue, consumers: int) -> None:
+        try:
+            for item in source():
+                out_q.put(item)
+        except Exception as e:
+            logger.error(f"[source] failed: {e}", exc_info=True)
+        finally:
+            with self._lock:
+                self._finished_sources += 1
+                last = self._finished_sources == len(self.sources)
+            if last:
+                for _ in range(consumers):
+                    out_q.put(_DONE)
+
+    def _work(self, stage: Stage, in_q: queue.Queue, out_q: queue.Queue | None, consumers: int) -> None:
+        while True:
+            item = in_q.get()
+            if item is _DONE:
+                break
+            try:
+                result = stage.fn(item)
+                with stage._lock:
+                    stage.done += 1
+                if result is not None and out_q is not None:
+                    out_q.put(result)
+            except Exception as e:
+                with stage._lock:
+                    stage.failed += 1
+                logger.error(f"[{stage.name}] failed: {e}", exc_info=True)
+
+        # آخرین worker این مرحله پایان را به مرحلهٔ بعد اعلام می‌کند
+        with stage._lock:
+            stage._finished_workers += 1
+            last = stage._finished_workers == stage.workers
+        if last and out_q is not None:
+            for _ in range(consumers):
+                out_q.put(_DONE)
+
+    def run(self) -> Dict[str, Dict[str, int]]:
+        if not self.stages:
+            raise ValueError("Pipeline has no stages")
+        if not self.sources:
+            raise ValueError("Pipeline has no sources")
+
+        queues  = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        threads = [threading.Thread(
+            target=self._produce, args=(src, queues[0], self.stages[0].workers),
+            name=f"ingest-source-{i}", daemon=True,
+        ) for i, src in enumerate(self.sources)]
+        for i, stage in enumerate(self.stages):
+            nxt       = self.stages[i + 1] if i + 1 < len(self.stages) else None
+            out_q     = queues[i + 1] if nxt else None
+            consumers = nxt.workers if nxt else 0
+            for w in range(stage.workers):
+                threads.append(threading.Thread(
+                    target=self._work, args=(stage, queues[i], out_q, consumers),
+                    name=f"ingest-{stage.name}-{w}", daemon=True,
+                ))
+
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        return {s.name: {"done": s.done, "failed": s.failed} for s in self.stages}
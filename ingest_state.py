@@ -0,0 +1,154 @@
+# ingest_state.py
+# ────────────────────────────────────────────────────────────────────────────
+# وضعیت ماندگار ingest (SQLite):
+#   • listings : شناسهٔ آگهی ← hash محتوای embed‌شده + متادیتا
+#                (آگهی بدون تغییر دوباره embed/upsert نمی‌شود)
+#   • kv       : مقادیر کلیدی مثل watermark پیشرفت هر بازهٔ _id و طرح بازه‌های
+#                اجرای نیمه‌کاره (ingest.plan_ranges)
+# ────────────────────────────────────────────────────────────────────────────
+import os, json, time, sqlite3, hashlib, threading
+from typing import Optional, Any, Dict, Iterable, Iterator, List, Tuple
+
+from bson import json_util
+
+INGEST_STATE_PATH = os.getenv("INGEST_STATE_PATH", "ingest_state.sqlite")
+
+
+def content_hash(text: str, metadata: Dict) -> str:
+    payload = json.dumps({"text": text, "metadata": metadata}, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class CheckpointStore:
+    """دسترسی thread-safe به فایل SQLite وضعیت ingest."""
+
+    def __init__(self, path: str = INGEST_STATE_PATH):
+        self.path  = path
+        self._lock = threading.Lock()
+        self._db   = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS listings (
+                id         TEXT PRIMARY KEY,
+                mongo_id   TEXT NOT NULL,
+                hash       TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS kv (
+                key   TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+        """)
+        self._db.commit()
+
+    # ── hash آگهی‌ها ──────────────────────────────────────────────────────
+    def hashes(self, ids: List[str]) -> Dict[str, str]:
+        if not ids:
+            return {}
+        marks = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._db.execute(f"SELECT id, hash FROM listings WHERE id IN ({marks})", ids).fetchall()
+        return dict(rows)
+
+    def commit(self, items: Iterable[Tuple[str, Any, str]]) -> None:
+        """items: (id, _id مونگو, hash) برای رکوردهایی که upsert آن‌ها موفق بوده."""
+        now = time.time()
+        rows = [(i, json_util.dumps(mid), h, now) for i, mid, h in items]
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO listings (id, mongo_id, hash, updated_at) VALUES (?, ?, ?, ?)", rows
+            )
+            self._db.commit()
+
+    def delete(self, ids: List[str]) -> None:
+        with self._lock:
+            self._db.executemany("DELETE FROM listings WHERE id = ?", [(i,) for i in ids])
+            self._db.commit()
+
+    def iter_ids(self, chunk: int = 1000) -> Iterator[List[Tuple[str, Any]]]:
+        """پیمایش دسته‌ای (id, _id مونگو) همهٔ آگهی‌های ثبت‌شده."""
+        last = ""
+        while True:
+            with self._lock:
+                rows = self._db.execute(
+                    "SELECT id, mongo_id FROM listings WHERE id > ? ORDER BY id LIMIT ?", (last, chunk)
+                ).fetchall()
+            if not rows:
+                return
+            yield [(i, json_util.loads(mid)) for i, mid in rows]
+            last = rows[-1][0]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM listings")
+            self._db.execute("DELETE FROM kv")
+            self._db.commit()
+
+    # ── key/value ────────────────────────────────────────────────────────
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        return json_util.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)", (key, json_util.dumps(value)))
+            self._db.commit()
+
+    def delete_key(self, key: str) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM kv WHERE key = ?", (key,))
+            self._db.commit()
+
+
+class RangeProgress:
+    """
+    watermark یک بازهٔ _id: دسته‌ها به ترتیب _id صادر می‌شوند ولی ممکن است
+    نامرتب تمام شوند (embed/upsert هم‌زمان). watermark فقط وقتی جلو می‌رود که
+    همهٔ دسته‌های قبلی هم commit شده باشند؛ پس بعد از crash خواندن از
+    آخرین _id ثبت‌شده بدون جا انداختن هیچ دسته‌ای ادامه پیدا می‌کند.
+    کلید از مرزهای بازه ساخته می‌شود؛ پس مرزها باید همان طرح ذخیره‌شدهٔ اجرا
+    باشند، نه خروجی تازهٔ $bucketAuto.
+    """
+    def __init__(self, store: CheckpointStore, lo: Any, hi: Any):
+        self.store     = store
+        self.key       = f"progress:{json_util.dumps(lo)}:{json_util.dumps(hi)}"
+        self._lock     = threading.Lock()
+        self._next_seq = 0
+        self._last_ids: Dict[int, Any] = {}
+        self._done     = set()
+        self._committed = -1
+
+    def resume_after(self) -> Optional[Any]:
+        """آخرین _id که همهٔ دسته‌های تا آن commit شده‌اند (یا None)."""
+        return self.store.get(self.key)
+
+    def issue(self, last_id: Any) -> int:
+        with self._lock:
+            seq = self._next_seq
+            self._next_seq += 1
+            self._last_ids[seq] = last_id
+            return seq
+
+    def complete(self, seq: int) -> None:
+        with self._lock:
+            self._done.add(seq)
+            advanced = None
+            while self._committed + 1 in self._done:
+                self._committed += 1
+                self._done.discard(self._committed)
+                advanced = self._last_ids.pop(self._committed)
+            if advanced is not None:
+                self.store.set(self.key, advanced)
+
+    def finish(self) -> bool:
+        """
+        پایان پیمایش بازه. اگر همهٔ دسته‌ها commit شده باشند watermark پاک می‌شود تا
+        اجرای بعدی دوباره از ابتدا (برای کشف تغییرات) بخواند؛ در غیر این صورت
+        watermark می‌ماند و اجرای بعدی از همان‌جا ادامه می‌دهد.
+        """
+        with self._lock:
+            complete = self._committed == self._next_seq - 1
+        if complete:
+            self.store.delete_key(self.key)
+        return complete
@@ -0,0 +1,179 @@
+# intent_router.py
+# ────────────────────────────────────────────────────────────────────────────
+# مسیریاب قاعده‌محور جلوی Agent:
+#   • filters : بدون متن پرسش — فقط فیلترهای فرم
+#   • lookup  : «ارزان‌ترین/بزرگ‌ترین/… در X زیر $Y» یا «آگهی‌های X را نشان بده»
+#   • count   : «چند ملک در X زیر $Y هست؟» / "how many …"
+#   • open    : هر چیز دیگر (چرا، مقایسه، پیشنهاد، ویژگی‌های توصیفی …) → Agent
+# پرسش فقط وقتی مستقیم از StructuredSearch جواب داده می‌شود که همهٔ کلماتش
+# شناخته شوند (نشانهٔ مرتب‌سازی/شمارش، قیمت، مساحت، نام محله یا کلمات پرکننده)؛
+# هر کلمهٔ ناشناخته یعنی پرسش به Agent برود.
+# ────────────────────────────────────────────────────────────────────────────
+import re
+from typing import Optional, Dict, List, NamedTuple, Tuple
+
+from neighborhoods import NeighborhoodIndex, ALIASES, BOROUGHS, canonical_key
+
+FILTERS = "filters"
+LOOKUP  = "lookup"
+COUNT   = "count"
+OPEN    = "open"
+
+LOOKUP_LIMIT      = 10
+SUPERLATIVE_LIMIT = 5
+
+# نشانهٔ مرتب‌سازی ← کلید sort در StructuredSearch
+SORT_CUES: List[Tuple[str, str]] = [
+    (r"(?:(?:best value |(?:lowest|cheapest) (?:price )?)per (?:sq ?ft|square foot)|best value)", "price_per_sqft"),
+    (r"(?:cheapest|least expensive|lowest price[d]?|ارزانترین|ارزان ترین)", "price"),
+    (r"(?:most expensive|priciest|highest price[d]?|گرانترین|گران ترین)", "-price"),
+    (r"(?:largest|biggest|بزرگترین|بزرگ ترین)", "-sqft"),
+    (r"(?:smallest|کوچکترین|کوچک ترین)", "sqft"),
+    (r"(?:newest|most recent(?:ly built)?|جدیدترین|جدید ترین|نوسازترین)", "-year_built"),
+    (r"(?:oldest|قدیمیترین|قدیمی ترین)", "year_built"),
+]
+COUNT_RE = re.compile(r"(?:how many|number of|count of|\bcount\b|چند تا|چندتا|چه تعداد|تعداد)")
+LOOKUP_RE = re.compile(r"(?:\bshow\b|\blist\b|\bfind\b|\bsearch\b|\bany\b|نشان بده|لیست|پیدا کن|بگرد)")
+
+# نشانه‌های پرسش باز؛ با وجود هر کدام مستقیماً به Agent
+OPEN_RE = re.compile(
+    r"(?:\bwhy\b|\bshould\b|recommend|suggest|compare|\bvs\b|versus|\bbetter\b|\bworth\b|explain|"
+    r"\bopinion\b|advice|invest|\bthink\b|describe|tell me about|\bsafe\b|school|commute|"
+    r"چرا|پیشنهاد|توصیه|مقایسه|بهتر|ارزش|توضیح|نظر|سرمایه گذاری|سرمایهگذاری|امن)"
+)
+
+_NUM  = r"\$?\s*(\d[\d,]*(?:\.\d+)?)\s*(k|m|mm|million|thousand|میلیون|هزار)?\b"
+_MULT = {"k": 1e3, "thousand": 1e3, "هزار": 1e3, "m": 1e6, "mm": 1e6, "million": 1e6, "میلیون": 1e6}
+
+PRICE_RE = re.compile(
+    r"(?:under|below|less than|cheaper than|at most|max(?:imum)?|up to|within|<=?|زیر|کمتر از|حداکثر|تا)\s*"
+    + _NUM + r"(?:\s*(?:dollars?|usd|دلار))?"
+)
+SQFT_RE = re.compile(
+    r"(?:(?:over|above|more than|at least|min(?:imum)?|>=?|بیشتر از|حداقل|بالای)\s*)?"
+    r"(\d[\d,]*)\s*(\+)?\s*(?:sq\.? ?ft\.?|sqft|square (?:feet|foot)|فوت مربع)"
+)
+
+# کلمات پرکننده که معنای جستجو را تغییر نمی‌دهند
+STOPWORDS = set("""
+a an the in at on of for with and or to me us i we you please any all some there is are was were
+what which who where show list find search give get see display tell
+home homes house houses condo condos coop coops apartment apartments unit units building buildings
+listing listings property properties sale sales sold place places one ones option options available
+price prices priced cost costs dollar dollars usd
+در با به از را که های ها ی یک این آن است هست هستند کدام چه چی کجا لطفا
+ملک املاک آپارتمان آپارتمانهای خانه خانههای آگهی آگهیهای واحد ساختمان فروش موجود
+نشان بده لیست پیدا کن بگرد قیمت دلار
+""".split())
+
+_ZWNJ  = "\u200c"
+_WORDS = re.compile(r"\w+")
+
+
+class Route(NamedTuple):
+    intent:  str
+    filters: Dict
+    sort:    str = "price"
+    limit:   int = LOOKUP_LIMIT
+
+
+def _normalize(text: str) -> str:
+    text = text.casefold().replace(_ZWNJ, "").replace("ي", "ی").replace("ك", "ک")
+    return " ".join(text.split())
+
+
+def _amount(number: str, unit: Optional[str]) -> float:
+    return float(number.replace(",", "")) * _MULT.get((unit or "").lower(), 1)
+
+
+def _find_neighborhood(tokens: List[str], index: Optional[NeighborhoodIndex]) -> Tuple[Optional[str], List[str]]:
+    """طولانی‌ترین n-gram که دقیقاً نام محله، alias یا بورو باشد؛ خروجی: (نام، توکن‌های باقی‌مانده)."""
+    known = index.entries if index is not None else {}
+    for n in range(min(4, len(tokens)), 0, -1):
+        for i in range(len(tokens) - n + 1):
+            gram = " ".join(tokens[i:i + n])
+            if n == 1 and gram in STOPWORDS:
+                continue
+            if gram in known or gram in ALIASES or gram in BOROUGHS:
+                return gram, tokens[:i] + tokens[i + n:]
+    return None, tokens
+
+
+def route(prompt: Optional[str], filters: Dict, neighborhoods: Optional[NeighborhoodIndex] = None) -> Route:
+    """
+    filters: فیلترهای فرم (neighborhood, max_price, min_sqft). مقادیر فرم بر
+    مقادیر استخراج‌شده از متن اولویت دارند.
+    """
+    filters = {k: v for k, v in filters.items() if v is not None}
+    if not prompt or not prompt.strip():
+        return Route(FILTERS, filters)
+
+    text = _normalize(prompt)
+    if OPEN_RE.search(text):
+        return Route(OPEN, filters)
+
+    found: Dict = {}
+    intent, sort, limit = None, "price", LOOKUP_LIMIT
+
+    for pattern, key in SORT_CUES:
+        m = re.search(pattern, text)
+        if m:
+            intent, sort, limit = LOOKUP, key, SUPERLATIVE_LIMIT
+            text = text[:m.start()] + " " + text[m.end():]
+            break
+
+    if COUNT_RE.search(text):
+        intent = COUNT
+        text = COUNT_RE.sub(" ", text)
+    if LOOKUP_RE.search(text):
+        intent = intent or LOOKUP
+        text = LOOKUP_RE.sub(" ", text)
+
+    m = PRICE_RE.search(text)
+    if m:
+        found["max_price"] = _amount(m.group(1), m.group(2))
+        text = text[:m.start()] + " " + text[m.end():]
+    m = SQFT_RE.search(text)
+    if m:
+        found["min_sqft"] = _amount(m.group(1), None)
+        text = text[:m.start()] + " " + text[m.end():]
+
+    neighborhood, rest = _find_neighborhood(canonical_key(text).split(), neighborhoods)
+    if neighborhood:
+        found["neighborhood"] = neighborhood
+
+    # کلمات غیرلاتین (فارسی) که canonical_key حذف می‌کند جداگانه بررسی می‌شوند
+    leftover = [w for w in rest + _WORDS.findall(re.sub(r"[0-9a-z_]+", " ", text)) if w not in STOPWORDS]
+    if leftover or (intent is None and not found):
+        return Route(OPEN, filters)
+
+    return Route(intent or LOOKUP, {**found, **filters}, sort, limit)
+
+
+def format_rows(rows: List[Dict]) -> str:
+    """خلاصهٔ یک‌خطی هر آگهی (همان قالبی که به مدل هم داده می‌شود)."""
+    if not rows:
+        return "هیچ ملکی مطابق فیلترها یافت نشد."
+    summary_lines = []
+    for p in rows:
+        addr = p.get('address', 'Unknown address')
+        neigh = p.get('neighborhood', 'Unknown')
+        price = p.get('sale_price', 0)
+        sqft = p.get('gross_square_feet', 0)
+        summary_lines.append(
+            f"{addr} in {neigh} for ${price} ({sqft} sqft)"
+        )
+    return "\n".join(summary_lines)
+
+
+async def answer_direct(search_service, r: Route) -> str:
+    """پاسخ مسیرهای غیر open مستقیماً از جستجوی ساختاری (بدون LLM)."""
+    # شمارش و فهرست با یک شرط «مقدار معلوم» تا «چندتا زیر X» و «ارزان‌ترین زیر X» هم‌خوان باشند
+    if r.intent == COUNT:
+        n = await search_service.astructured_count(**r.filters, include_unknown=False)
+        more = "+" if n >= search_service.structured.COUNT_LIMIT else ""
+        return f"{n}{more} ملک مطابق فیلترها پیدا شد."
+    # «ارزان‌ترین/کوچک‌ترین/قدیمی‌ترین» فقط بین آگهی‌هایی که مقدار کلید مرتب‌سازی
+    # معلوم و مثبت دارند؛ وگرنه آگهی‌های بدون قیمت یا با قیمت 0 اول می‌آیند
+    rows = await search_service.astructured_search(**r.filters, sort=r.sort, limit=r.limit, include_unknown=False)
+    return format_rows(rows)
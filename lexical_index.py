@@ -0,0 +1,191 @@
+# lexical_index.py
+# ────────────────────────────────────────────────────────────────────────────
+# ایندکس واژگانی (inverted index + امتیاز BM25) روی توضیحات و آدرس آگهی‌ها،
+# کنار ایندکس برداری. پرسش‌هایی که آدرس خیابان، کد پستی یا کد کلاس ساختمان
+# (مثل "D4") دارند با embedding خوب بازیابی نمی‌شوند؛ این‌جا تطبیق دقیق دارند.
+#
+#   • ذخیره در SQLite (LEXICAL_INDEX_PATH): postings (term, id, tf)، طول هر سند
+#     و df هر term؛ ingest و live_indexer آن را هم‌زمان با upsert بردارها
+#     به‌روز می‌کنند و سرور فقط می‌خواند (WAL ⇒ خواندن هم‌زمان با نوشتن).
+#     فایل محلی پروسه است: سرور باید همان LEXICAL_INDEX_PATH ایندکسر را ببیند
+#     (volume مشترک)؛ تا وقتی ایندکس خالی است جستجو فقط برداری می‌ماند.
+#   • توکن‌ساز: کدهای پستی و کلاس ساختمان حفظ می‌شوند، پسوند عدد ترتیبی
+#     ("72nd" → "72") و مخفف‌های آدرس ("w" → "west"، "ave" → "avenue") یکسان می‌شوند.
+# ────────────────────────────────────────────────────────────────────────────
+import os, re, math, sqlite3, threading
+from collections import Counter, defaultdict
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, NamedTuple, Tuple
+
+from bson import json_util
+
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", "lexical_index.sqlite")
+
+# پارامترهای BM25
+BM25_K1 = 1.2
+BM25_B  = 0.75
+# termهایی که در بیش از این نسبت از اسناد هستند (وقتی پرسش term دیگری هم دارد) نادیده گرفته می‌شوند
+MAX_DF_RATIO = 0.5
+
+# فیلدهای سند Mongo که در ایندکس واژگانی می‌آیند (نام خام دیتاست NYC و نام‌های ingest)
+LEXICAL_FIELDS = (
+    "description", "address", "ADDRESS", "APARTMENT NUMBER", "ZIP CODE", "NEIGHBORHOOD",
+    "BUILDING CLASS CATEGORY", "BUILDING CLASS AT PRESENT", "BUILDING CLASS AT TIME OF SALE",
+)
+
+ABBREVIATIONS = {
+    "st": "street", "str": "street", "ave": "avenue", "av": "avenue", "blvd": "boulevard",
+    "rd": "road", "pl": "place", "dr": "drive", "ln": "lane", "ct": "court", "ter": "terrace",
+    "pkwy": "parkway", "hwy": "highway", "sq": "square", "apt": "apartment",
+    "w": "west", "e": "east", "n": "north", "s": "south",
+}
+STOPWORDS = set("""
+a an the and or of in on at to for with by from is are was were be this that it its as
+""".split())
+
+_ZWNJ    = "\u200c"
+_TOKEN   = re.compile(r"\w+")
+_ORDINAL = re.compile(r"^(\d+)(?:st|nd|rd|th)$")
+
+
+def tokenize(text: str) -> List[str]:
+    """توکن‌های نرمال‌شده؛ عددها و کدهای حرف+عدد (ZIP، کلاس ساختمان، شمارهٔ پلاک) حفظ می‌شوند."""
+    out = []
+    for tok in _TOKEN.findall((text or "").casefold().replace(_ZWNJ, "")):
+        m = _ORDINAL.match(tok)
+        if m:
+            tok = m.group(1)
+        tok = ABBREVIATIONS.get(tok, tok)
+        if tok in STOPWORDS or (len(tok) < 2 and not tok.isdigit()):
+            continue
+        out.append(tok)
+    return out
+
+
+def lexical_text(doc: Dict) -> str:
+    """متن قابل جستجوی واژگانی یک سند Mongo."""
+    return " ".join(str(doc[f]) for f in LEXICAL_FIELDS if doc.get(f) not in (None, ""))
+
+
+class LexicalHit(NamedTuple):
+    id:       str
+    mongo_id: Any
+    score:    float
+
+
+class LexicalIndex:
+    """دسترسی thread-safe به ایندکس واژگانی (مثل CheckpointStore در ingest_state.py)."""
+
+    def __init__(self, path: str = LEXICAL_INDEX_PATH):
+        self.path  = path
+        self._lock = threading.Lock()
+        self._db   = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS docs (
+                id       TEXT PRIMARY KEY,
+                mongo_id TEXT NOT NULL,
+                length   INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                id   TEXT NOT NULL,
+                tf   INTEGER NOT NULL,
+                PRIMARY KEY (term, id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_id ON postings (id);
+            CREATE TABLE IF NOT EXISTS terms (
+                term TEXT PRIMARY KEY,
+                df   INTEGER NOT NULL
+            ) WITHOUT ROWID;
+        """)
+        self._db.commit()
+
+    # ── نوشتن ────────────────────────────────────────────────────────────
+    def _remove(self, ids: List[str]) -> None:
+        """حذف postings اسناد (داخل تراکنش جاری؛ قفل دست فراخوان است)."""
+        for i in ids:
+            terms = [t for (t,) in self._db.execute("SELECT term FROM postings WHERE id = ?", (i,))]
+            if not terms:
+                continue
+            self._db.executemany("UPDATE terms SET df = df - 1 WHERE term = ?", [(t,) for t in terms])
+            self._db.execute("DELETE FROM postings WHERE id = ?", (i,))
+            self._db.execute("DELETE FROM docs WHERE id = ?", (i,))
+        self._db.execute("DELETE FROM terms WHERE df <= 0")
+
+    def add(self, docs: Iterable[Tuple[str, Any, str]]) -> int:
+        """docs: (id, _id مونگو, متن). سند موجود با همان id جایگزین می‌شود."""
+        docs = [(i, mid, Counter(tokenize(text))) for i, mid, text in docs]
+        if not docs:
+            return 0
+        with self._lock:
+            self._remove([i for i, _, _ in docs])
+            self._db.executemany(
+                "INSERT INTO docs (id, mongo_id, length) VALUES (?, ?, ?)",
+                [(i, json_util.dumps(mid), sum(tf.values())) for i, mid, tf in docs],
+            )
+            self._db.executemany(
+                "INSERT INTO postings (term, id, tf) VALUES (?, ?, ?)",
+                [(t, i, n) for i, _, tf in docs for t, n in tf.items()],
+            )
+            df = Counter(t for _, _, tf in docs for t in tf)
+            self._db.executemany(
+                "INSERT INTO terms (term, df) VALUES (?, ?) ON CONFLICT(term) DO UPDATE SET df = df + excluded.df",
+                list(df.items()),
+            )
+            self._db.commit()
+        return len(docs)
+
+    def delete(self, ids: List[str]) -> None:
+        with self._lock:
+            self._remove(list(ids))
+            self._db.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM postings")
+            self._db.execute("DELETE FROM terms")
+            self._db.execute("DELETE FROM docs")
+            self._db.commit()
+
+    # ── خواندن ───────────────────────────────────────────────────────────
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def search(self, query: str, k: int = 10) -> List[LexicalHit]:
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        marks = ",".join("?" * len(terms))
+        with self._lock:
+            n, total = self._db.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM docs").fetchone()
+            if not n:
+                return []
+            df = dict(self._db.execute(f"SELECT term, df FROM terms WHERE term IN ({marks})", terms).fetchall())
+            # termهای خیلی رایج فقط وقتی term کمیاب‌تری در پرسش نیست حساب می‌شوند
+            rare = [t for t in df if df[t] <= MAX_DF_RATIO * n]
+            used = rare or list(df)
+            postings = {
+                t: self._db.execute(
+                    "SELECT p.id, p.tf, d.length, d.mongo_id FROM postings p JOIN docs d ON d.id = p.id WHERE p.term = ?",
+                    (t,),
+                ).fetchall()
+                for t in used
+            }
+
+        avgdl  = total / n
+        scores: Dict[str, float] = defaultdict(float)
+        mongo:  Dict[str, str]   = {}
+        for t, rows in postings.items():
+            idf = math.log(1 + (n - df[t] + 0.5) / (df[t] + 0.5))
+            for i, tf, length, mid in rows:
+                scores[i] += idf * tf * (BM25_K1 + 1) / (tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avgdl))
+                mongo[i] = mid
+        top = sorted(scores.items(), key=lambda kv: kv[1], reverse=True)[:k]
+        return [LexicalHit(i, json_util.loads(mongo[i]), s) for i, s in top]
+
+
+@lru_cache(maxsize=None)
+def get_lexical_index() -> LexicalIndex:
+    return LexicalIndex()
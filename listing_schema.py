@@ -0,0 +1,159 @@
+# listing_schema.py
+# ────────────────────────────────────────────────────────────────────────────
+# تعریف یکتای فیلدهای تایپ‌شدهٔ آگهی:
+#   فیلد خام دیتاست NYC (حروف بزرگ، عددها به‌صورت رشته با جداکنندهٔ هزار)
+#   ← نام تایپ‌شده و تابع تبدیل.
+# همین تعریف در سه جا استفاده می‌شود:
+#   • normalize.py  : زیرسند norm در Mongo
+#   • ingest.py     : متادیتای عددی قابل فیلتر بردارها
+#   • filter_spec   : ترجمهٔ فیلترهای neighborhood / max_price / min_sqft به
+#                     کوئری Mongo (با پیشوند norm.) یا فیلتر ایندکس برداری
+# پس فیلتر ساختاری و فیلتر داخل جستجوی ANN روی همان کلیدها و همان نوع‌ها هستند.
+# ────────────────────────────────────────────────────────────────────────────
+from datetime import datetime
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+from bson import ObjectId
+
+from neighborhoods import NeighborhoodIndex, canonical_key
+
+DATE_FORMATS = ("%Y-%m-%d %H:%M:%S", "%Y-%m-%d", "%m/%d/%Y", "%m/%d/%y")
+
+
+def parse_int(value: Any) -> Optional[int]:
+    """تبدیل مقدار خام (مثل '1,250,000' یا ' -  ') به int؛ در صورت نامعتبر بودن None."""
+    if value is None or isinstance(value, bool):
+        return None
+    try:
+        if isinstance(value, (int, float)):
+            return int(value)
+        return int(float(str(value).replace(",", "").replace("$", "").strip()))
+    except (ValueError, OverflowError):
+        return None
+
+
+def parse_date(value: Any) -> Optional[datetime]:
+    if isinstance(value, datetime):
+        return value
+    if not value:
+        return None
+    text = str(value).strip()
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def parse_key(value: Any) -> Optional[str]:
+    return canonical_key(value) or None
+
+
+class Field(NamedTuple):
+    name:       str                      # نام تایپ‌شده (در norm و متادیتای بردار)
+    raw:        str                      # نام فیلد خام در سند Mongo
+    parse:      Callable[[Any], Any]
+    filterable: bool = False             # در متادیتای بردار نوشته می‌شود
+
+
+FIELDS: List[Field] = [
+    Field("neighborhood",      "NEIGHBORHOOD",      parse_key,  filterable=True),
+    Field("borough",           "BOROUGH",           parse_int,  filterable=True),
+    Field("sale_price",        "SALE PRICE",        parse_int,  filterable=True),
+    Field("gross_square_feet", "GROSS SQUARE FEET", parse_int,  filterable=True),
+    Field("land_square_feet",  "LAND SQUARE FEET",  parse_int),
+    Field("year_built",        "YEAR BUILT",        parse_int,  filterable=True),
+    Field("residential_units", "RESIDENTIAL UNITS", parse_int),
+    Field("commercial_units",  "COMMERCIAL UNITS",  parse_int),
+    Field("total_units",       "TOTAL UNITS",       parse_int),
+    Field("sale_date",         "SALE DATE",         parse_date),
+]
+RAW_FIELDS = tuple(f.raw for f in FIELDS)
+
+# فیلدهای محاسبه‌شده که قابل فیلتر هم هستند
+DERIVED_FILTERABLE = ("price_per_sqft",)
+FILTERABLE = tuple(f.name for f in FIELDS if f.filterable) + DERIVED_FILTERABLE
+
+# فیلتر ورودی ← (فیلد تایپ‌شده، عملگر)؛ سینتکس مشترک Mongo و Pinecone
+RANGE_FILTERS = {
+    "max_price": ("sale_price",        "$lte"),
+    "min_sqft":  ("gross_square_feet", "$gte"),
+}
+
+
+# نوع _id مونگو در متادیتای بردار (رشته بدون برچسب)
+_ID_TYPES = {"oid": ObjectId, "int": int}
+
+
+def vector_ref(_id: Any) -> Dict[str, Any]:
+    """شناسهٔ بردار و نوع _id مونگو؛ تنها فیلدهای غیرقابل‌فیلتر متادیتا."""
+    for name, t in _ID_TYPES.items():
+        if isinstance(_id, t) and not isinstance(_id, bool):
+            return {"id": str(_id), "id_type": name}
+    return {"id": str(_id)}
+
+
+def ref_mongo_id(meta: Dict[str, Any], default_id: Optional[str] = None) -> Any:
+    """_id مونگو از روی متادیتای بردار (برای خواندن دسته‌ای با $in)."""
+    value = meta.get("id", default_id)
+    t = _ID_TYPES.get(meta.get("id_type"))
+    return t(value) if t else value
+
+
+def parse_listing(doc: Dict) -> Dict[str, Any]:
+    """مقادیر تایپ‌شدهٔ یک سند خام (فقط مقادیر قابل‌تبدیل)."""
+    typed: Dict[str, Any] = {}
+    for f in FIELDS:
+        val = f.parse(doc.get(f.raw))
+        if val is not None:
+            typed[f.name] = val
+    if typed.get("sale_price") and typed.get("gross_square_feet"):
+        typed["price_per_sqft"] = round(typed["sale_price"] / typed["gross_square_feet"], 2)
+    return typed
+
+
+def filterable_metadata(typed: Dict[str, Any]) -> Dict[str, Any]:
+    """بخش قابل فیلتر مقادیر تایپ‌شده برای متادیتای بردار (بدون null)."""
+    return {name: typed[name] for name in FILTERABLE if typed.get(name) is not None}
+
+
+def filter_spec(
+    neighborhood_keys: Optional[List[str]] = None,
+    max_price:         Optional[float] = None,
+    min_sqft:          Optional[float] = None,
+    prefix:            str = "",
+) -> Dict:
+    """
+    فیلترها ← شرط روی فیلدهای تایپ‌شده. prefix برای Mongo «norm.» است و
+    برای ایندکس برداری خالی.
+    """
+    spec: Dict = {}
+    if neighborhood_keys is not None:
+        spec[prefix + "neighborhood"] = {"$in": list(neighborhood_keys)}
+    for name, value in (("max_price", max_price), ("min_sqft", min_sqft)):
+        if value is not None:
+            field, op = RANGE_FILTERS[name]
+            spec[prefix + field] = {op: value}
+    return spec
+
+
+def vector_filter(
+    neighborhood:  Optional[str] = None,
+    city:          Optional[str] = None,
+    max_price:     Optional[float] = None,
+    min_sqft:      Optional[float] = None,
+    min_area:      Optional[float] = None,
+    neighborhoods: Optional[NeighborhoodIndex] = None,
+) -> Optional[Dict]:
+    """
+    همان فیلترهای StructuredSearch ← فیلتر متادیتای ایندکس برداری، تا نامزدها
+    داخل خود جستجوی ANN محدود شوند. نام محله مثل جستجوی ساختاری با دیکشنری
+    محله‌ها به کلیدهای دقیق تبدیل می‌شود.
+    """
+    text = neighborhood or city
+    keys = None
+    if text:
+        keys = neighborhoods.resolve(text) if neighborhoods is not None else [canonical_key(text)]
+    spec = filter_spec(keys, max_price, min_sqft if min_sqft is not None else min_area)
+    return spec or None
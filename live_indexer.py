@@ -0,0 +1,127 @@
+# live_indexer.py
+# ────────────────────────────────────────────────────────────────────────────
+# حالت «ایندکس زنده»: change stream کالکشن listings دنبال می‌شود و
+# insert/update/replace/delete ها به‌صورت micro-batch (با debounce) از همان
+# مسیر ingest (prepare → dedup → embed → upsert + checkpoint) به ایندکس برداری می‌رسند.
+# resume token در همان CheckpointStore ذخیره می‌شود تا restart نه تغییری را
+# جا بیندازد و نه دوباره اعمال کند.
+#
+#   اجرا:  python live_indexer.py
+#   (change stream فقط روی replica set / Atlas در دسترس است)
+# ────────────────────────────────────────────────────────────────────────────
+import os, time, logging
+
+from ingest import (
+    col, open_index, prepare_record, dedup_records, embed_records, upsert_vectors, index_lexical, INGEST_PROJECTION
+)
+from lexical_index import get_lexical_index
+from dedup import get_deduper
+from ingest_state import CheckpointStore
+from result_cache import bump_index_version
+from normalize import refresh_norm
+
+logger = logging.getLogger(__name__)
+
+# بازهٔ جمع‌کردن تغییرات قبل از اعمال (ثانیه) و سقف اندازهٔ هر micro-batch
+DEBOUNCE_SECONDS = float(os.getenv("LIVE_INDEX_DEBOUNCE", "2.0"))
+MAX_BATCH        = int(os.getenv("LIVE_INDEX_MAX_BATCH", "200"))
+
+RESUME_TOKEN_KEY = "live_indexer:resume_token"
+
+PIPELINE = [{"$match": {"operationType": {"$in": ["insert", "update", "replace", "delete"]}}}]
+
+
+def apply_changes(index, store: CheckpointStore, upserts: dict, deletes: set) -> None:
+    """
+    اعمال یک micro-batch. upserts: _id ← سند کامل (آخرین نسخه)، deletes: مجموعهٔ _id.
+    آگهی‌هایی که hash آن‌ها تغییری نکرده (مثلاً آپدیت فیلدی که embed نمی‌شود) رد می‌شوند،
+    ولی norm آن‌ها (مبنای فیلتر و مرتب‌سازی ساختاری) همیشه با فیلدهای خام هماهنگ می‌شود.
+    """
+    refreshed = refresh_norm(col, upserts.values())
+    records = [r for r in map(prepare_record, upserts.values()) if r is not None]
+    stored  = store.hashes([r["id"] for r in records])
+    changed = [r for r in records if stored.get(r["id"]) != r["hash"]]
+    if changed:
+        dedup_records(changed)
+        upsert_vectors(index, embed_records(changed))
+        index_lexical(changed)
+        store.commit((r["id"], r["mongo_id"], r["hash"]) for r in changed)
+
+    if deletes:
+        ids = [str(d) for d in deletes]
+        index.delete(ids=ids)
+        get_lexical_index().delete(ids)
+        if get_deduper() is not None:
+            get_deduper().forget(ids)
+        store.delete(ids)
+        logger.info(f"Deleted {len(ids)} vectors")
+
+    if changed or deletes or refreshed:
+        bump_index_version(col.database)
+
+
+def run() -> None:
+    index = open_index()
+    store = CheckpointStore()
+    token = store.get(RESUME_TOKEN_KEY)
+    logger.info("Starting change stream " + ("(resuming)" if token else "(from now)"))
+
+    upserts: dict = {}
+    deletes: set  = set()
+    first_change  = None
+    last_token    = token
+    saved_token   = token
+
+    def save_token():
+        nonlocal saved_token
+        if last_token is not None and last_token != saved_token:
+            store.set(RESUME_TOKEN_KEY, last_token)
+            saved_token = last_token
+
+    def flush():
+        nonlocal upserts, deletes, first_change
+        if upserts or deletes:
+            apply_changes(index, store, upserts, deletes)
+        # token فقط بعد از اعمال موفق ذخیره می‌شود؛ crash وسط کار ⇒ تکرار همین batch
+        save_token()
+        upserts, deletes, first_change = {}, set(), None
+        # ادغام journal ایندکس محلی بین micro-batch ها و فقط وقتی بر حسب سطر بزرگ شده
+        index.maybe_compact()
+
+    with col.watch(
+        PIPELINE,
+        full_document="updateLookup",
+        resume_after=token,
+        max_await_time_ms=int(DEBOUNCE_SECONDS * 1000),
+    ) as stream:
+        while stream.alive:
+            change = stream.try_next()
+            if change is not None:
+                key = change["documentKey"]["_id"]
+                if change["operationType"] == "delete" or change.get("fullDocument") is None:
+                    upserts.pop(key, None)
+                    deletes.add(key)
+                else:
+                    deletes.discard(key)
+                    upserts[key] = {f: change["fullDocument"].get(f) for f in ("_id", *INGEST_PROJECTION)}
+                first_change = first_change or time.monotonic()
+                last_token   = stream.resume_token
+
+            pending = len(upserts) + len(deletes)
+            if pending >= MAX_BATCH or (first_change and time.monotonic() - first_change >= DEBOUNCE_SECONDS):
+                flush()
+            elif change is None and not pending and stream.resume_token is not None:
+                # بدون تغییر جدید هم token (post-batch) جلو می‌رود
+                last_token = stream.resume_token
+                save_token()
+
+        # stream بسته شد (مثلاً invalidate)؛ تغییرات باقی‌مانده اعمال می‌شوند
+        flush()
+    index.save()
+
+
+if __name__ == "__main__":
+    try:
+        run()
+    except KeyboardInterrupt:
+        logger.info("Live indexer stopped.")
@@ -1,20 +1,32 @@
 import os
+import json
+import logging
+from contextlib import asynccontextmanager
 from typing import Optional, List, Dict
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, StreamingResponse
 from pydantic import BaseModel, Field
 
 # ── لایه‌های داخلی ---------------------------------------------------------
-from config          import listings_collection, vector_store
-from search_service  import SearchService
-from search_semantic import SemanticSearch
-from agent_manager   import run_agent_with_filters
+from container       import AppContainer, get_container, require_level, SEMANTIC, AGENT
+from agent_manager   import run_agent_with_filters, stream_agent_with_filters
+from intent_router   import route, answer_direct, format_rows, OPEN, Route
+
+logger = logging.getLogger(__name__)
 
 # ─────────────────── مقداردهی اپلیکیشن ────────────────────────────────────
-app = FastAPI(title="AMLAK Chat API", version="0.1.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # همهٔ منابع مشترک (Mongo، vector store، LLM، کش‌ها) یک‌بار برای هر worker؛
+    # منابع شبکه‌ای در پس‌زمینه گرم می‌شوند و خطایشان سرور را از بالا آمدن باز نمی‌دارد
+    app.state.container = await AppContainer.start()
+    yield
+    await app.state.container.close()
+
+app = FastAPI(title="AMLAK Chat API", version="0.1.0", lifespan=lifespan)
 
 # CORS
 app.add_middleware(
@@ -32,10 +44,6 @@ app.mount("/static", StaticFiles(directory="static"), name="static")
 async def serve_index():
     return FileResponse("static/index.html")
 
-# ── سرویس‌های دیتابیس و وکتور ───────────────────────────────────────────
-semantic_layer = SemanticSearch(vector_store)
-search_service = SearchService(listings_collection, vector_store, semantic_layer)
-
 # ── مدل‌های ورودی/خروجی ──────────────────────────────────────────────────
 class ChatRequest(BaseModel):
     prompt:       Optional[str] = Field(None, description="متن پرسش آزاد یا سوال follow-up")
@@ -50,6 +58,13 @@ class SearchRequest(BaseModel):
     neighborhood: Optional[str] = None
     max_price:    Optional[float] = None
     min_sqft:     Optional[float] = None
+    sort:         str           = Field("price", description="price | price_per_sqft | year_built | sqft (پیشوند - برای نزولی)")
+    cursor:       Optional[str] = Field(None, description="توکن صفحهٔ بعد از پاسخ قبلی")
+    limit:        int           = Field(20, ge=1, le=100)
+
+class SearchResponse(BaseModel):
+    results:     List[Dict]
+    next_cursor: Optional[str] = Field(None, description="برای صفحهٔ بعد؛ اگر null باشد صفحهٔ دیگری نیست")
 
 # ── اندپوینت‌های API ─────────────────────────────────────────────────────
 @app.post(
@@ -57,71 +72,131 @@ class SearchRequest(BaseModel):
     response_model=ChatResponse,
     summary="گفتگو با هوش‌مصنوعی (RAG با دیتابیس و Follow-up)"
 )
-async def chat_endpoint(req: ChatRequest):
+async def chat_endpoint(req: ChatRequest, container: AppContainer = Depends(get_container)):
     try:
-        # 1) جستجوی ساختاری با فیلترها
-        props = search_service.structured_search(
-            neighborhood=req.neighborhood,
-            max_price=req.max_price,
-            min_sqft=req.min_sqft,
-            limit=10
-        )
-        # 2) ساخت خلاصه نتایج
-        if props:
-            summary_lines = []
-            for p in props:
-                addr = p.get('address', 'Unknown address')
-                neigh = p.get('neighborhood', 'Unknown')
-                price = p.get('sale_price', 0)
-                sqft = p.get('gross_square_feet', 0)
-                summary_lines.append(
-                    f"{addr} in {neigh} for ${price} ({sqft} sqft)"
-                )
-            summary_text = "\n".join(summary_lines)
-        else:
-            summary_text = "هیچ ملکی مطابق فیلترها یافت نشد."
-
-        # 3) اگر فقط فیلتر و بدون prompt باشند
-        if not req.prompt:
-            return ChatResponse(reply=summary_text)
-
-        # 4) ترکیب فیلترها و سوال کاربر
-        combined_text = (
-            "املاک زیر با فیلترهای شما یافت شد:\n"
-            f"{summary_text}\n\n"
-            "سوال شما: " + req.prompt
-        )
+        # فقط فیلتر یا پرسش ساده ← پاسخ مستقیم از جستجوی ساختاری، بدون LLM
+        r = await _route(container, req)
+        if r.intent != OPEN:
+            return ChatResponse(reply=await answer_direct(container.search_service, r))
 
-        # 5) فراخوانی Agent با متن ترکیبی و فیلترها
-        result = await run_agent_with_filters(
-            neighborhood=req.neighborhood,
-            max_price=req.max_price,
-            min_sqft=req.min_sqft,
-            text=combined_text,
-        )
-        # تبدیل خروجی به رشته
-        if isinstance(result, dict):
-            answer_text = result.get('output') or result.get('reply') or str(result)
-        else:
-            answer_text = str(result)
+        # پرسش باز به Agent نیاز دارد؛ نبودنش 503 است، نه 500
+        await require_level(container, AGENT)
+        combined_text = await _chat_context(container, req)
+
+        # فراخوانی Agent با متن ترکیبی و فیلترها
+        result = await run_agent_with_filters(container.agent, **_filters(req), text=combined_text)
+        return ChatResponse(reply=_answer_text(result))
+
+    except HTTPException:
+        raise
+    except Exception:
+        raise HTTPException(status_code=500, detail="خطا در پردازش درخواست چت")
 
-        return ChatResponse(reply=answer_text)
+def _answer_text(result) -> str:
+    """تبدیل خروجی Agent به رشته"""
+    if isinstance(result, dict):
+        return result.get('output') or result.get('reply') or str(result)
+    return str(result)
+
+def _filters(req: ChatRequest) -> Dict:
+    return {
+        "neighborhood": req.neighborhood,
+        "max_price":    req.max_price,
+        "min_sqft":     req.min_sqft,
+    }
+
+async def _route(container: AppContainer, req: ChatRequest) -> Route:
+    neighborhoods = await container.search_service.aneighborhoods() if req.prompt else None
+    return route(req.prompt, _filters(req), neighborhoods)
+
+async def _chat_context(container: AppContainer, req: ChatRequest) -> str:
+    """بازیابی و ساخت متن ورودی مدل برای پرسش‌های باز (خلاصهٔ نتایج + آگهی‌های مرتبط + پرسش)."""
+    # 1) جستجوی ساختاری با فیلترها و (در صورت وجود prompt) جستجوی معنایی، هم‌زمان؛
+    #    اگر لایهٔ معنایی آماده نیست، بخش معنایی ناقص (degraded) برمی‌گردد
+    if req.prompt and not container.is_ready(SEMANTIC):
+        try:
+            await container.ready(SEMANTIC)
+        except Exception as e:
+            logger.warning(f"Semantic layer unavailable; answering from structured results: {e}")
+    retrieved = await container.search_service.aretrieve(
+        req.prompt,
+        filters=_filters(req),
+        limit=10,
+    )
+    # 2) ساخت خلاصه نتایج
+    summary_text = format_rows(retrieved["structured"])
+
+    # 3) ترکیب فیلترها، نتایج معنایی و سوال کاربر
+    related_text = "\n".join(
+        f"{d.get('address', '')}: {d.get('snippet', '')}" for d in retrieved["semantic"]
+    )
+    combined_text = (
+        "املاک زیر با فیلترهای شما یافت شد:\n"
+        f"{summary_text}\n\n"
+        + (f"آگهی‌های مرتبط با پرسش:\n{related_text}\n\n" if related_text else "")
+        + "سوال شما: " + req.prompt
+    )
+    return combined_text
+
+def _sse(event: str, data: Dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
+@app.post(
+    "/api/chat/stream",
+    summary="گفتگو با هوش‌مصنوعی به‌صورت استریم (Server-Sent Events)"
+)
+async def chat_stream_endpoint(req: ChatRequest, container: AppContainer = Depends(get_container)):
+    """
+    همان مسیر /api/chat (پاسخ مستقیم یا Agent)، به‌صورت رویداد: «tool» با
+    {"name": ...} برای هر ابزاری که Agent صدا می‌زند، «token» با {"text": ...}
+    برای پاسخ، سپس «done» (یا «error»).
+    """
+    try:
+        r = await _route(container, req)
     except Exception:
         raise HTTPException(status_code=500, detail="خطا در پردازش درخواست چت")
+    if r.intent == OPEN:
+        await require_level(container, AGENT)
+
+    async def events():
+        try:
+            if r.intent != OPEN:
+                yield _sse("token", {"text": await answer_direct(container.search_service, r)})
+            else:
+                combined_text = await _chat_context(container, req)
+                steps = stream_agent_with_filters(container.agent, **_filters(req), text=combined_text)
+                async for kind, value in steps:
+                    if kind == "tool":
+                        yield _sse("tool", {"name": value})
+                    else:
+                        yield _sse("token", {"text": _answer_text(value)})
+            yield _sse("done", {})
+        except Exception:
+            yield _sse("error", {"detail": "خطا در پردازش درخواست چت"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @app.post(
     "/api/search",
-    response_model=List[Dict],
-    summary="جستجوی ساختاری مستقیم در MongoDB"
+    response_model=SearchResponse,
+    summary="جستجوی ساختاری مستقیم در MongoDB (با صفحه‌بندی cursor)"
 )
-async def search_endpoint(req: SearchRequest):
+async def search_endpoint(req: SearchRequest, container: AppContainer = Depends(get_container)):
     try:
-        return search_service.structured_search(
+        return await container.search_service.astructured_search_page(
             neighborhood=req.neighborhood,
             max_price=req.max_price,
-            min_sqft=req.min_sqft
+            min_sqft=req.min_sqft,
+            sort=req.sort,
+            cursor=req.cursor,
+            limit=req.limit,
         )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception:
         raise HTTPException(status_code=500, detail="خطا در جستجوی املاک")
 
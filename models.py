@@ -5,13 +5,66 @@
 
 # -*- coding: utf-8 -*-
 import os
+import json
 import httpx
 import logging
 import asyncio
+from functools import lru_cache
+
+from rate_limit import get_rate_limiter, CircuitOpenError
 
 # تنظیم لاگر
 logger = logging.getLogger(__name__)
 
+# ── کلاینت HTTP مشترک ───────────────────────────────────────────────────
+# یک AsyncClient برای کل پروسه: اتصال‌ها (TCP/TLS، و در صورت نصب h2، HTTP/2)
+# بین فراخوانی‌های پشت‌سرهم agent زنده می‌مانند و دوباره handshake نمی‌شوند.
+OPENROUTER_HTTP2            = os.getenv("OPENROUTER_HTTP2", "1") == "1"
+OPENROUTER_MAX_CONNECTIONS  = int(os.getenv("OPENROUTER_MAX_CONNECTIONS", "20"))
+OPENROUTER_MAX_KEEPALIVE    = int(os.getenv("OPENROUTER_MAX_KEEPALIVE", "10"))
+OPENROUTER_KEEPALIVE_EXPIRY = float(os.getenv("OPENROUTER_KEEPALIVE_EXPIRY", "60"))
+OPENROUTER_CONNECT_TIMEOUT  = float(os.getenv("OPENROUTER_CONNECT_TIMEOUT", "5"))
+OPENROUTER_READ_TIMEOUT     = float(os.getenv("OPENROUTER_READ_TIMEOUT", "60"))
+
+_http_client: httpx.AsyncClient | None = None
+_http_client_loop: asyncio.AbstractEventLoop | None = None
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        logger.warning("Package 'h2' not installed; OpenRouter client falls back to HTTP/1.1 keep-alive.")
+        return False
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    کلاینت مشترک event-loop فعلی. در FastAPI در lifespan ساخته می‌شود؛
+    اگر loop عوض شده باشد (مثلاً asyncio.run در مسیر sync) کلاینت تازه ساخته می‌شود،
+    چون اتصال‌های یک loop در loop دیگر قابل استفاده نیستند.
+    """
+    global _http_client, _http_client_loop
+    loop = asyncio.get_running_loop()
+    if _http_client is None or _http_client.is_closed or _http_client_loop is not loop:
+        _http_client = httpx.AsyncClient(
+            http2   = OPENROUTER_HTTP2 and _http2_available(),
+            limits  = httpx.Limits(
+                max_connections           = OPENROUTER_MAX_CONNECTIONS,
+                max_keepalive_connections = OPENROUTER_MAX_KEEPALIVE,
+                keepalive_expiry          = OPENROUTER_KEEPALIVE_EXPIRY,
+            ),
+            timeout = httpx.Timeout(OPENROUTER_READ_TIMEOUT, connect=OPENROUTER_CONNECT_TIMEOUT),
+        )
+        _http_client_loop = loop
+    return _http_client
+
+async def close_http_client() -> None:
+    """در shutdown اپلیکیشن صدا زده می‌شود."""
+    global _http_client, _http_client_loop
+    if _http_client is not None and not _http_client.is_closed:
+        await _http_client.aclose()
+    _http_client, _http_client_loop = None, None
+
 # تنها مدل فعال: gpt-4o
 MODELS = {
     "gpt-4o": "openai/gpt-4o-2024-11-20"
@@ -34,71 +87,129 @@ class Model:
     async def generate_response(self, prompt, image_url=None, conversation_history=None):
         return await self._generate_openrouter_response(prompt, image_url, conversation_history)
 
-    async def _generate_openrouter_response(self, prompt, image_url=None, conversation_history=None, retries=3, backoff_in_seconds=2):
+    def _build_request(self, prompt, image_url=None, conversation_history=None):
+        """هدرها و بدنهٔ درخواست chat/completions (مشترک بین حالت عادی و استریم)."""
+        headers = {
+            'Authorization': f'Bearer {self.api_key}',
+            'Content-Type': 'application/json',
+        }
+        data = {
+            'model': self._get_model_name()
+        }
+
+        messages = []
+
+        if conversation_history:
+            messages.extend(conversation_history)
+
+        if self.model_type in MODELS_IMAGE_ANALYZE and image_url:
+            user_message_content = [
+                {'type': 'text', 'text': prompt},
+                {'type': 'image_url', 'image_url': {'url': image_url}}
+            ]
+            logger.info("Preparing messages with image_url for gpt-4o.")
+        else:
+            user_message_content = prompt
+            logger.info("Preparing messages without image.")
+
+        messages.append({
+            'role': 'user',
+            'content': user_message_content
+        })
+
+        data['messages'] = messages
+        return headers, data
+
+    async def _generate_openrouter_response(self, prompt, image_url=None, conversation_history=None):
         try:
-            headers = {
-                'Authorization': f'Bearer {self.api_key}',
-                'Content-Type': 'application/json',
-            }
-            data = {
-                'model': self._get_model_name()
-            }
-
-            messages = []
-
-            if conversation_history:
-                messages.extend(conversation_history)
-
-            if self.model_type in MODELS_IMAGE_ANALYZE and image_url:
-                user_message_content = [
-                    {'type': 'text', 'text': prompt},
-                    {'type': 'image_url', 'image_url': {'url': image_url}}
-                ]
-                logger.info("Preparing messages with image_url for gpt-4o.")
-            else:
-                user_message_content = prompt
-                logger.info("Preparing messages without image.")
-
-            messages.append({
-                'role': 'user',
-                'content': user_message_content
-            })
-
-            data['messages'] = messages
-
-            async with httpx.AsyncClient() as client:
-                response = await client.post(
-                    f'{self.api_base}/chat/completions',
-                    headers=headers,
-                    json=data
-                )
+            headers, data = self._build_request(prompt, image_url, conversation_history)
+            client = get_http_client()
+
+            # نرخ، هم‌زمانی، retry و circuit breaker در rate_limit مدیریت می‌شوند
+            async with get_rate_limiter().request(self.model_type, lambda: client.post(
+                f'{self.api_base}/chat/completions',
+                headers=headers,
+                json=data
+            )) as response:
                 response.raise_for_status()
                 response_json = response.json()
 
-                if 'choices' in response_json and response_json['choices']:
-                    logger.info("Response received from OpenRouter API.")
-                    return response_json['choices'][0]['message']['content'].strip()
-                else:
-                    logger.error(f"Unexpected response format: {response_json}")
-                    return "An unexpected error occurred while processing the response."
+            if 'choices' in response_json and response_json['choices']:
+                logger.info("Response received from OpenRouter API.")
+                return response_json['choices'][0]['message']['content'].strip()
+            else:
+                logger.error(f"Unexpected response format: {response_json}")
+                return "An unexpected error occurred while processing the response."
 
         except httpx.HTTPStatusError as http_err:
             logger.error(f"HTTP error occurred: {http_err}")
             if http_err.response.status_code == 422:
                 return "An unexpected error occurred while processing the response."
             elif http_err.response.status_code == 429:
-                if retries > 0:
-                    logger.warning(f"Rate limited. Retrying after {backoff_in_seconds} seconds...")
-                    await asyncio.sleep(backoff_in_seconds)
-                    return await self._generate_openrouter_response(prompt, image_url, conversation_history, retries - 1, backoff_in_seconds * 2)
-                else:
-                    return "You have reached the rate limit. Please try again later."
+                return "You have reached the rate limit. Please try again later."
             else:
                 return "An error occurred while contacting the language model service."
+        except CircuitOpenError as e:
+            logger.warning(str(e))
+            return "The language model service is temporarily unavailable. Please try again shortly."
         except Exception as e:
             logger.error(f"An unexpected error occurred: {e}", exc_info=True)
             return "An unexpected error occurred."
 
+    async def stream_response(self, prompt, image_url=None, conversation_history=None):
+        """
+        پاسخ مدل به‌صورت تکه‌تکه (SSE با stream=True)؛ هر yield یک تکه متن است.
+        خطاها مانند generate_response به‌صورت یک پیام متنی برگردانده می‌شوند.
+        retry فقط تا قبل از شروع بدنهٔ پاسخ ممکن است.
+        """
+        try:
+            headers, data = self._build_request(prompt, image_url, conversation_history)
+            data['stream'] = True
+            client  = get_http_client()
+            request = client.build_request(
+                'POST',
+                f'{self.api_base}/chat/completions',
+                headers=headers,
+                json=data
+            )
+
+            async with get_rate_limiter().request(
+                self.model_type, lambda: client.send(request, stream=True)
+            ) as response:
+                if response.is_error:
+                    await response.aread()
+                response.raise_for_status()
+
+                async for line in response.aiter_lines():
+                    # خطوط خالی و کامنت‌های SSE (مثل ": OPENROUTER PROCESSING") رد می‌شوند
+                    if not line.startswith('data:'):
+                        continue
+                    payload = line[5:].strip()
+                    if payload == '[DONE]':
+                        break
+                    chunk = json.loads(payload)
+                    if 'error' in chunk:
+                        logger.error(f"Stream error from OpenRouter: {chunk['error']}")
+                        yield "An error occurred while contacting the language model service."
+                        return
+                    choices = chunk.get('choices') or [{}]
+                    delta = (choices[0].get('delta') or {}).get('content')
+                    if delta:
+                        yield delta
+
+        except httpx.HTTPStatusError as http_err:
+            logger.error(f"HTTP error occurred: {http_err}")
+            if http_err.response.status_code == 429:
+                yield "You have reached the rate limit. Please try again later."
+            else:
+                yield "An error occurred while contacting the language model service."
+        except CircuitOpenError as e:
+            logger.warning(str(e))
+            yield "The language model service is temporarily unavailable. Please try again shortly."
+        except Exception as e:
+            logger.error(f"An unexpected error occurred: {e}", exc_info=True)
+            yield "An unexpected error occurred."
+
     def _get_model_name(self):
         if self.model_type in MODELS:
             logger.info(f"Model name resolved: {MODELS[self.model_type]}")
@@ -108,4 +219,10 @@ class Model:
             raise ValueError("Unsupported model type.")
 
 
+@lru_cache(maxsize=None)
+def get_model(model_type='gpt-4o') -> Model:
+    """یک نمونهٔ Model برای هر نوع مدل (به‌جای ساختن نمونهٔ تازه در هر فراخوانی LLM)."""
+    return Model(model_type=model_type)
+
+
    
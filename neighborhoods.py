@@ -0,0 +1,152 @@
+# neighborhoods.py
+# ────────────────────────────────────────────────────────────────────────────
+# دیکشنری محله/بورو:
+#   در زمان نرمال‌سازی (normalize.py) از روی کالکشن listings ساخته و در
+#   کالکشن کوچک «neighborhoods» ذخیره می‌شود. در زمان جستجو متن کاربر روی
+#   همین دیکشنری درون‌حافظه (نام کانونیکال، alias، پیشوند کلمات و fuzzy)
+#   به مجموعه‌ای دقیق از کلیدها تبدیل می‌شود تا کوئری Mongo یک $in روی
+#   فیلد ایندکس‌شدهٔ norm.neighborhood باشد و نه یک regex روی کل کالکشن.
+# ────────────────────────────────────────────────────────────────────────────
+import re, difflib
+from bisect import bisect_left
+from typing import Optional, List, Dict, Iterable, Set
+
+from pymongo.collection import Collection
+
+# کدهای بورو در دیتاست فروش NYC
+BOROUGHS = {
+    "manhattan":     1,
+    "bronx":         2,
+    "the bronx":     2,
+    "brooklyn":      3,
+    "queens":        4,
+    "staten island": 5,
+}
+
+# نام‌های رایج ← عبارت جستجو روی نام‌های رسمی دیتاست
+ALIASES = {
+    "ues":                "upper east side",
+    "uws":                "upper west side",
+    "les":                "lower east side",
+    "fidi":               "financial",
+    "financial district": "financial",
+    "hells kitchen":      "clinton",
+    "nomad":              "flatiron",
+    "noho":               "greenwich village central",
+    "west village":       "greenwich village west",
+    "bed stuy":           "bedford stuyvesant",
+    "dumbo":              "downtown fulton ferry",
+    "stuy town":          "gramercy",
+    "spanish harlem":     "east harlem",
+}
+
+_NON_ALNUM = re.compile(r"[^0-9a-z]+")
+
+
+def canonical_key(name: Optional[str]) -> str:
+    """'HARLEM-CENTRAL' → 'harlem central'؛ کلید یکتای هر محله."""
+    if not name:
+        return ""
+    text = str(name).casefold().replace("'", "")
+    return _NON_ALNUM.sub(" ", text).strip()
+
+
+class NeighborhoodIndex:
+    """
+    دیکشنری درون‌حافظهٔ محله‌ها.
+    entries:  key → {"name": نام اصلی, "borough": کد بورو, "count": تعداد آگهی}
+    """
+    COLLECTION = "neighborhoods"
+
+    def __init__(self, entries: Dict[str, Dict]):
+        self.entries = entries
+        self._keys   = sorted(entries)
+        # توکن ← کلیدهایی که آن توکن را دارند (برای lookup پیشوندی کلمه‌ای)
+        self._tokens: Dict[str, Set[str]] = {}
+        for key in entries:
+            for tok in key.split():
+                self._tokens.setdefault(tok, set()).add(key)
+        self._sorted_tokens = sorted(self._tokens)
+
+    # ── ساخت/ذخیره/بارگذاری ─────────────────────────────────────────────
+    @classmethod
+    def from_listings(cls, listings: Collection) -> "NeighborhoodIndex":
+        pipeline = [{"$group": {
+            "_id":   {"name": "$NEIGHBORHOOD", "borough": "$BOROUGH"},
+            "count": {"$sum": 1},
+        }}]
+        return cls.from_groups(listings.aggregate(pipeline))
+
+    @classmethod
+    def from_groups(cls, groups: Iterable[Dict]) -> "NeighborhoodIndex":
+        entries: Dict[str, Dict] = {}
+        for g in groups:
+            key = canonical_key(g["_id"].get("name"))
+            if not key:
+                continue
+            entry = entries.setdefault(key, {"name": str(g["_id"]["name"]).strip(), "borough": None, "count": 0})
+            entry["count"] += g["count"]
+            try:
+                entry["borough"] = entry["borough"] or int(g["_id"].get("borough"))
+            except (TypeError, ValueError):
+                pass
+        return cls(entries)
+
+    @classmethod
+    def from_documents(cls, docs: Iterable[Dict]) -> "NeighborhoodIndex":
+        return cls({d["_id"]: {"name": d["name"], "borough": d.get("borough"), "count": d.get("count", 0)}
+                    for d in docs})
+
+    @classmethod
+    def load(cls, col: Collection) -> "NeighborhoodIndex":
+        return cls.from_documents(col.find({}))
+
+    def to_documents(self) -> List[Dict]:
+        return [{"_id": key, **entry} for key, entry in self.entries.items()]
+
+    def save(self, col: Collection) -> None:
+        col.delete_many({})
+        docs = self.to_documents()
+        if docs:
+            col.insert_many(docs)
+
+    # ── تبدیل متن کاربر به کلیدها ───────────────────────────────────────
+    def _token_prefix(self, token: str) -> Set[str]:
+        keys: Set[str] = set()
+        i = bisect_left(self._sorted_tokens, token)
+        while i < len(self._sorted_tokens) and self._sorted_tokens[i].startswith(token):
+            keys |= self._tokens[self._sorted_tokens[i]]
+            i += 1
+        return keys
+
+    def _match(self, query: str) -> Set[str]:
+        """کلیدهایی که هر کلمهٔ query پیشوند یکی از کلمات آن‌هاست."""
+        if query in self.entries:
+            return {query}
+        keys: Optional[Set[str]] = None
+        for tok in query.split():
+            hits = self._token_prefix(tok)
+            keys = hits if keys is None else keys & hits
+            if not keys:
+                return set()
+        return keys or set()
+
+    def resolve(self, text: Optional[str]) -> List[str]:
+        """
+        متن آزاد کاربر ← فهرست کلیدهای کانونیکال.
+        ترتیب: نام بورو، alias، تطابق دقیق/پیشوندی، و در نهایت fuzzy.
+        """
+        query = canonical_key(text)
+        if not query:
+            return []
+
+        if query in BOROUGHS:
+            code = BOROUGHS[query]
+            return sorted(k for k, e in self.entries.items() if e.get("borough") == code)
+
+        keys = self._match(ALIASES.get(query, query))
+        if not keys:
+            close = difflib.get_close_matches(query, [*self._keys, *ALIASES], n=3, cutoff=0.8)
+            for c in close:
+                keys |= self._match(ALIASES.get(c, c))
+        return sorted(keys)
@@ -0,0 +1,102 @@
+# normalize.py
+# ────────────────────────────────────────────────────────────────────────────
+# پاس نرمال‌سازی کالکشن listings:
+#   فیلدهای عددیِ دیتاست NYC (که به‌صورت رشته با جداکنندهٔ هزار ذخیره شده‌اند)
+#   یک‌بار تبدیل و در زیرسند «norm» کنار فیلدهای خام نوشته می‌شوند تا فیلتر،
+#   مرتب‌سازی و limit در خود MongoDB و روی ایندکس انجام شود.
+#   در همین پاس کلید کانونیکال محله نوشته و دیکشنری محله‌ها
+#   (کالکشن neighborhoods) بازسازی می‌شود.
+#
+#   اجرا:  python normalize.py          (فقط اسناد نرمال‌نشده)
+#          python normalize.py --all    (بازسازی کامل norm برای همهٔ اسناد)
+#
+# اسنادی که بعداً عوض می‌شوند در مسیر نوشتن تازه می‌شوند: ingest (مرحلهٔ
+# prepare) و live_indexer برای هر سندی که می‌خوانند refresh_norm را صدا می‌زنند.
+# ────────────────────────────────────────────────────────────────────────────
+import os, sys, logging
+from typing import Dict, Iterable
+
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne, ASCENDING
+from pymongo.collection import Collection
+
+from neighborhoods  import NeighborhoodIndex
+from listing_schema import parse_listing, RAW_FIELDS
+from result_cache   import bump_index_version
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# نام زیرسندی که مقادیر تایپ‌شده در آن نگه داشته می‌شود
+NORM = "norm"
+
+# کلیدهای مرتب‌سازی؛ _id به‌عنوان tie-breaker برای صفحه‌بندی keyset
+SORT_FIELDS = ("sale_price", "price_per_sqft", "year_built", "gross_square_feet")
+
+# ایندکس‌های ترکیبی که StructuredSearch روی آن‌ها حساب می‌کند
+INDEXES = [
+    *[[(f"{NORM}.{f}", ASCENDING), ("_id", ASCENDING)] for f in SORT_FIELDS],
+    *[[(f"{NORM}.neighborhood", ASCENDING), (f"{NORM}.{f}", ASCENDING), ("_id", ASCENDING)] for f in SORT_FIELDS],
+    [(f"{NORM}.gross_square_feet", ASCENDING), (f"{NORM}.sale_price", ASCENDING)],
+]
+
+
+def normalize_document(doc: Dict) -> Dict:
+    """ساخت زیرسند norm برای یک سند خام (فقط مقادیر قابل‌تبدیل نوشته می‌شوند؛ تعریف فیلدها در listing_schema)."""
+    return parse_listing(doc)
+
+
+def refresh_norm(col: Collection, docs: Iterable[Dict], batch_size: int = 1000) -> int:
+    """
+    norm اسنادی که با فیلدهای خامشان نمی‌خواند (قیمت/مساحت عوض شده یا norm
+    ندارند) را بازنویسی می‌کند. docs باید فیلدهای RAW_FIELDS و خود norm را داشته
+    باشند. فقط norm متفاوت نوشته می‌شود، پس رویداد update همین نوشتن در change
+    stream دوباره نوشتنی ایجاد نمی‌کند.
+    """
+    ops = [
+        UpdateOne({"_id": doc["_id"]}, {"$set": {NORM: norm}})
+        for doc in docs
+        for norm in (normalize_document(doc),)
+        if doc.get(NORM) != norm
+    ]
+    updated = 0
+    for i in range(0, len(ops), batch_size):
+        updated += col.bulk_write(ops[i:i + batch_size], ordered=False).modified_count
+    return updated
+
+
+def ensure_indexes(col: Collection) -> None:
+    for keys in INDEXES:
+        col.create_index(keys)
+
+
+def normalize_collection(col: Collection, only_missing: bool = True, batch_size: int = 1000) -> int:
+    """
+    پیمایش کالکشن و نوشتن زیرسند norm به‌صورت bulk، سپس بازسازی دیکشنری محله‌ها.
+    با only_missing=True فقط اسنادی که هنوز نرمال نشده‌اند پردازش می‌شوند.
+    """
+    query = {NORM: {"$exists": False}} if only_missing else {}
+    projection = {raw: 1 for raw in RAW_FIELDS}
+
+    ops, updated = [], 0
+    for doc in col.find(query, projection=projection, batch_size=batch_size):
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": {NORM: normalize_document(doc)}}))
+        if len(ops) >= batch_size:
+            updated += col.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        updated += col.bulk_write(ops, ordered=False).modified_count
+
+    ensure_indexes(col)
+    NeighborhoodIndex.from_listings(col).save(col.database[NeighborhoodIndex.COLLECTION])
+    bump_index_version(col.database)
+    return updated
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(levelname)s] %(message)s")
+    mongo = MongoClient(os.getenv("MONGODB_URI"))
+    col   = mongo[os.getenv("MONGO_DB_NAME", "manhatan")]["listings"]
+    n = normalize_collection(col, only_missing="--all" not in sys.argv)
+    logger.info(f"✅ Normalized {n} listings.")
@@ -0,0 +1,200 @@
+# rate_limit.py
+# ────────────────────────────────────────────────────────────────────────────
+# زمان‌بندی مشترک درخواست‌های LLM (OpenRouter) در هر پروسه:
+#   • token bucket برای هر مدل (نرخ پایدار + burst)
+#   • سقف درخواست‌های هم‌زمان (semaphore سراسری)
+#   • retry با backoff تصادفی (full jitter) که Retry-After سرور را رعایت می‌کند
+#   • circuit breaker: بعد از چند شکست پیاپی درخواست‌ها تا پایان cooldown
+#     فوراً رد می‌شوند تا به سرویسی که از دسترس خارج است فشار نیاید.
+# ────────────────────────────────────────────────────────────────────────────
+import os, time, random, asyncio, logging
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Optional, AsyncIterator
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+LLM_RATE_PER_SECOND   = float(os.getenv("LLM_RATE_PER_SECOND", "5"))
+LLM_BURST             = int(os.getenv("LLM_BURST", "10"))
+LLM_MAX_IN_FLIGHT     = int(os.getenv("LLM_MAX_IN_FLIGHT", "16"))
+LLM_MAX_RETRIES       = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE      = float(os.getenv("LLM_BACKOFF_BASE", "1.0"))
+LLM_BACKOFF_MAX       = float(os.getenv("LLM_BACKOFF_MAX", "30"))
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_COOLDOWN  = float(os.getenv("LLM_BREAKER_COOLDOWN", "30"))
+
+# کدهایی که ارزش تکرار دارند
+RETRY_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(Exception):
+    """سرویس LLM موقتاً در دسترس فرض نمی‌شود (circuit breaker باز است)."""
+
+
+class TokenBucket:
+    """
+    نرخ rate توکن در ثانیه با ظرفیت capacity. توکن‌ها رزرو می‌شوند (موجودی می‌تواند
+    منفی شود) پس درخواست‌های منتظر به ترتیب ورود و بدون قفل نوبت می‌گیرند.
+    """
+    def __init__(self, rate: float = LLM_RATE_PER_SECOND, capacity: int = LLM_BURST):
+        self.rate     = rate
+        self.capacity = capacity
+        self.tokens   = float(capacity)
+        self._updated = time.monotonic()
+
+    async def acquire(self) -> None:
+        now = time.monotonic()
+        self.tokens   = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        self.tokens  -= 1
+        if self.tokens < 0:
+            await asyncio.sleep(-self.tokens / self.rate)
+
+
+class CircuitBreaker:
+    """closed → (threshold شکست پیاپی) → open → (cooldown) → half-open: یک درخواست آزمایشی."""
+    def __init__(self, threshold: int = LLM_BREAKER_THRESHOLD, cooldown: float = LLM_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown  = cooldown
+        self.failures  = 0
+        self.opened_at: Optional[float] = None
+        self._probing  = False
+
+    def allow(self) -> bool:
+        if self.opened_at is None:
+            return True
+        if time.monotonic() - self.opened_at >= self.cooldown and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self) -> None:
+        self.failures, self.opened_at, self._probing = 0, None, False
+
+    def record_failure(self) -> None:
+        self.failures += 1
+        if self._probing or self.failures >= self.threshold:
+            if self.opened_at is None or self._probing:
+                logger.warning(f"LLM circuit opened after {self.failures} consecutive failures")
+            self.opened_at, self._probing = time.monotonic(), False
+
+    def abandon_probe(self) -> None:
+        """درخواست آزمایشی بدون نتیجه تمام شد (لغو یا خطای غیرشبکه‌ای): breaker با cooldown تازه باز می‌ماند."""
+        if self._probing:
+            self.opened_at, self._probing = time.monotonic(), False
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After به ثانیه (عدد یا تاریخ HTTP)."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """full jitter روی 2^attempt؛ اگر سرور Retry-After داده باشد حداقل همان‌قدر صبر می‌شود."""
+    delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+    if retry_after is not None:
+        delay = min(LLM_BACKOFF_MAX, retry_after) + random.uniform(0, LLM_BACKOFF_BASE)
+    return delay
+
+
+class RateLimiter:
+    def __init__(
+        self,
+        max_in_flight: int = LLM_MAX_IN_FLIGHT,
+        max_retries:   int = LLM_MAX_RETRIES,
+    ):
+        self.max_retries = max_retries
+        self._slots      = asyncio.Semaphore(max_in_flight)
+        self._buckets:  Dict[str, TokenBucket]    = {}
+        self._breakers: Dict[str, CircuitBreaker] = {}
+
+    def bucket(self, model: str) -> TokenBucket:
+        return self._buckets.setdefault(model, TokenBucket())
+
+    def breaker(self, model: str) -> CircuitBreaker:
+        return self._breakers.setdefault(model, CircuitBreaker())
+
+    @asynccontextmanager
+    async def request(
+        self, model: str, send: Callable[[], Awaitable[httpx.Response]]
+    ) -> AsyncIterator[httpx.Response]:
+        """
+        send را با رعایت نرخ، سقف هم‌زمانی و retry اجرا می‌کند و پاسخ نهایی را
+        (موفق، یا آخرین پاسخ خطا) تحویل می‌دهد. جایگاه هم‌زمانی تا پایان بلوک
+        with نگه داشته می‌شود تا پاسخ‌های استریمی هم شمرده شوند؛ در زمان
+        انتظار backoff جایگاه آزاد است.
+        """
+        breaker = self.breaker(model)
+        for attempt in range(self.max_retries + 1):
+            if not breaker.allow():
+                raise CircuitOpenError(f"LLM circuit open for model {model}")
+            # درخواست آزمایشی half-open باید در هر مسیر خروج (حتی لغو) تکلیفش روشن شود
+            probe = breaker.opened_at is not None
+            try:
+                await self.bucket(model).acquire()
+
+                await self._slots.acquire()
+                try:
+                    response = await send()
+                except httpx.TransportError as e:
+                    self._slots.release()
+                    breaker.record_failure()
+                    probe = False
+                    if attempt == self.max_retries:
+                        raise
+                    delay = backoff_delay(attempt)
+                    logger.warning(f"LLM transport error ({e!r}); retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                    continue
+                except BaseException:
+                    self._slots.release()
+                    raise
+
+                if response.status_code in RETRY_STATUS and attempt < self.max_retries:
+                    await response.aclose()
+                    self._slots.release()
+                    breaker.record_failure()
+                    probe = False
+                    delay = backoff_delay(attempt, parse_retry_after(response.headers.get("Retry-After")))
+                    logger.warning(f"LLM returned {response.status_code}; retrying in {delay:.1f}s")
+                    await asyncio.sleep(delay)
+                    continue
+
+                if response.status_code in RETRY_STATUS:
+                    breaker.record_failure()
+                else:
+                    breaker.record_success()
+                probe = False
+            finally:
+                if probe:
+                    breaker.abandon_probe()
+            try:
+                yield response
+            finally:
+                await response.aclose()
+                self._slots.release()
+            return
+
+
+_limiter: Optional[RateLimiter] = None
+_limiter_loop: Optional[asyncio.AbstractEventLoop] = None
+
+def get_rate_limiter() -> RateLimiter:
+    """limiter مشترک event-loop فعلی (مثل get_http_client در models.py)."""
+    global _limiter, _limiter_loop
+    loop = asyncio.get_running_loop()
+    if _limiter is None or _limiter_loop is not loop:
+        _limiter, _limiter_loop = RateLimiter(), loop
+    return _limiter
@@ -0,0 +1,127 @@
+# result_cache.py
+# ────────────────────────────────────────────────────────────────────────────
+# کش نتایج جستجو (ساختاری و معنایی) جلوی Mongo و Pinecone:
+#   • کلید: نوع جستجو + پارامترهای نرمال‌شده (ترتیب، فاصله و حروف بی‌اثرند)
+#   • انقضا: TTL ثابت + «نسخهٔ ایندکس»؛ ingest / normalize / live_indexer بعد
+#     از هر تغییر داده سند {_id: "index_version"} در کالکشن meta را $inc می‌کنند
+#     و هر ورودیِ ساخته‌شده با نسخهٔ قدیمی‌تر دیگر برگردانده نمی‌شود.
+#   نسخه خودش هر INDEX_VERSION_REFRESH ثانیه یک‌بار از Mongo خوانده می‌شود تا
+#   hit کش بدون هیچ رفت‌وبرگشت شبکه‌ای باشد.
+# ────────────────────────────────────────────────────────────────────────────
+import os, json, time, threading
+from collections import OrderedDict
+from typing import Optional, Any, Dict, Tuple
+
+from pymongo.collection import Collection
+
+from neighborhoods import canonical_key
+
+RESULT_CACHE_TTL      = float(os.getenv("RESULT_CACHE_TTL", "300"))
+RESULT_CACHE_SIZE     = int(os.getenv("RESULT_CACHE_SIZE", "2048"))
+INDEX_VERSION_REFRESH = float(os.getenv("INDEX_VERSION_REFRESH", "5"))
+
+META_COLLECTION  = "meta"
+INDEX_VERSION_ID = "index_version"
+
+
+def bump_index_version(db) -> None:
+    """بعد از هر تغییر در داده/ایندکس صدا زده می‌شود تا کش نتایج باطل شود."""
+    db[META_COLLECTION].update_one({"_id": INDEX_VERSION_ID}, {"$inc": {"v": 1}}, upsert=True)
+
+
+def _normalize(kind: str, name: str, value: Any) -> Any:
+    if isinstance(value, str):
+        value = " ".join(value.split())
+        # همهٔ مسیرها (ساختاری، و فیلتر برداری listing_schema.vector_filter در
+        # semantic/hybrid) محله/بورو را با NeighborhoodIndex.resolve از روی
+        # canonical_key متن به کلیدهای دقیق تبدیل می‌کنند؛ پس همان کلید کافی است
+        if name in ("neighborhood", "city"):
+            return canonical_key(value) or value
+        return value
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def make_key(kind: str, params: Dict[str, Any]) -> str:
+    """کلید پایدار: پارامترهای None حذف و رشته‌ها نرمال می‌شوند."""
+    norm = {k: _normalize(kind, k, v) for k, v in params.items() if v is not None}
+    return kind + ":" + json.dumps(norm, sort_keys=True, default=str, ensure_ascii=False)
+
+
+class IndexVersion:
+    """
+    نسخهٔ فعلی ایندکس با کش کوتاه‌مدت. meta: کالکشن sync، ameta: کالکشن async (اختیاری).
+    خطای خواندن نسخه جستجو را متوقف نمی‌کند؛ آخرین مقدار معلوم استفاده می‌شود.
+    """
+    def __init__(self, meta: Optional[Collection] = None, ameta=None, refresh: float = INDEX_VERSION_REFRESH):
+        self.meta     = meta
+        self.ameta    = ameta
+        self.refresh  = refresh
+        self._value   = 0
+        self._read_at = float("-inf")
+
+    def _fresh(self) -> bool:
+        return time.monotonic() - self._read_at < self.refresh
+
+    def _store(self, doc: Optional[Dict]) -> int:
+        self._value   = (doc or {}).get("v", 0)
+        self._read_at = time.monotonic()
+        return self._value
+
+    def get(self) -> int:
+        if self._fresh() or self.meta is None:
+            return self._value
+        try:
+            return self._store(self.meta.find_one({"_id": INDEX_VERSION_ID}))
+        except Exception:
+            self._read_at = time.monotonic()
+            return self._value
+
+    async def aget(self) -> int:
+        if self._fresh():
+            return self._value
+        if self.ameta is None:
+            return self.get()
+        try:
+            return self._store(await self.ameta.find_one({"_id": INDEX_VERSION_ID}))
+        except Exception:
+            self._read_at = time.monotonic()
+            return self._value
+
+
+class ResultCache:
+    """
+    LRU با TTL و برچسب نسخه. مقدار برگشتی همان شیء ذخیره‌شده است؛
+    فراخوانی‌کننده نباید آن را تغییر دهد.
+    """
+    def __init__(self, ttl: float = RESULT_CACHE_TTL, max_items: int = RESULT_CACHE_SIZE):
+        self.ttl       = ttl
+        self.max_items = max_items
+        self._items: "OrderedDict[str, Tuple[float, int, Any]]" = OrderedDict()
+        self._lock     = threading.Lock()
+        self.hits      = 0
+        self.misses    = 0
+
+    def get(self, key: str, version: int) -> Optional[Any]:
+        with self._lock:
+            item = self._items.get(key)
+            if item is None or item[0] < time.monotonic() or item[1] != version:
+                if item is not None:
+                    del self._items[key]
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[2]
+
+    def put(self, key: str, version: int, value: Any) -> None:
+        with self._lock:
+            self._items[key] = (time.monotonic() + self.ttl, version, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
@@ -1,12 +1,14 @@
-from langchain_pinecone import PineconeVectorStore
+from vector_backend import Hit
+from listing_schema import ref_mongo_id
 
 class SemanticSearch:
     """
-    پرس‌وجوی معنایی روی Pinecone (Vector-DB).
-    متادیتاهایی که در ingest.py ذخیره می‌کنیم باید دقیقاً همین کلیدها را داشته باشد.
+    پرس‌وجوی معنایی روی backend برداری (Pinecone یا ایندکس محلی، vector_backend.py).
+    خروجی فقط (id, mongo_id, score) است؛ متادیتای بردار همان کلیدهای listing_schema.
     """
-    def __init__(self, vector_store: PineconeVectorStore):
-        self.vs = vector_store
+    def __init__(self, backend, embeddings):
+        self.backend    = backend
+        self.embeddings = embeddings
 
     # --------------------------------------------------------------------- #
     def search(
@@ -16,34 +18,38 @@ class SemanticSearch:
         filter_dict: dict | None = None
     ) -> list[dict]:
         """
-        filter_dict می‌تواند هرکدام از فیلدهای متادیتا مثل
+        filter_dict روی فیلدهای قابل فیلتر listing_schema است، مثل
         {'borough': 1, 'sale_price': {'$lte': 1_000_000}}
-        باشد (سینتکس Pinecone).
+        (سینتکس Pinecone؛ ایندکس محلی هم همین را می‌فهمد). ترجمهٔ فیلترهای
+        ساختاری به این شکل: listing_schema.vector_filter.
         """
-        docs = self.vs.similarity_search(
-            query=query,
-            k=k,
-            filter=filter_dict or {}
-        )
-        results: list[dict] = []
-        for d in docs:
-            meta = d.metadata or {}
-            results.append({
-                "id":            meta.get("id"),
-                "borough":       meta.get("borough"),
-                "neighborhood":  meta.get("neighborhood"),
-                "address":       meta.get("address"),
-                "sale_price":    meta.get("sale_price"),
-                "gross_sqft":    meta.get("gross_square_feet"),
-                "year_built":    meta.get("year_built"),
-                "snippet": (
-                    (d.page_content or "")[:200] + "…"
-                    if d.page_content else meta.get("snippet", "")
-                ),
-            })
-        return results
+        vector = self.embeddings.embed_query(query)
+        hits = self.backend.query(vector, k=k, filter=filter_dict or None)
+        return [self._to_result(h) for h in hits]
 
+    async def asearch(
+        self,
+        query: str,
+        k: int = 5,
+        filter_dict: dict | None = None
+    ) -> list[dict]:
+        """
+        نسخهٔ ناهمگام search: embedding پرسش با aembed_query و کوئری backend
+        با aquery انجام می‌شود تا هیچ‌کدام event-loop را مسدود نکنند.
+        """
+        vector = await self.embeddings.aembed_query(query)
+        hits = await self.backend.aquery(vector, k=k, filter=filter_dict or None)
+        return [self._to_result(h) for h in hits]
 
+    def _to_result(self, h: Hit) -> dict:
+        # متادیتا فقط شناسه و فیلدهای قابل فیلتر است؛ فیلدهای نمایشی را
+        # SearchService با hydration.Hydrator از Mongo اضافه می‌کند
+        meta = h.metadata or {}
+        return {
+            "id":       meta.get("id", h.id),
+            "mongo_id": ref_mongo_id(meta, h.id),
+            "score":    h.score,
+        }
 
 
 # # ─── search_semantic.py ───────────────────────────────────────────────────────
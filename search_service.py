@@ -1,20 +1,357 @@
 # search_service.py
-from search_structured import StructuredSearch
+import os, time, asyncio, logging
+from typing import Optional, Dict, List, AsyncIterator, Tuple
+
+from search_structured import StructuredSearch, AsyncStructuredSearch
 from search_semantic  import SemanticSearch
+from neighborhoods    import NeighborhoodIndex
+from result_cache     import ResultCache, IndexVersion, make_key, META_COLLECTION
+from lexical_index    import LexicalIndex, LexicalHit
+from listing_schema   import vector_filter
+from hydration        import Hydrator, hydrate
+
+logger = logging.getLogger(__name__)
+
+# سقف زمان هر منبع در بازیابی هم‌زمان (ثانیه)
+STRUCTURED_TIMEOUT = float(os.getenv("STRUCTURED_TIMEOUT", "2.0"))
+SEMANTIC_TIMEOUT   = float(os.getenv("SEMANTIC_TIMEOUT",   "3.0"))
+LEXICAL_TIMEOUT    = float(os.getenv("LEXICAL_TIMEOUT",    "1.0"))
+
+# جستجوی ترکیبی: ثابت k در reciprocal rank fusion و تعداد نامزد هر منبع به ازای هر نتیجه
+RRF_K             = 60
+HYBRID_CANDIDATES = 4
+# فاصلهٔ بررسی دوبارهٔ پر بودن ایندکس واژگانی (ثانیه)
+LEXICAL_CHECK_INTERVAL = float(os.getenv("LEXICAL_CHECK_INTERVAL", "30"))
+
+
+def rrf(rankings: List[List[str]], k: int = RRF_K) -> List[Tuple[str, float]]:
+    """reciprocal rank fusion: امتیاز هر id = Σ 1/(k + رتبه) روی همهٔ فهرست‌ها."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, i in enumerate(ranking, 1):
+            scores[i] = scores.get(i, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda kv: kv[1], reverse=True)
+
 
 class SearchService:
-    def __init__(self, listings_collection, vector_store, semantic_layer):
+    """
+    جستجوی ساختاری فقط به Mongo نیاز دارد؛ لایهٔ معنایی (vector_store،
+    semantic_layer، ایندکس واژگانی) می‌تواند None باشد و بعداً با
+    attach_semantic وصل شود (AppContainer وقتی backend برداری آماده شد).
+    """
+    def __init__(
+        self,
+        listings_collection,
+        vector_store,
+        semantic_layer,
+        async_listings_collection=None,
+        result_cache: Optional[ResultCache] = None,
+        lexical_index: Optional[LexicalIndex] = None,
+    ):
         self.structured   = StructuredSearch(listings_collection)
+        self.astructured  = (
+            AsyncStructuredSearch(async_listings_collection)
+            if async_listings_collection is not None else None
+        )
+        self.vector_store = vector_store
+        self.sem          = semantic_layer
+        self.lexical      = lexical_index
+        self._lexical_ready   = False
+        self._lexical_checked = float("-inf")
+        # فیلدهای نمایشی نتایج برداری/واژگانی (متادیتای بردار فقط شناسه و فیلتر دارد)
+        self.hydrator     = Hydrator(self.structured, self.astructured)
+
+        # کش نتایج؛ با تغییر نسخهٔ ایندکس (bump در ingest/normalize) باطل می‌شود
+        self.cache   = result_cache or ResultCache()
+        self.version = IndexVersion(
+            listings_collection.database[META_COLLECTION],
+            async_listings_collection.database[META_COLLECTION] if async_listings_collection is not None else None,
+        )
+
+    def attach_semantic(self, vector_store, semantic_layer, lexical_index: Optional[LexicalIndex] = None) -> None:
         self.vector_store = vector_store
         self.sem          = semantic_layer
+        self.lexical      = lexical_index
+        self._lexical_checked = float("-inf")
+
+    @property
+    def semantic_ready(self) -> bool:
+        return self.sem is not None
+
+    def _require_semantic(self) -> None:
+        if self.sem is None:
+            raise RuntimeError("semantic search is not available yet")
+
+    def _cached(self, kind: str, params: Dict, compute):
+        version = self.version.get()
+        key     = make_key(kind, params)
+        hit     = self.cache.get(key, version)
+        if hit is not None:
+            return hit
+        result = compute()
+        self.cache.put(key, version, result)
+        return result
+
+    async def _acached(self, kind: str, params: Dict, compute, partial: bool = False):
+        """
+        partial: compute خروجی (نتیجه، کامل؟) می‌دهد و نتیجهٔ ناقص (منبعی که
+        timeout خورده یا خطا داده) کش نمی‌شود تا درخواست بعدی دوباره امتحان کند.
+        """
+        version = await self.version.aget()
+        key     = make_key(kind, params)
+        hit     = self.cache.get(key, version)
+        if hit is not None:
+            return (hit, True) if partial else hit
+        out = await compute()
+        result, complete = out if partial else (out, True)
+        if complete:
+            self.cache.put(key, version, result)
+        return out
 
     # لایهٔ ساختاری
     def structured_search(self, **kwargs):
-        return self.structured.search(**kwargs)
+        return self._cached("structured", kwargs, lambda: self.structured.search(**kwargs))
+
+    def structured_search_page(self, **kwargs):
+        return self._cached("structured_page", kwargs, lambda: self.structured.search_page(**kwargs))
+
+    # لایهٔ ساختاری (ناهمگام) — بدون کلاینت async، نسخهٔ sync در thread اجرا می‌شود
+    async def astructured_search(self, **kwargs):
+        if self.astructured is None:
+            compute = lambda: asyncio.to_thread(self.structured.search, **kwargs)
+        else:
+            compute = lambda: self.astructured.search(**kwargs)
+        return await self._acached("structured", kwargs, compute)
+
+    async def astructured_search_page(self, **kwargs):
+        if self.astructured is None:
+            compute = lambda: asyncio.to_thread(self.structured.search_page, **kwargs)
+        else:
+            compute = lambda: self.astructured.search_page(**kwargs)
+        return await self._acached("structured_page", kwargs, compute)
+
+    def structured_count(self, **kwargs) -> int:
+        return self._cached("structured_count", kwargs, lambda: self.structured.count(**kwargs))
+
+    async def astructured_count(self, **kwargs) -> int:
+        if self.astructured is None:
+            compute = lambda: asyncio.to_thread(self.structured.count, **kwargs)
+        else:
+            compute = lambda: self.astructured.count(**kwargs)
+        return await self._acached("structured_count", kwargs, compute)
+
+    async def aneighborhoods(self) -> NeighborhoodIndex:
+        """دیکشنری محله‌ها (تازه‌شده) برای تشخیص نام محله در متن پرسش."""
+        if self.astructured is None:
+            return await asyncio.to_thread(lambda: self.structured.neighborhoods)
+        await self.astructured.refresh_neighborhoods()
+        return self.astructured.neighborhoods
+
+    # لایهٔ معنایی — filters همان فیلترهای ساختاری است و به فیلتر متادیتای
+    # ایندکس برداری ترجمه می‌شود (محدود کردن نامزدها داخل خود جستجوی ANN)
+    def _vector_filter(self, filters: Dict) -> Optional[Dict]:
+        if not filters:
+            return None
+        needs_names = filters.get("neighborhood") or filters.get("city")
+        return vector_filter(**filters, neighborhoods=self.structured.neighborhoods if needs_names else None)
+
+    async def _avector_filter(self, filters: Dict) -> Optional[Dict]:
+        if not filters:
+            return None
+        needs_names = filters.get("neighborhood") or filters.get("city")
+        return vector_filter(**filters, neighborhoods=await self.aneighborhoods() if needs_names else None)
 
-    # لایهٔ معنایی
     def semantic_search(self, query: str, k: int = 5, **filters):
-        return self.sem.search(query, k, filter_dict=filters or None)
+        filters = {name: v for name, v in filters.items() if v is not None}
+
+        def compute():
+            self._require_semantic()
+            results = self.sem.search(query, k, filter_dict=self._vector_filter(filters))
+            rows = self.hydrator.get([(r["id"], r["mongo_id"]) for r in results], self.version.get())
+            return hydrate(results, rows)
+
+        return self._cached("semantic", {"query": query, "k": k, **filters}, compute)
+
+    async def asemantic_search(self, query: str, k: int = 5, **filters):
+        filters = {name: v for name, v in filters.items() if v is not None}
+
+        async def compute():
+            self._require_semantic()
+            results = await self.sem.asearch(query, k, filter_dict=await self._avector_filter(filters))
+            rows = await self.hydrator.aget([(r["id"], r["mongo_id"]) for r in results], await self.version.aget())
+            return hydrate(results, rows)
+
+        return await self._acached("semantic", {"query": query, "k": k, **filters}, compute)
+
+    # ── جستجوی ترکیبی واژگانی (BM25) + معنایی ─────────────────────────────
+    def hybrid_ready(self) -> bool:
+        """
+        جستجوی ترکیبی فقط وقتی ایندکس واژگانی هست و خالی نیست؛ پادی که فایل
+        ایندکسر (LEXICAL_INDEX_PATH) را نمی‌بیند فقط جستجوی برداری دارد.
+        پر شدن ایندکس هر LEXICAL_CHECK_INTERVAL ثانیه دوباره بررسی می‌شود.
+        """
+        if self.lexical is None:
+            return False
+        now = time.monotonic()
+        if now - self._lexical_checked >= LEXICAL_CHECK_INTERVAL:
+            self._lexical_checked = now
+            try:
+                self._lexical_ready = len(self.lexical) > 0
+            except Exception as e:
+                logger.warning(f"lexical index unavailable: {e}")
+                self._lexical_ready = False
+        return self._lexical_ready
+
+    @staticmethod
+    def _fuse(lexical: List[LexicalHit], semantic: List[Dict], filtered: bool) -> Tuple[List[Tuple[str, float]], Dict, List]:
+        """
+        رتبه‌بندی RRF، _id مونگوی همهٔ نامزدها و (با فیلتر) _id نامزدهای فقط‌واژگانی
+        که باید با فیلترها در Mongo بررسی شوند؛ نامزدهای برداری داخل ایندکس فیلتر شده‌اند.
+        """
+        fused = rrf([[h.id for h in lexical], [r["id"] for r in semantic]])
+        refs  = {h.id: h.mongo_id for h in lexical}
+        refs.update({r["id"]: r["mongo_id"] for r in semantic})
+        sem_ids = {r["id"] for r in semantic}
+        unverified = [refs[i] for i, _ in fused if i not in sem_ids] if filtered else []
+        return fused, refs, unverified
+
+    @staticmethod
+    def _candidates(fused, refs: Dict, semantic: List[Dict], verified: Optional[Dict]) -> List[Tuple[str, object]]:
+        sem_ids = {r["id"] for r in semantic}
+        return [(i, refs[i]) for i, _ in fused if verified is None or i in sem_ids or i in verified]
+
+    @staticmethod
+    def _merge(fused, rows: Dict[str, Dict], lexical: List[LexicalHit], semantic: List[Dict], k: int) -> List[Dict]:
+        lex_ids = {h.id for h in lexical}
+        sem_ids = {r["id"] for r in semantic}
+        out = []
+        for i, score in fused:
+            hit = rows.get(i)
+            if hit is None:
+                continue
+            sources = [s for s, ids in (("lexical", lex_ids), ("semantic", sem_ids)) if i in ids]
+            out.append({**hit, "score": round(score, 6), "sources": sources})
+            if len(out) == k:
+                break
+        return out
+
+    def hybrid_search(self, query: str, k: int = 5, **filters) -> List[Dict]:
+        """
+        BM25 روی توضیحات/آدرس + جستجوی برداری، ادغام با RRF. filters همان فیلترهای
+        ساختاری (neighborhood, max_price, min_sqft) است: داخل جستجوی برداری به‌صورت
+        فیلتر متادیتا و برای نامزدهای فقط‌واژگانی با یک $in در Mongo. فیلدهای
+        نمایشی همهٔ نامزدها از Hydrator (LRU + یک $in برای بقیه) می‌آیند.
+        """
+        filters = {name: v for name, v in filters.items() if v is not None}
+
+        def compute():
+            self._require_semantic()
+            n = k * HYBRID_CANDIDATES
+            lexical  = self.lexical.search(query, n)
+            semantic = self.sem.search(query, n, filter_dict=self._vector_filter(filters))
+            fused, refs, unverified = self._fuse(lexical, semantic, bool(filters))
+            version  = self.version.get()
+            verified = None
+            if filters:
+                verified = self.structured.find_by_ids(unverified, **filters)
+                self.hydrator.remember(verified, version)
+            rows = self.hydrator.get(self._candidates(fused, refs, semantic, verified), version)
+            return self._merge(fused, rows, lexical, semantic, k)
+
+        return self._cached("hybrid", {"query": query, "k": k, **filters}, compute)
+
+    async def ahybrid_search(self, query: str, k: int = 5, **filters) -> List[Dict]:
+        """نسخهٔ ناهمگام: BM25 (SQLite، در thread) و جستجوی برداری هم‌زمان اجرا می‌شوند."""
+        results, _ = await self._ahybrid(query, k, **filters)
+        return results
+
+    async def _ahybrid(self, query: str, k: int = 5, **filters) -> Tuple[List[Dict], bool]:
+        """(نتایج، کامل؟)؛ اگر یکی از دو منبع جا بماند نتیجهٔ تک‌منبعی برمی‌گردد ولی کش نمی‌شود."""
+        filters = {name: v for name, v in filters.items() if v is not None}
+
+        async def compute():
+            self._require_semantic()
+            n = k * HYBRID_CANDIDATES
+            spec = await self._avector_filter(filters)
+            (_, lexical, lex_ok), (_, semantic, sem_ok) = await asyncio.gather(
+                self._bounded("lexical",  asyncio.to_thread(self.lexical.search, query, n), LEXICAL_TIMEOUT),
+                self._bounded("semantic", self.sem.asearch(query, n, filter_dict=spec),    SEMANTIC_TIMEOUT),
+            )
+            fused, refs, unverified = self._fuse(lexical, semantic, bool(filters))
+            version  = await self.version.aget()
+            verified = None
+            if filters:
+                if self.astructured is None:
+                    verified = await asyncio.to_thread(self.structured.find_by_ids, unverified, **filters)
+                else:
+                    verified = await self.astructured.find_by_ids(unverified, **filters)
+                self.hydrator.remember(verified, version)
+            rows = await self.hydrator.aget(self._candidates(fused, refs, semantic, verified), version)
+            return self._merge(fused, rows, lexical, semantic, k), lex_ok and sem_ok
+
+        return await self._acached("hybrid", {"query": query, "k": k, **filters}, compute, partial=True)
+
+    # ── بازیابی هم‌زمان ساختاری + معنایی ──────────────────────────────────
+    async def _bounded(self, source: str, coro, timeout: float, partial: bool = False) -> Tuple[str, List[Dict], bool]:
+        """
+        (source, results, کامل؟)؛ منبعی که timeout بخورد یا خطا بدهد با فهرست خالی
+        و complete=False برمی‌گردد. با partial خود coro (نتایج، کامل؟) می‌دهد.
+        """
+        try:
+            out = await asyncio.wait_for(coro, timeout)
+            results, complete = out if partial else (out, True)
+            return source, results, complete
+        except asyncio.TimeoutError:
+            logger.warning(f"{source} retrieval timed out after {timeout}s; continuing without it")
+        except Exception as e:
+            logger.warning(f"{source} retrieval failed: {e}")
+        return source, [], False
+
+    async def aretrieve_iter(
+        self,
+        query:              Optional[str],
+        filters:            Optional[Dict] = None,
+        k:                  int   = 5,
+        limit:              int   = 10,
+        structured_timeout: float = STRUCTURED_TIMEOUT,
+        semantic_timeout:   float = SEMANTIC_TIMEOUT,
+    ) -> AsyncIterator[Tuple[str, List[Dict], bool]]:
+        """
+        هر دو منبع هم‌زمان اجرا می‌شوند و (source, results, complete) به ترتیب رسیدن
+        yield می‌شود. منبعی که خطا بدهد یا از timeout خودش بگذرد با فهرست خالی و
+        complete=False برمی‌گردد؛ جستجوی ترکیبی با یک منبعِ جامانده هم ناقص است.
+        بدون query فقط جستجوی ساختاری اجرا می‌شود؛ بدون لایهٔ معنایی (هنوز وصل
+        نشده) منبع «semantic» ناقص برمی‌گردد. با ایندکس واژگانی پر
+        (hybrid_ready)، منبع «semantic» همان جستجوی ترکیبی (BM25 + برداری) است.
+        """
+        filters = {name: v for name, v in (filters or {}).items() if v is not None}
+        tasks = [self._bounded("structured", self.astructured_search(**filters, limit=limit), structured_timeout)]
+        if query and self.hybrid_ready():
+            # خواندن دسته‌ای نامزدها از Mongo هم داخل همین بودجهٔ زمانی است
+            tasks.append(self._bounded("semantic", self._ahybrid(query, k, **filters), semantic_timeout + structured_timeout, partial=True))
+        elif query:
+            tasks.append(self._bounded("semantic", self.asemantic_search(query, k, **filters), semantic_timeout))
+        for fut in asyncio.as_completed(tasks):
+            yield await fut
+
+    async def aretrieve(self, query: Optional[str], filters: Optional[Dict] = None, **kwargs) -> Dict[str, List[Dict]]:
+        """
+        خروجی: {"structured": [...], "semantic": [...], "merged": [...], "degraded": [...]}
+        merged ترکیب بدون تکرار (بر اساس id) به ترتیب رسیدن نتایج است و degraded
+        منابعی که ناقص برگشتند؛ فراخوانی که خروجی را نگه می‌دارد نباید نتیجهٔ
+        ناقص را کش کند.
+        """
+        out: Dict[str, List] = {"structured": [], "semantic": [], "merged": [], "degraded": []}
+        seen = set()
+        async for source, results, complete in self.aretrieve_iter(query, filters, **kwargs):
+            out[source] = results
+            if not complete:
+                out["degraded"].append(source)
+            for r in results:
+                if r.get("id") not in seen:
+                    seen.add(r.get("id"))
+                    out["merged"].append(r)
+        return out
 
     
     
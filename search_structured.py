@@ -1,81 +1,395 @@
-
-from typing import Optional, List, Dict
+import json, time, base64
+from typing import Optional, List, Dict, Tuple, Any, Iterator, NamedTuple
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
 from pymongo.collection import Collection
+from pymongo.asynchronous.collection import AsyncCollection
+
+from normalize import NORM
+from listing_schema import filter_spec
+from neighborhoods import NeighborhoodIndex
+
+# کلید مرتب‌سازی عمومی ← فیلد تایپ‌شده در Mongo (پیشوند «-» یعنی نزولی)
+SORT_KEYS = {
+    "price":          f"{NORM}.sale_price",
+    "price_per_sqft": f"{NORM}.price_per_sqft",
+    "year_built":     f"{NORM}.year_built",
+    "sqft":           f"{NORM}.gross_square_feet",
+}
+# در دیتاست NYC مقدار 0 این کلیدها یعنی «نامعلوم» (انتقال بدون معامله، مساحت/سال ثبت‌نشده)
+POSITIVE_SORT_KEYS = {"price", "sqft", "year_built"}
+
+
+class ListingRow(NamedTuple):
+    """ردیف فشردهٔ خروجی جستجوی ساختاری (به‌جای دیکشنری کامل سند)."""
+    id:                str
+    borough:           Any
+    neighborhood:      Optional[str]
+    address:           Optional[str]
+    sale_price:        Optional[int]
+    gross_square_feet: Optional[int]
+    year_built:        Any
+
+
+def encode_cursor(sort: str, value: Any, last_id: Any) -> str:
+    payload = {"s": sort, "v": value, "id": str(last_id), "oid": isinstance(last_id, ObjectId)}
+    raw = json.dumps(payload, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> Dict:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        payload = json.loads(raw)
+        if payload["oid"]:
+            payload["id"] = ObjectId(payload["id"])
+        return payload
+    except Exception:
+        raise ValueError("Invalid pagination cursor")
+
 
 class StructuredSearch:
     """
-    جستجوی ساختاری روی MongoDB با پشتیبانی از فیلترهای عددی ذخیره شده به صورت رشته‌ای
+    جستجوی ساختاری روی MongoDB با فیلترهای عددی روی زیرسند نرمال‌شدهٔ «norm»
+    (ساخته‌شده توسط normalize.py) تا فیلتر، مرتب‌سازی و limit سمت سرور انجام شود.
     پارامترها (همگی اختیاری):
-      • neighborhood / city  : رشتهٔ جستجو (regex, case-insensitive)
-      • max_price            : سقف قیمت (قاعدتاً فیلد SALE PRICE به‌صورت رشته با جداکننده هزار)
-      • min_sqft / min_area  : حداقل مساحت (فیلد GROSS SQUARE FEET به‌صورت رشته با جداکننده هزار)
+      • neighborhood / city  : متن محله/بورو؛ با دیکشنری NeighborhoodIndex به
+                               کلیدهای کانونیکال تبدیل و با $in روی norm.neighborhood
+      • max_price            : سقف قیمت  ← norm.sale_price  ($lte)
+      • min_sqft / min_area  : حداقل مساحت ← norm.gross_square_feet ($gte)
+      • sort                 : یکی از SORT_KEYS، با «-» برای نزولی (پیش‌فرض price)
+      • cursor               : توکن صفحهٔ بعد (keyset روی (کلید مرتب‌سازی، _id))
       • limit                : حداکثر تعداد نتایج
-    خروجی:
+      • include_unknown      : آگهی‌های بدون مقدار کلید مرتب‌سازی (null، یا 0 برای
+                               POSITIVE_SORT_KEYS) هم بیایند؛ پیش‌فرض حذف می‌شوند
+                               (در count: آگهی‌های بدون قیمت/مساحتِ فیلترشده)
+    خروجی (ListingRow یا dict معادل آن):
       • id, borough, neighborhood, address,
         sale_price (int), gross_square_feet (int), year_built
     """
-    def __init__(self, collection: Collection):
+    # فقط فیلدهایی که در ListingRow استفاده می‌شوند از Mongo خوانده می‌شوند
+    PROJECTION = {
+        "BOROUGH":                    1,
+        "NEIGHBORHOOD":               1,
+        "ADDRESS":                    1,
+        "YEAR BUILT":                 1,
+        f"{NORM}.sale_price":         1,
+        f"{NORM}.gross_square_feet":  1,
+    }
+    BATCH_SIZE = 500
+
+    PRICE        = SORT_KEYS["price"]
+    SQFT         = SORT_KEYS["sqft"]
+    NEIGHBORHOOD = f"{NORM}.neighborhood"
+
+    # فاصلهٔ بارگذاری مجدد دیکشنری محله‌ها از Mongo (ثانیه)
+    NEIGHBORHOODS_TTL = 600
+
+    # سقف شمارش (count_documents) تا شمارش فیلترهای خیلی باز کل کالکشن را نپیماید
+    COUNT_LIMIT = 10000
+
+    def __init__(self, collection: Collection, neighborhoods: Optional[NeighborhoodIndex] = None):
         self.col = collection
+        self._neighborhoods        = neighborhoods
+        self._neighborhoods_loaded = time.monotonic() if neighborhoods else 0.0
 
-    def _parse_int(self, value: Optional[str]) -> Optional[int]:
-        if not value:
-            return None
-        # حذف جداکننده‌های هزار و تبدیل به عدد
-        try:
-            return int(value.replace(",", ""))
-        except Exception:
-            return None
+    def _neighborhoods_stale(self) -> bool:
+        return self._neighborhoods is None or time.monotonic() - self._neighborhoods_loaded > self.NEIGHBORHOODS_TTL
 
-    def search(
+    @property
+    def neighborhoods(self) -> NeighborhoodIndex:
+        """دیکشنری محله‌ها؛ به‌صورت lazy از کالکشن neighborhoods خوانده و هر چند دقیقه تازه می‌شود."""
+        if self._neighborhoods_stale():
+            self._neighborhoods = NeighborhoodIndex.load(self.col.database[NeighborhoodIndex.COLLECTION])
+            self._neighborhoods_loaded = time.monotonic()
+        return self._neighborhoods
+
+    def build_query(
         self,
         neighborhood: Optional[str] = None,
         city:         Optional[str] = None,
         max_price:    Optional[float] = None,
         min_sqft:     Optional[float] = None,
         min_area:     Optional[float] = None,
-        limit:        int            = 20,
-    ) -> List[Dict]:
-        # کوئری Mongo فقط بر اساس regex محله/شهر
-        query: Dict = {}
+    ) -> Dict:
+        """تبدیل فیلترهای ورودی به کوئری Mongo روی فیلدهای تایپ‌شده (همان ترجمهٔ فیلتر ایندکس برداری)."""
         text = neighborhood or city
-        if text:
-            query["NEIGHBORHOOD"] = {"$regex": text, "$options": "i"}
+        keys = self.neighborhoods.resolve(text) if text else None
+        target_size = min_sqft if min_sqft is not None else min_area
+        return filter_spec(keys, max_price, target_size, prefix=f"{NORM}.")
 
-        cursor = self.col.find(query)
+    # ------------------------------------------------------------------ #
+    def _parse_sort(self, sort: str) -> Tuple[str, str, int]:
+        name = sort.lstrip("-")
+        if name not in SORT_KEYS:
+            raise ValueError(f"Unsupported sort key: {sort}")
+        return name, SORT_KEYS[name], DESCENDING if sort.startswith("-") else ASCENDING
 
-        results: List[Dict] = []
-        target_size = min_sqft if min_sqft is not None else min_area
+    def _known(self, query: Dict, name: str, field: str) -> Dict:
+        """فقط آگهی‌هایی که کلید مرتب‌سازی معلوم دارند (تا null یا 0 اول ترتیب صعودی نیاید)."""
+        cond = {"$gt": 0} if name in POSITIVE_SORT_KEYS else {"$ne": None}
+        return {**query, field: {**query.get(field, {}), **cond}}
 
-        for doc in cursor:
-            # تبدیل رشته‌های عددی به int
-            sale_raw = doc.get("SALE PRICE")
-            sqft_raw = doc.get("GROSS SQUARE FEET")
-            sale_val = self._parse_int(sale_raw)
-            sqft_val = self._parse_int(sqft_raw)
-
-            # اعمال فیلتر عددی
-            if max_price is not None and (sale_val is None or sale_val > max_price):
-                continue
-            if target_size is not None and (sqft_val is None or sqft_val < target_size):
-                continue
-
-            # افزودن به نتایج
-            results.append({
-                "id":                 str(doc.get("_id")),
-                "borough":            doc.get("BOROUGH"),
-                "neighborhood":       doc.get("NEIGHBORHOOD"),
-                "address":            doc.get("ADDRESS"),
-                "sale_price":         sale_val,
-                "gross_square_feet":  sqft_val,
-                "year_built":         doc.get("YEAR BUILT"),
-            })
-
-            if len(results) >= limit:
+    def _count_query(
+        self,
+        neighborhood: Optional[str],
+        city:         Optional[str],
+        max_price:    Optional[float],
+        min_sqft:     Optional[float],
+        min_area:     Optional[float],
+        include_unknown: bool,
+    ) -> Dict:
+        """
+        کوئری شمارش؛ بدون include_unknown روی هر بازهٔ قیمت/مساحت همان شرط _known
+        جستجو اعمال می‌شود (قیمت 0 «زیر X» شمرده نمی‌شود)، تا «چندتا زیر X» با
+        «ارزان‌ترین‌های زیر X» هم‌خوان باشد.
+        """
+        query = self.build_query(neighborhood, city, max_price, min_sqft, min_area)
+        if not include_unknown:
+            if max_price is not None:
+                query = self._known(query, "price", self.PRICE)
+            if min_sqft is not None or min_area is not None:
+                query = self._known(query, "sqft", self.SQFT)
+        return query
+
+    def _after(self, field: str, direction: int, value: Any, last_id: Any) -> Dict:
+        """
+        شرط keyset برای «بعد از (value, last_id)».
+        null/فیلد ناموجود (فقط با include_unknown) در ترتیب صعودی اول و در نزولی آخر می‌آید.
+        """
+        if direction == ASCENDING:
+            if value is None:
+                return {"$or": [{field: {"$ne": None}},
+                                {field: None, "_id": {"$gt": last_id}}]}
+            return {"$or": [{field: {"$gt": value}},
+                            {field: value, "_id": {"$gt": last_id}}]}
+        if value is None:
+            return {field: None, "_id": {"$lt": last_id}}
+        return {"$or": [{field: {"$lt": value}},
+                        {field: value, "_id": {"$lt": last_id}},
+                        {field: None}]}
+
+    def _find(self, query: Dict, field: str, direction: int, limit: int):
+        # فیلد مرتب‌سازی هم در projection می‌آید تا cursor صفحهٔ بعد از آن ساخته شود
+        return (
+            self.col
+                .find(query, projection={**self.PROJECTION, field: 1})
+                .sort([(field, direction), ("_id", direction)])
+                .limit(limit)
+                .batch_size(min(limit, self.BATCH_SIZE))
+        )
+
+    def _plan(
+        self,
+        neighborhood: Optional[str],
+        city:         Optional[str],
+        max_price:    Optional[float],
+        min_sqft:     Optional[float],
+        min_area:     Optional[float],
+        sort:         str,
+        cursor:       Optional[str] = None,
+        include_unknown: bool = False,
+    ) -> Tuple[Dict, str, int]:
+        """کوئری نهایی (همراه با شرط keyset) و مشخصات مرتب‌سازی؛ مشترک بین نسخهٔ sync و async."""
+        name, field, direction = self._parse_sort(sort)
+        query = self.build_query(neighborhood, city, max_price, min_sqft, min_area)
+        if not include_unknown:
+            query = self._known(query, name, field)
+        if cursor:
+            state = decode_cursor(cursor)
+            if state["s"] != sort:
+                raise ValueError("Cursor was issued for a different sort order")
+            query = {"$and": [query, self._after(field, direction, state["v"], state["id"])]}
+        return query, field, direction
+
+    def _page(self, docs, sort: str, field: str, limit: int) -> Dict:
+        """docs باید حداکثر limit+1 سند باشد؛ سند اضافه فقط نشانهٔ وجود صفحهٔ بعد است."""
+        rows: List[Dict] = []
+        last, next_cursor = None, None
+        for doc in docs:
+            if len(rows) == limit:
+                next_cursor = encode_cursor(sort, (last.get(NORM) or {}).get(field.split(".", 1)[1]), last["_id"])
                 break
+            rows.append(self._to_row(doc)._asdict())
+            last = doc
+        return {"results": rows, "next_cursor": next_cursor}
+
+    def search_page(
+        self,
+        neighborhood: Optional[str] = None,
+        city:         Optional[str] = None,
+        max_price:    Optional[float] = None,
+        min_sqft:     Optional[float] = None,
+        min_area:     Optional[float] = None,
+        sort:         str            = "price",
+        cursor:       Optional[str]  = None,
+        limit:        int            = 20,
+        include_unknown: bool        = False,
+    ) -> Dict:
+        """
+        یک صفحه از نتایج top-N با مرتب‌سازی روی ایندکس.
+        خروجی: {"results": [...], "next_cursor": str | None}
+        """
+        query, field, direction = self._plan(neighborhood, city, max_price, min_sqft, min_area, sort, cursor, include_unknown)
+        return self._page(self._find(query, field, direction, limit + 1), sort, field, limit)
+
+    def iter_rows(
+        self,
+        neighborhood: Optional[str] = None,
+        city:         Optional[str] = None,
+        max_price:    Optional[float] = None,
+        min_sqft:     Optional[float] = None,
+        min_area:     Optional[float] = None,
+        sort:         str            = "price",
+        limit:        int            = 20,
+        include_unknown: bool        = False,
+    ) -> Iterator[ListingRow]:
+        """استریم ردیف‌ها مستقیماً از cursor بدون ساختن فهرست میانی."""
+        query, field, direction = self._plan(
+            neighborhood, city, max_price, min_sqft, min_area, sort, include_unknown=include_unknown
+        )
+        for doc in self._find(query, field, direction, limit):
+            yield self._to_row(doc)
+
+    def search(
+        self,
+        neighborhood: Optional[str] = None,
+        city:         Optional[str] = None,
+        max_price:    Optional[float] = None,
+        min_sqft:     Optional[float] = None,
+        min_area:     Optional[float] = None,
+        limit:        int            = 20,
+        sort:         str            = "price",
+        include_unknown: bool        = False,
+    ) -> List[Dict]:
+        return [
+            row._asdict()
+            for row in self.iter_rows(
+                neighborhood, city, max_price, min_sqft, min_area,
+                sort=sort, limit=limit, include_unknown=include_unknown,
+            )
+        ]
+
+    def count(
+        self,
+        neighborhood: Optional[str] = None,
+        city:         Optional[str] = None,
+        max_price:    Optional[float] = None,
+        min_sqft:     Optional[float] = None,
+        min_area:     Optional[float] = None,
+        include_unknown: bool         = False,
+    ) -> int:
+        """تعداد آگهی‌های منطبق (حداکثر COUNT_LIMIT)."""
+        query = self._count_query(neighborhood, city, max_price, min_sqft, min_area, include_unknown)
+        return self.col.count_documents(query, limit=self.COUNT_LIMIT)
+
+    def _by_ids_query(self, mongo_ids: List[Any], **filters) -> Dict:
+        return {**self.build_query(**filters), "_id": {"$in": list(mongo_ids)}}
+
+    def _to_hit(self, doc: Dict) -> Dict:
+        desc = doc.get("description") or ""
+        return {**self._to_row(doc)._asdict(), "snippet": desc[:200] + "…" if desc else ""}
+
+    def find_by_ids(self, mongo_ids: List[Any], **filters) -> Dict[str, Dict]:
+        """
+        خواندن دسته‌ای (یک $in) آگهی‌های داده‌شده که با فیلترها هم جورند؛
+        برای کامل کردن نتایج جستجوی واژگانی/ترکیبی. خروجی: id ← ردیف + snippet.
+        """
+        if not mongo_ids:
+            return {}
+        docs = self.col.find(self._by_ids_query(mongo_ids, **filters), {**self.PROJECTION, "description": 1})
+        return {hit["id"]: hit for hit in map(self._to_hit, docs)}
+
+    def _to_row(self, doc: Dict) -> ListingRow:
+        norm = doc.get(NORM) or {}
+        return ListingRow(
+            str(doc["_id"]),
+            doc.get("BOROUGH"),
+            doc.get("NEIGHBORHOOD"),
+            doc.get("ADDRESS"),
+            norm.get("sale_price"),
+            norm.get("gross_square_feet"),
+            doc.get("YEAR BUILT"),
+        )
+
+
+
+class AsyncStructuredSearch(StructuredSearch):
+    """
+    همان StructuredSearch روی AsyncCollection (API ناهمگام PyMongo)
+    تا اندپوینت‌های FastAPI در طول رفت‌وبرگشت Mongo event-loop را مسدود نکنند.
+    ساخت کوئری، cursor و نگاشت ردیف‌ها از کلاس والد به ارث می‌رسد.
+    """
+    def __init__(self, collection: AsyncCollection, neighborhoods: Optional[NeighborhoodIndex] = None):
+        super().__init__(collection, neighborhoods)
+
+    @property
+    def neighborhoods(self) -> NeighborhoodIndex:
+        # بارگذاری در refresh_neighborhoods انجام می‌شود؛ این‌جا فقط مقدار کش‌شده
+        return self._neighborhoods or NeighborhoodIndex({})
+
+    async def refresh_neighborhoods(self) -> None:
+        if self._neighborhoods_stale():
+            col  = self.col.database[NeighborhoodIndex.COLLECTION]
+            docs = await col.find({}).to_list(None)
+            self._neighborhoods = NeighborhoodIndex.from_documents(docs)
+            self._neighborhoods_loaded = time.monotonic()
+
+    async def search_page(
+        self,
+        neighborhood: Optional[str] = None,
+        city:         Optional[str] = None,
+        max_price:    Optional[float] = None,
+        min_sqft:     Optional[float] = None,
+        min_area:     Optional[float] = None,
+        sort:         str            = "price",
+        cursor:       Optional[str]  = None,
+        limit:        int            = 20,
+        include_unknown: bool        = False,
+    ) -> Dict:
+        await self.refresh_neighborhoods()
+        query, field, direction = self._plan(neighborhood, city, max_price, min_sqft, min_area, sort, cursor, include_unknown)
+        docs = await self._find(query, field, direction, limit + 1).to_list(limit + 1)
+        return self._page(docs, sort, field, limit)
+
+    async def search(
+        self,
+        neighborhood: Optional[str] = None,
+        city:         Optional[str] = None,
+        max_price:    Optional[float] = None,
+        min_sqft:     Optional[float] = None,
+        min_area:     Optional[float] = None,
+        limit:        int            = 20,
+        sort:         str            = "price",
+        include_unknown: bool        = False,
+    ) -> List[Dict]:
+        page = await self.search_page(
+            neighborhood, city, max_price, min_sqft, min_area,
+            sort=sort, limit=limit, include_unknown=include_unknown,
+        )
+        return page["results"]
 
-        # مرتب‌سازی بر اساس قیمت
-        results.sort(key=lambda x: (x.get("sale_price") or 0))
-        return results
+    async def count(
+        self,
+        neighborhood: Optional[str] = None,
+        city:         Optional[str] = None,
+        max_price:    Optional[float] = None,
+        min_sqft:     Optional[float] = None,
+        min_area:     Optional[float] = None,
+        include_unknown: bool         = False,
+    ) -> int:
+        await self.refresh_neighborhoods()
+        query = self._count_query(neighborhood, city, max_price, min_sqft, min_area, include_unknown)
+        return await self.col.count_documents(query, limit=self.COUNT_LIMIT)
+
+    async def find_by_ids(self, mongo_ids: List[Any], **filters) -> Dict[str, Dict]:
+        if not mongo_ids:
+            return {}
+        await self.refresh_neighborhoods()
+        docs = await self.col.find(
+            self._by_ids_query(mongo_ids, **filters), {**self.PROJECTION, "description": 1}
+        ).to_list(None)
+        return {hit["id"]: hit for hit in map(self._to_hit, docs)}
 
 
 
@@ -0,0 +1,38 @@
+# tests/test_dedup.py
+from dedup import Deduper, minhash, similarity
+
+BASE = ("Bright two bedroom apartment on a quiet tree lined block with hardwood floors, "
+        "renovated kitchen, laundry in the building and a short walk to the subway and the park.")
+UNIT = BASE.replace("two bedroom", "2 bedroom")               # واحد دیگرِ همان ساختمان
+OTHER = "Detached single family house with a large backyard, garage and finished basement in a cul-de-sac."
+
+
+def _record(i, text):
+    return {"id": i, "text": text, "tokens": len(text.split())}
+
+
+def test_minhash_estimates_jaccard():
+    assert similarity(minhash(BASE), minhash(BASE)) == 1.0
+    assert similarity(minhash(BASE), minhash(UNIT)) >= 0.8
+    assert similarity(minhash(BASE), minhash(OTHER)) < 0.2
+
+
+def test_near_duplicates_share_the_representative(tmp_path):
+    deduper = Deduper(str(tmp_path / "dedup.sqlite"), threshold=0.8)
+    records = [_record("1", BASE), _record("2", UNIT), _record("3", OTHER), _record("4", BASE)]
+    assert deduper.assign(records) == 1                       # فقط «2» متن نمایندهٔ دیگری را می‌گیرد
+    assert [r["embed_text"] for r in records] == [BASE, BASE, OTHER, BASE]
+
+
+def test_forget_keeps_clusters_for_other_members(tmp_path):
+    deduper = Deduper(str(tmp_path / "dedup.sqlite"), threshold=0.8)
+    deduper.assign([_record("1", BASE), _record("2", UNIT)])
+    deduper.forget(["1"])
+    members = dict(deduper._db.execute("SELECT id, cluster FROM members"))
+    assert set(members) == {"2"}
+
+    # خوشه باقی است: واحد تازهٔ همان ساختمان هنوز به نمایندهٔ قبلی می‌رسد
+    again = [_record("5", BASE.replace("hardwood", "oak"))]
+    deduper.assign(again)
+    assert again[0]["embed_text"] == BASE
+    assert dict(deduper._db.execute("SELECT id, cluster FROM members"))["5"] == members["2"]
@@ -0,0 +1,42 @@
+# tests/test_embedding_cache.py
+from langchain_core.embeddings import Embeddings
+
+from embedding_cache import CachedEmbeddings, EmbeddingCache, cache_key
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.texts = []
+
+    def embed_documents(self, texts):
+        self.texts.extend(texts)
+        return [[float(len(t)), 0.5, -1.25] for t in texts]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def test_sqlite_round_trip_survives_restart(tmp_path):
+    path = str(tmp_path / "emb.sqlite")
+    EmbeddingCache(path).put_many({"k1": [0.25, -1.5, 3.0], "k2": [1.0, 2.0, 4.0]})
+
+    reopened = EmbeddingCache(path)
+    assert reopened.peek("k1") is None                        # LRU خالی است؛ از دیسک خوانده می‌شود
+    assert reopened.get_many(["k1", "k2", "k3"]) == {"k1": [0.25, -1.5, 3.0], "k2": [1.0, 2.0, 4.0]}
+    assert reopened.peek("k1") == [0.25, -1.5, 3.0]
+
+
+def test_cache_key_ignores_whitespace_but_not_model():
+    assert cache_key("m", "two  bed\nroom ") == cache_key("m", "two bed room")
+    assert cache_key("m", "two bed room") != cache_key("other", "two bed room")
+
+
+def test_cached_embeddings_only_embeds_new_texts(tmp_path):
+    inner = CountingEmbeddings()
+    emb = CachedEmbeddings(inner, "m", EmbeddingCache(str(tmp_path / "emb.sqlite")))
+    first = emb.embed_documents(["a b", "cd", "a  b"])
+    assert first[0] == first[2] and len(inner.texts) == 2      # «a b» و «a  b» یک کلید دارند
+
+    again = CachedEmbeddings(CountingEmbeddings(), "m", EmbeddingCache(str(tmp_path / "emb.sqlite")))
+    assert again.embed_documents(["cd", "a b"]) == [first[1], first[0]]
+    assert again.inner.texts == []
@@ -0,0 +1,32 @@
+# tests/test_ingest.py
+from bson import ObjectId
+
+import ingest
+from ingest_state import CheckpointStore, RangeProgress
+
+
+def test_unfinished_run_reuses_its_range_plan(tmp_path, monkeypatch):
+    store = CheckpointStore(str(tmp_path / "state.sqlite"))
+    bounds = [ObjectId() for _ in range(3)]
+    monkeypatch.setattr(ingest, "id_ranges", lambda n: [(None, bounds[0]), (bounds[0], bounds[1]), (bounds[1], None)])
+    key, ranges = ingest.plan_ranges(store, None, 3)
+
+    # نیمهٔ راه بازهٔ دوم crash؛ اجرای بعدی $bucketAuto مرزهای دیگری می‌دهد
+    progress = RangeProgress(store, *ranges[1])
+    progress.complete(progress.issue(bounds[2]))
+    monkeypatch.setattr(ingest, "id_ranges", lambda n: [(None, bounds[2]), (bounds[2], None)])
+
+    assert ingest.plan_ranges(store, None, 3) == (key, ranges)
+    assert RangeProgress(store, *ranges[1]).resume_after() == bounds[2]
+
+    # بعد از اجرای کامل (ingest_data کلید را پاک می‌کند) طرح تازه ساخته می‌شود
+    store.delete_key(key)
+    assert ingest.plan_ranges(store, None, 3)[1] == [(None, bounds[2]), (bounds[2], None)]
+
+
+def test_range_plans_are_kept_per_shard(tmp_path, monkeypatch):
+    store = CheckpointStore(str(tmp_path / "state.sqlite"))
+    monkeypatch.setattr(ingest, "id_ranges", lambda n: [(i, i + 1) for i in range(n)])
+    assert ingest.plan_ranges(store, (0, 2), 2)[1] == [(0, 1), (1, 2)]
+    assert ingest.plan_ranges(store, (1, 2), 2)[1] == [(2, 3), (3, 4)]
+    assert ingest.plan_ranges(store, (0, 2), 2)[0] != ingest.plan_ranges(store, (1, 2), 2)[0]
@@ -0,0 +1,72 @@
+# tests/test_intent_router.py
+import asyncio
+
+import mongomock
+import pytest
+
+from intent_router  import LOOKUP, OPEN, SUPERLATIVE_LIMIT, answer_direct, route
+from search_service import SearchService
+
+# (قیمت، مساحت، سال ساخت)؛ None و 0 مثل دیتاست NYC یعنی «نامعلوم»
+LISTINGS = [
+    (None,    None, 0),
+    (0,       0,    1925),
+    (0,       850,  0),
+    (None,    1200, 1931),
+    (740000,  900,  1910),
+    (515000,  650,  1988),
+    (1250000, 2100, 2004),
+    (398000,  0,    1899),
+]
+
+
+@pytest.fixture
+def service():
+    col = mongomock.MongoClient().db.listings
+    for i, (price, sqft, year) in enumerate(LISTINGS):
+        norm = {k: v for k, v in (("sale_price", price), ("gross_square_feet", sqft), ("year_built", year)) if v is not None}
+        col.insert_one({"_id": i, "ADDRESS": f"{i} MAIN ST", "NEIGHBORHOOD": "CHELSEA", "YEAR BUILT": year, "norm": norm})
+    return SearchService(col, None, None)
+
+
+def _answer(service, prompt):
+    r = route(prompt, {})
+    assert r.intent == LOOKUP and r.limit == SUPERLATIVE_LIMIT
+    return r, asyncio.run(answer_direct(service, r)).splitlines()
+
+
+def test_cheapest_skips_unknown_and_zero_prices(service):
+    r, lines = _answer(service, "cheapest homes")
+    assert r.sort == "price"
+    assert lines == [
+        "7 MAIN ST in CHELSEA for $398000 (0 sqft)",
+        "5 MAIN ST in CHELSEA for $515000 (650 sqft)",
+        "4 MAIN ST in CHELSEA for $740000 (900 sqft)",
+        "6 MAIN ST in CHELSEA for $1250000 (2100 sqft)",
+    ]
+
+
+def test_smallest_skips_zero_sqft(service):
+    r, lines = _answer(service, "smallest apartments")
+    assert r.sort == "sqft"
+    assert lines[0].startswith("5 MAIN ST") and len(lines) == SUPERLATIVE_LIMIT
+    assert not any("(0 sqft)" in line or "(None sqft)" in line for line in lines)
+
+
+def test_oldest_skips_unknown_year(service):
+    r, lines = _answer(service, "oldest buildings")
+    assert r.sort == "year_built"
+    assert [line.split()[0] for line in lines] == ["7", "4", "1", "3", "5"]
+
+
+def test_open_question_goes_to_agent():
+    assert route("why is the cheapest home so cheap", {}).intent == OPEN
+
+
+def test_count_agrees_with_lookup_under_price(service):
+    r = route("how many homes under $800000", {})
+    assert r.intent != OPEN and r.filters["max_price"] == 800000
+    n = asyncio.run(answer_direct(service, r))
+    rows = service.structured_search(max_price=800000, limit=100)
+    assert n.startswith(f"{len(rows)} ") and len(rows) == 3
+    assert service.structured_count(max_price=800000, include_unknown=True) == 5
@@ -0,0 +1,33 @@
+# tests/test_lexical_index.py
+from lexical_index import LexicalIndex
+
+
+def _index(tmp_path):
+    index = LexicalIndex(str(tmp_path / "lexical.sqlite"))
+    index.add([
+        ("a", "m-a", "sunny loft with a rooftop terrace near the park"),
+        ("b", "m-b", "terrace terrace terrace apartment"),
+        ("c", "m-c", "quiet studio near the subway"),
+        ("d", "m-d", "family house with garden and garage near schools"),
+    ])
+    return index
+
+
+def test_bm25_ranks_rare_and_repeated_terms_higher(tmp_path):
+    index = _index(tmp_path)
+    hits = index.search("terrace", k=5)
+    assert [h.id for h in hits] == ["b", "a"]                 # tf بیشتر و سند کوتاه‌تر اول
+    assert hits[0].score > hits[1].score and hits[0].mongo_id == "m-b"
+
+    # «near» در بیشتر اسناد هست؛ «rooftop» کمیاب‌تر است و رتبه را تعیین می‌کند
+    assert index.search("near rooftop", k=1)[0].id == "a"
+
+
+def test_replace_and_delete_update_postings(tmp_path):
+    index = _index(tmp_path)
+    index.add([("b", "m-b", "garden apartment")])
+    assert [h.id for h in index.search("terrace")] == ["a"]
+    assert {h.id for h in index.search("garden")} == {"b", "d"}
+
+    index.delete(["a"])
+    assert index.search("terrace") == [] and len(index) == 3
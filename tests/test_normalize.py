@@ -0,0 +1,48 @@
+# tests/test_normalize.py
+from types import SimpleNamespace
+
+import mongomock
+
+from normalize import NORM, normalize_document, refresh_norm
+
+
+class BulkCollection:
+    """mongomock با UpdateOne های PyMongo 4.x در bulk_write سازگار نیست؛ اجرای تک‌به‌تک."""
+    def __init__(self, col):
+        self.col = col
+
+    def __getattr__(self, name):
+        return getattr(self.col, name)
+
+    def bulk_write(self, ops, ordered=True):
+        n = sum(self.col.update_one(op._filter, op._doc).modified_count for op in ops)
+        return SimpleNamespace(modified_count=n)
+
+
+def _col():
+    col = BulkCollection(mongomock.MongoClient().db.listings)
+    col.insert_many([
+        {"_id": 1, "SALE PRICE": "450,000", "GROSS SQUARE FEET": "900"},
+        {"_id": 2, "SALE PRICE": "300,000", "GROSS SQUARE FEET": "600"},
+    ])
+    for doc in col.find():
+        col.update_one({"_id": doc["_id"]}, {"$set": {NORM: normalize_document(doc)}})
+    return col
+
+
+def test_refresh_norm_rewrites_only_stale_documents():
+    col = _col()
+    col.update_one({"_id": 1}, {"$set": {"SALE PRICE": "510,000"}})     # قیمت عوض شد، norm کهنه
+
+    assert refresh_norm(col, list(col.find())) == 1
+    assert col.find_one({"_id": 1})[NORM]["sale_price"] == 510000
+    assert col.find_one({"_id": 1})[NORM]["price_per_sqft"] == round(510000 / 900, 2)
+    assert refresh_norm(col, list(col.find())) == 0                     # دوباره چیزی نوشته نمی‌شود
+
+
+def test_refresh_norm_fills_missing_norm():
+    col = _col()
+    col.insert_one({"_id": 3, "SALE PRICE": " -  ", "GROSS SQUARE FEET": "0"})
+
+    assert refresh_norm(col, list(col.find())) == 1
+    assert col.find_one({"_id": 3})[NORM] == {"gross_square_feet": 0}
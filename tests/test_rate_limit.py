@@ -0,0 +1,68 @@
+# tests/test_rate_limit.py
+import asyncio, time
+
+import httpx
+import pytest
+
+from rate_limit import CircuitBreaker, CircuitOpenError, RateLimiter
+
+
+def _half_open(limiter: RateLimiter, model: str, cooldown: float = 0.05) -> CircuitBreaker:
+    breaker = limiter.breaker(model)
+    breaker.cooldown  = cooldown
+    breaker.failures  = breaker.threshold
+    breaker.opened_at = time.monotonic() - cooldown
+    return breaker
+
+
+async def _use(limiter: RateLimiter, model: str, send) -> int:
+    async with limiter.request(model, send) as response:
+        return response.status_code
+
+
+def test_cancelled_probe_reopens_breaker():
+    async def run():
+        limiter = RateLimiter(max_in_flight=1)
+        breaker = _half_open(limiter, "m")
+        started = asyncio.Event()
+
+        async def hang():
+            started.set()
+            await asyncio.sleep(3600)
+
+        probe = asyncio.create_task(_use(limiter, "m", hang))
+        await started.wait()
+        probe.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await probe
+
+        assert not breaker._probing
+        with pytest.raises(CircuitOpenError):
+            await _use(limiter, "m", hang)       # cooldown تازه
+
+        await asyncio.sleep(breaker.cooldown)
+
+        async def ok():
+            return httpx.Response(200)
+
+        assert await _use(limiter, "m", ok) == 200
+        assert breaker.opened_at is None
+        assert limiter._slots._value == 1
+
+    asyncio.run(run())
+
+
+def test_probe_with_unexpected_error_releases_probe():
+    async def run():
+        limiter = RateLimiter(max_in_flight=1)
+        breaker = _half_open(limiter, "m")
+
+        async def boom():
+            raise ValueError("bad payload")
+
+        with pytest.raises(ValueError):
+            await _use(limiter, "m", boom)
+        assert not breaker._probing
+        assert limiter._slots._value == 1
+
+    asyncio.run(run())
@@ -0,0 +1,66 @@
+# tests/test_result_cache.py
+import mongomock
+import pytest
+
+from listing_schema import vector_filter
+from neighborhoods  import NeighborhoodIndex
+from result_cache   import META_COLLECTION, IndexVersion, ResultCache, bump_index_version, make_key
+from search_service import SearchService
+
+
+def test_bump_index_version_invalidates_entries():
+    db = mongomock.MongoClient().db
+    version = IndexVersion(db[META_COLLECTION], refresh=0)
+    cache = ResultCache()
+    v0 = version.get()
+    cache.put("k", v0, ["old"])
+    assert cache.get("k", version.get()) == ["old"]
+
+    bump_index_version(db)
+    assert version.get() == v0 + 1
+    assert cache.get("k", version.get()) is None
+    assert cache.get("k", v0) is None                         # ورودی قدیمی حذف هم شده است
+
+
+def test_index_version_is_read_at_most_once_per_refresh():
+    db = mongomock.MongoClient().db
+    version = IndexVersion(db[META_COLLECTION], refresh=60)
+    assert version.get() == 0
+    bump_index_version(db)
+    assert version.get() == 0                                 # هنوز مقدار کش‌شده
+    version._read_at = float("-inf")
+    assert version.get() == 1
+
+
+def test_search_service_recomputes_after_bump():
+    col = mongomock.MongoClient().db.listings
+    svc = SearchService(col, None, None)
+    svc.version.refresh = 0
+    calls = []
+
+    def compute():
+        calls.append(1)
+        return [len(calls)]
+
+    assert svc._cached("structured", {"max_price": 5e5}, compute) == [1]
+    assert svc._cached("structured", {"max_price": 500000}, compute) == [1]
+    bump_index_version(col.database)
+    assert svc._cached("structured", {"max_price": 500000}, compute) == [2]
+
+
+def test_make_key_ignores_order_spacing_and_none():
+    assert make_key("semantic", {"query": " park  view", "k": 5, "city": None}) == make_key("semantic", {"k": 5, "query": "park view"})
+
+
+@pytest.mark.parametrize("kind", ["structured", "semantic", "hybrid"])
+def test_neighborhood_spellings_share_a_key(kind):
+    key = make_key(kind, {"query": "park view", "neighborhood": "HARLEM-CENTRAL"})
+    assert make_key(kind, {"query": "park view", "neighborhood": "harlem  central"}) == key
+    assert make_key(kind, {"query": "Park view", "neighborhood": "harlem central"}) != key
+
+
+def test_canonical_key_is_what_the_vector_filter_resolves():
+    index = NeighborhoodIndex({"harlem central": {"name": "HARLEM-CENTRAL", "borough": 1, "count": 3}})
+    assert vector_filter(neighborhood="Harlem-Central", neighborhoods=index) == \
+           vector_filter(neighborhood="harlem central", neighborhoods=index) == \
+           {"neighborhood": {"$in": ["harlem central"]}}
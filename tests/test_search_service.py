@@ -0,0 +1,116 @@
+# tests/test_search_service.py
+import asyncio
+
+import mongomock
+
+import search_service
+from lexical_index  import LexicalHit
+from search_service import SearchService
+
+
+class FakeLexical:
+    def __init__(self, hits):
+        self.hits = hits
+
+    def __len__(self):
+        return len(self.hits)
+
+    def search(self, query, k=10):
+        return self.hits[:k]
+
+
+class FlakySemantic:
+    """بار اول از timeout جستجوی معنایی بیشتر طول می‌کشد، بعد سریع جواب می‌دهد."""
+    def __init__(self, results, slow_calls=1):
+        self.results    = results
+        self.slow_calls = slow_calls
+        self.calls      = 0
+
+    async def asearch(self, query, k=5, filter_dict=None):
+        self.calls += 1
+        if self.calls <= self.slow_calls:
+            await asyncio.sleep(1)
+        return self.results[:k]
+
+
+def _service(monkeypatch, semantic):
+    monkeypatch.setattr(search_service, "SEMANTIC_TIMEOUT", 0.05)
+    col = mongomock.MongoClient().db.listings
+    col.insert_many([
+        {"_id": "a", "ADDRESS": "1 W 72ND ST", "description": "park view"},
+        {"_id": "b", "ADDRESS": "2 E 10TH ST", "description": "quiet street"},
+    ])
+    lexical = FakeLexical([LexicalHit("a", "a", 3.0)])
+    return SearchService(col, None, semantic, lexical_index=lexical)
+
+
+def test_degraded_hybrid_result_is_not_cached(monkeypatch):
+    semantic = FlakySemantic([{"id": "b", "mongo_id": "b", "score": 0.9}])
+    svc = _service(monkeypatch, semantic)
+
+    async def run():
+        first = await svc.ahybrid_search("park view", k=5)
+        assert [r["id"] for r in first] == ["a"]              # فقط واژگانی
+        second = await svc.ahybrid_search("park view", k=5)
+        assert {r["id"] for r in second} == {"a", "b"}        # معنایی دوباره امتحان شد
+        third = await svc.ahybrid_search("park view", k=5)
+        assert third == second                                # نتیجهٔ کامل از کش
+        assert semantic.calls == 2
+
+    asyncio.run(run())
+
+
+def test_aretrieve_reports_degraded_sources(monkeypatch):
+    semantic = FlakySemantic([{"id": "b", "mongo_id": "b", "score": 0.9}])
+    svc = _service(monkeypatch, semantic)
+
+    async def run():
+        first = await svc.aretrieve("park view")
+        assert first["degraded"] == ["semantic"]
+        second = await svc.aretrieve("park view")
+        assert second["degraded"] == []
+        assert {r["id"] for r in second["semantic"]} == {"a", "b"}
+
+    asyncio.run(run())
+
+
+def test_empty_lexical_index_falls_back_to_semantic(monkeypatch):
+    semantic = FlakySemantic([{"id": "b", "mongo_id": "b", "score": 0.9}], slow_calls=0)
+    svc = _service(monkeypatch, semantic)
+    svc.lexical = FakeLexical([])
+    assert not svc.hybrid_ready()
+
+    out = asyncio.run(svc.aretrieve("park view"))
+    assert [r["id"] for r in out["semantic"]] == ["b"]
+    assert "sources" not in out["semantic"][0]                # مسیر فقط برداری، نه RRF
+
+
+def test_structured_only_until_semantic_is_attached(monkeypatch):
+    svc = _service(monkeypatch, None)
+    svc.lexical = None
+    assert not svc.semantic_ready
+
+    out = asyncio.run(svc.aretrieve("park view"))
+    assert out["degraded"] == ["semantic"]
+
+    semantic = FlakySemantic([{"id": "b", "mongo_id": "b", "score": 0.9}], slow_calls=0)
+    svc.attach_semantic(None, semantic, FakeLexical([LexicalHit("a", "a", 3.0)]))
+    out = asyncio.run(svc.aretrieve("park view"))
+    assert out["degraded"] == []
+    assert {r["id"] for r in out["semantic"]} == {"a", "b"}
+
+
+def test_rrf_rewards_agreement_between_rankings():
+    fused = search_service.rrf([["a", "b", "c"], ["b", "d"]], k=60)
+    assert [i for i, _ in fused] == ["b", "a", "d", "c"]
+    assert dict(fused)["b"] == 1 / 62 + 1 / 61
+
+
+def test_fuse_only_verifies_lexical_only_candidates_when_filtered():
+    lexical  = [LexicalHit("a", "ma", 2.0), LexicalHit("b", "mb", 1.0)]
+    semantic = [{"id": "b", "mongo_id": "mb"}, {"id": "c", "mongo_id": "mc"}]
+    fused, refs, unverified = SearchService._fuse(lexical, semantic, filtered=True)
+    assert fused[0][0] == "b"
+    assert refs == {"a": "ma", "b": "mb", "c": "mc"}
+    assert unverified == ["ma"]                               # نامزدهای برداری از قبل فیلتر شده‌اند
+    assert SearchService._fuse(lexical, semantic, filtered=False)[2] == []
@@ -0,0 +1,64 @@
+# tests/test_search_structured.py
+import mongomock
+import pytest
+from bson import ObjectId
+
+from neighborhoods     import NeighborhoodIndex
+from search_structured import StructuredSearch
+
+# قیمت‌ها مثل دیتاست NYC: چند آگهی بدون قیمت (" -  " ← None) یا با قیمت 0
+PRICES = [None, 0, 450000, None, 125000, 0, 980000, 300000, 125000, 2100000]
+IDS    = sorted(ObjectId() for _ in PRICES)
+
+
+@pytest.fixture
+def search():
+    col = mongomock.MongoClient().db.listings
+    docs = []
+    for i, price in enumerate(PRICES):
+        norm = {"gross_square_feet": 500 + i * 100}
+        if price is not None:
+            norm["sale_price"] = price
+        docs.append({"_id": IDS[i], "ADDRESS": f"{i} MAIN ST", "norm": norm})
+    col.insert_many(docs)
+    return StructuredSearch(col, NeighborhoodIndex({}))
+
+
+def _pages(search, **kwargs):
+    pages, cursor = [], None
+    while True:
+        page = search.search_page(cursor=cursor, **kwargs)
+        pages.append([IDS.index(ObjectId(r["id"])) for r in page["results"]])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return pages
+
+
+def test_default_sort_skips_unknown_and_zero_prices(search):
+    rows = search.search(limit=3)
+    assert [r["sale_price"] for r in rows] == [125000, 125000, 300000]
+
+
+def test_ascending_pages_cover_priced_listings_once(search):
+    pages = _pages(search, sort="price", limit=3)
+    ids = [i for page in pages for i in page]
+    assert ids == [4, 8, 7, 2, 6, 9]
+    assert [len(p) for p in pages] == [3, 3]
+
+
+def test_descending_pages_with_filter(search):
+    pages = _pages(search, sort="-price", max_price=1000000, limit=2)
+    assert [i for page in pages for i in page] == [6, 2, 7, 8, 4]
+
+
+def test_include_unknown_pages_through_nulls(search):
+    pages = _pages(search, sort="price", limit=4, include_unknown=True)
+    ids = [i for page in pages for i in page]
+    assert sorted(ids) == list(range(len(PRICES)))
+    assert ids[:2] == [0, 3]                    # null اول ترتیب صعودی
+
+
+def test_cursor_rejects_other_sort(search):
+    cursor = search.search_page(sort="price", limit=1)["next_cursor"]
+    with pytest.raises(ValueError):
+        search.search_page(sort="-price", cursor=cursor)
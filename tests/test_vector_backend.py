@@ -0,0 +1,105 @@
+# tests/test_vector_backend.py
+import numpy as np
+import pytest
+
+import vector_backend
+from vector_backend import LocalVectorIndex, compile_filter, compile_mask, _normalize_rows
+
+DIM = 16
+HOODS = ["chelsea", "soho", "harlem"]
+
+
+def _vectors(n, seed=0):
+    rng = np.random.default_rng(seed)
+    x = rng.normal(size=(n, DIM)).astype(np.float32)
+    return x, [
+        {"id": str(i), "values": x[i], "metadata": {
+            "neighborhood": HOODS[i % 3],
+            "sale_price":   (i % 10) * 100000,
+            **({"gross_square_feet": 500 + i % 7 * 100} if i % 4 else {}),
+        }}
+        for i in range(n)
+    ]
+
+
+@pytest.mark.parametrize("spec, meta, expected", [
+    ({"sale_price": {"$lte": 500000}}, {"sale_price": 500000}, True),
+    ({"sale_price": {"$lte": 500000}}, {"sale_price": 500001}, False),
+    ({"sale_price": {"$lte": 500000}}, {}, False),                           # فیلد ناموجود با بازه جور نیست
+    ({"neighborhood": "soho"}, {"neighborhood": "soho"}, True),              # مقدار ساده یعنی $eq
+    ({"neighborhood": {"$eq": "soho"}}, {"neighborhood": "harlem"}, False),
+    ({"neighborhood": {"$in": ["soho", "harlem"]}}, {"neighborhood": "harlem"}, True),
+    ({"neighborhood": {"$in": ["soho"]}}, {}, False),
+    ({"neighborhood": {"$nin": ["soho"]}}, {}, True),                        # ولی با $nin/$ne جور است
+    ({"neighborhood": {"$ne": "soho"}}, {}, True),
+])
+def test_compile_filter_semantics(spec, meta, expected):
+    assert compile_filter(spec)(meta) is expected
+    col = lambda key: _column(key, [meta])
+    assert bool(compile_mask(spec, col, 1)[0]) is expected
+
+
+def _column(key, metas):
+    col = vector_backend._Column(key)
+    col.extend(metas)
+    return col
+
+
+def test_filtered_query_matches_brute_force(tmp_path):
+    x, vectors = _vectors(3000)
+    index = LocalVectorIndex(str(tmp_path), dim=DIM)
+    index.upsert(vectors)
+    spec = {"neighborhood": {"$in": ["soho", "harlem"]}, "sale_price": {"$lte": 300000}, "gross_square_feet": {"$gte": 700}}
+    q = np.random.default_rng(1).normal(size=DIM)
+
+    allowed = np.array([compile_filter(spec)(v["metadata"]) for v in vectors])
+    scores = _normalize_rows(x) @ _normalize_rows(q)
+    scores[~allowed] = -np.inf
+    expected = [str(i) for i in np.argsort(-scores)[:10]]
+    assert [h.id for h in index.query(q, 10, spec)] == expected
+
+
+def test_ivf_recall_against_brute_force(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_backend, "IVF_MIN_ROWS", 1000)
+    x, vectors = _vectors(4000)
+    index = LocalVectorIndex(str(tmp_path), dim=DIM, nprobe=16)
+    index.upsert(vectors)
+    index.save()
+    assert index._centroids is not None
+
+    queries = np.random.default_rng(2).normal(size=(20, DIM))
+    exact = np.argsort(-(_normalize_rows(queries) @ _normalize_rows(x).T), axis=1)[:, :10]
+    recall = np.mean([
+        len({h.id for h in index.query(q, 10)} & {str(i) for i in row}) / 10
+        for q, row in zip(queries, exact)
+    ])
+    assert recall >= 0.9
+
+
+def test_journal_is_replayed_after_restart(tmp_path):
+    _, vectors = _vectors(50)
+    index = LocalVectorIndex(str(tmp_path), dim=DIM)
+    index.upsert(vectors[:40])
+    index.save()
+    index.upsert(vectors[40:])
+    index.delete(["0", "1"])
+
+    reopened = LocalVectorIndex(str(tmp_path), dim=DIM)
+    assert len(reopened) == 48
+    assert "0" not in reopened.row_of and "49" in reopened.row_of
+    hit = reopened.query(vectors[45]["values"], 1)[0]
+    assert hit.id == "45" and hit.metadata == vectors[45]["metadata"]
+
+
+def test_upsert_never_compacts(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_backend, "JOURNAL_COMPACT_ROWS", 100)
+    _, vectors = _vectors(300)
+    index = LocalVectorIndex(str(tmp_path), dim=DIM)
+    for s in range(0, 300, 10):
+        index.upsert(vectors[s:s + 10])
+    assert not (tmp_path / "manifest.json").exists()
+    assert index.compaction_due
+
+    assert index.maybe_compact()
+    assert (tmp_path / "manifest.json").exists() and not index.compaction_due
+    assert not index.maybe_compact()
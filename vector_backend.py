@@ -0,0 +1,541 @@
+# vector_backend.py
+# ────────────────────────────────────────────────────────────────────────────
+# backend برداری پشت SemanticSearch و ingest، با یک رابط مشترک:
+#   upsert(vectors=[{"id", "values", "metadata"}]) / delete(ids=[...])
+#   query(vector, k, filter) → [Hit(id, score, metadata)]   (+ aquery)
+#
+#   • PineconeBackend  : همان ایندکس Pinecone (aquery با IndexAsyncio، بدون thread)
+#   • LocalVectorIndex : ایندکس درون‌پروسه روی دیسک —
+#       - ماتریس float32 نرمال‌شده (cosine = ضرب داخلی) به‌صورت memory-map
+#       - ANN از نوع IVF (k-means کروی با numpy) وقتی تعداد بردارها زیاد است؛
+#         در غیر این صورت جستجوی کامل (برای چند ده هزار بردار چند میلی‌ثانیه)
+#       - موتور فیلتر متادیتا با همان سینتکس Pinecone
+#         ($eq $ne $gt $gte $lt $lte $in $nin $exists $and $or)؛ روی ستون‌های
+#         numpy متادیتا به ماسک سطرها تبدیل می‌شود (compile_mask)
+#       - journal افزایشی: هر upsert/delete بلافاصله روی دیسک ثبت می‌شود (پس
+#         checkpoint های ingest با محتوای ایندکس هماهنگ می‌مانند) و save()
+#         آن را در فایل‌های اصلی ادغام می‌کند — در پایان ingest، یا با
+#         maybe_compact بین micro-batch های live_indexer؛ upsert هرگز ادغام نمی‌کند.
+#
+#   انتخاب backend:  VECTOR_BACKEND=pinecone | local   (مسیر: LOCAL_VECTOR_PATH)
+# ────────────────────────────────────────────────────────────────────────────
+import os, json, time, pickle, asyncio, logging, threading
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+VECTOR_BACKEND    = os.getenv("VECTOR_BACKEND", "pinecone")
+LOCAL_VECTOR_PATH = os.getenv("LOCAL_VECTOR_PATH", "vector_index")
+VECTOR_DIMENSION  = 1536
+
+# از این تعداد بردار به بالا IVF ساخته می‌شود؛ nprobe = تعداد خوشه‌های بررسی‌شده
+IVF_MIN_ROWS = int(os.getenv("LOCAL_VECTOR_IVF_MIN_ROWS", "50000"))
+IVF_NPROBE   = int(os.getenv("LOCAL_VECTOR_NPROBE", "16"))
+# maybe_compact وقتی ادغام می‌کند که سطرهای journal (upsert + delete) از این تعداد
+# و از این کسر اندازهٔ ایندکس ذخیره‌شده بیشتر شوند
+JOURNAL_COMPACT_ROWS     = int(os.getenv("LOCAL_VECTOR_JOURNAL_COMPACT_ROWS", "20000"))
+JOURNAL_COMPACT_FRACTION = float(os.getenv("LOCAL_VECTOR_JOURNAL_COMPACT_FRACTION", "0.1"))
+# فاصلهٔ بررسی تغییر فایل‌ها روی دیسک (وقتی پروسهٔ دیگری مثل ingest ایندکس را به‌روز می‌کند)
+RELOAD_INTERVAL = float(os.getenv("LOCAL_VECTOR_RELOAD_INTERVAL", "5"))
+
+
+class Hit(NamedTuple):
+    id:       str
+    score:    float
+    metadata: Dict
+
+
+# ── موتور فیلتر متادیتا ─────────────────────────────────────────────────
+_OPS: Dict[str, Callable[[Any, Any], bool]] = {
+    "$eq":  lambda v, x: v == x,
+    "$ne":  lambda v, x: v != x,
+    "$gt":  lambda v, x: v is not None and v > x,
+    "$gte": lambda v, x: v is not None and v >= x,
+    "$lt":  lambda v, x: v is not None and v < x,
+    "$lte": lambda v, x: v is not None and v <= x,
+    "$in":  lambda v, x: v in x,
+    "$nin": lambda v, x: v not in x,
+}
+
+def compile_filter(spec: Optional[Dict]) -> Callable[[Dict], bool]:
+    """فیلتر Pinecone ← تابع روی متادیتای یک بردار. فیلد ناموجود فقط با $ne/$nin/$exists:false جور است."""
+    if not spec:
+        return lambda meta: True
+
+    preds: List[Callable[[Dict], bool]] = []
+    for key, cond in spec.items():
+        if key in ("$and", "$or"):
+            subs = [compile_filter(c) for c in cond]
+            preds.append((lambda s: lambda m: all(p(m) for p in s))(subs) if key == "$and"
+                         else (lambda s: lambda m: any(p(m) for p in s))(subs))
+            continue
+        if not isinstance(cond, dict):
+            cond = {"$eq": cond}
+        for op, arg in cond.items():
+            if op == "$exists":
+                preds.append((lambda k, a: lambda m: (k in m) == a)(key, bool(arg)))
+            elif op in _OPS:
+                missing_ok = op in ("$ne", "$nin")
+                preds.append((lambda k, f, a, ok: lambda m: f(m[k], a) if k in m else ok)(key, _OPS[op], arg, missing_ok))
+            else:
+                raise ValueError(f"Unsupported filter operator: {op}")
+    return lambda meta: all(p(meta) for p in preds)
+
+
+class _Column:
+    """
+    یک فیلد متادیتا برای همهٔ سطرها: codes کد هر مقدار (-1 = فیلد ناموجود) و
+    nums مقدار عددی (NaN = ناموجود یا غیرعددی). مقدار unhashable ⇒ generic.
+    """
+    def __init__(self, key: str):
+        self.key   = key
+        self.vocab: Dict[Any, int] = {}
+        self.codes = np.zeros(0, dtype=np.int32)
+        self.nums  = np.zeros(0, dtype=np.float64)
+        self.generic = False
+
+    def extend(self, metas: List[Dict]) -> None:
+        codes = np.full(len(metas), -1, dtype=np.int32)
+        nums  = np.full(len(metas), np.nan)
+        for i, m in enumerate(metas):
+            if self.key not in m:
+                continue
+            v = m[self.key]
+            try:
+                codes[i] = self.vocab.setdefault(v, len(self.vocab))
+            except TypeError:
+                self.generic = True
+                continue
+            if isinstance(v, (int, float)):
+                nums[i] = v
+        self.codes = np.concatenate([self.codes, codes])
+        self.nums  = np.concatenate([self.nums, nums])
+
+
+_CMP: Dict[str, Callable[[np.ndarray, float], np.ndarray]] = {
+    "$gt":  np.greater,
+    "$gte": np.greater_equal,
+    "$lt":  np.less,
+    "$lte": np.less_equal,
+}
+
+def compile_mask(spec: Dict, column: Callable[[str], _Column], n: int) -> np.ndarray:
+    """
+    همان معنای compile_filter، به‌صورت ماسک bool روی n سطر. برای حالتی که
+    ستونی بردار نشود (مقدار unhashable یا مقایسهٔ غیرعددی) TypeError می‌دهد
+    تا فراخواننده به compile_filter برگردد.
+    """
+    mask = np.ones(n, dtype=bool)
+    for key, cond in spec.items():
+        if key in ("$and", "$or"):
+            subs = [compile_mask(c, column, n) for c in cond]
+            if key == "$and":
+                mask &= np.logical_and.reduce(subs) if subs else np.ones(n, dtype=bool)
+            else:
+                mask &= np.logical_or.reduce(subs) if subs else np.zeros(n, dtype=bool)
+            continue
+        if not isinstance(cond, dict):
+            cond = {"$eq": cond}
+        col = column(key)
+        if col.generic:
+            raise TypeError(f"Metadata field {key!r} has unhashable values")
+        for op, arg in cond.items():
+            if op == "$exists":
+                mask &= (col.codes >= 0) == bool(arg)
+            elif op in ("$eq", "$ne", "$in", "$nin"):
+                args = arg if op in ("$in", "$nin") else [arg]
+                hit = np.isin(col.codes, [col.vocab[a] for a in args if a in col.vocab])
+                # فیلد ناموجود (کد -1) در هیچ مقداری نیست ⇒ با $ne/$nin جور است
+                mask &= hit if op in ("$eq", "$in") else ~hit
+            elif op in _CMP:
+                if isinstance(arg, bool) or not isinstance(arg, (int, float)):
+                    raise TypeError(f"Non-numeric comparison {op} {arg!r}")
+                with np.errstate(invalid="ignore"):
+                    mask &= _CMP[op](col.nums, arg)
+            else:
+                raise ValueError(f"Unsupported filter operator: {op}")
+    return mask
+
+
+def _normalize_rows(x: np.ndarray) -> np.ndarray:
+    x = np.asarray(x, dtype=np.float32)
+    norms = np.linalg.norm(x, axis=-1, keepdims=True)
+    return x / np.where(norms == 0, 1, norms)
+
+
+# ── Pinecone ────────────────────────────────────────────────────────────
+class PineconeBackend:
+    """
+    index: handle همگام (ingest و مسیر sync). با client، aquery از IndexAsyncio
+    روی همان host استفاده می‌کند؛ نشست aiohttp آن به event-loop وابسته است، پس
+    برای هر loop یک نمونه ساخته می‌شود (مثل get_http_client در models.py).
+    بدون client (مثلاً در ingest) aquery نسخهٔ sync را در thread اجرا می‌کند.
+    """
+    def __init__(self, index, client=None):
+        self.index  = index
+        self.client = client
+        self._aindex = None
+        self._aindex_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @staticmethod
+    def _hits(res) -> List[Hit]:
+        return [Hit(m["id"], m["score"], m.get("metadata") or {}) for m in res["matches"]]
+
+    def query(self, vector: List[float], k: int = 5, filter: Optional[Dict] = None) -> List[Hit]:
+        return self._hits(self.index.query(vector=list(vector), top_k=k, filter=filter or None, include_metadata=True))
+
+    def _async_index(self):
+        loop = asyncio.get_running_loop()
+        if self._aindex is None or self._aindex_loop is not loop:
+            self._aindex, self._aindex_loop = self.client.IndexAsyncio(host=self.index.config.host), loop
+        return self._aindex
+
+    async def aquery(self, vector: List[float], k: int = 5, filter: Optional[Dict] = None) -> List[Hit]:
+        if self.client is None:
+            return await asyncio.to_thread(self.query, vector, k, filter)
+        res = await self._async_index().query(
+            vector=list(vector), top_k=k, filter=filter or None, include_metadata=True
+        )
+        return self._hits(res)
+
+    async def aclose(self) -> None:
+        if self._aindex is not None:
+            await self._aindex.close()
+            self._aindex = None
+
+    def upsert(self, vectors: List[Dict]) -> None:
+        self.index.upsert(vectors=vectors)
+
+    def delete(self, ids: List[str]) -> None:
+        self.index.delete(ids=ids)
+
+    def save(self) -> None:
+        pass
+
+    def maybe_compact(self) -> bool:
+        return False
+
+
+# ── ایندکس محلی ─────────────────────────────────────────────────────────
+class LocalVectorIndex:
+    """
+    فایل‌ها در path:
+      manifest.json  : ابعاد، شناسه‌ها، متادیتا
+      vectors.f32    : ماتریس n×dim (memory-map، فقط‌خواندنی)
+      ivf.npz        : مراکز خوشه‌ها و فهرست سطرهای هر خوشه (CSR)
+      journal.pkl    : تغییرات بعد از آخرین save
+    """
+    def __init__(self, path: str = LOCAL_VECTOR_PATH, dim: int = VECTOR_DIMENSION, nprobe: int = IVF_NPROBE):
+        self.path   = path
+        self.dim    = dim
+        self.nprobe = nprobe
+        self._lock  = threading.RLock()
+        self._loaded_at = 0.0
+        self._disk_mtime = None
+        self._load()
+
+    # ── فایل‌ها ──────────────────────────────────────────────────────────
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _mtime(self):
+        stamps = []
+        for name in ("manifest.json", "journal.pkl"):
+            try:
+                stamps.append(os.stat(self._file(name)).st_mtime_ns)
+            except FileNotFoundError:
+                stamps.append(None)
+        return tuple(stamps)
+
+    def _reset(self) -> None:
+        self.ids:  List[str]  = []
+        self.meta: List[Dict] = []
+        self.row_of: Dict[str, int] = {}
+        self._base   = np.zeros((0, self.dim), dtype=np.float32)
+        self._extra: List[np.ndarray] = []
+        self._matrix_cache: Optional[np.ndarray] = None
+        self._alive  = np.zeros(0, dtype=bool)
+        self._centroids: Optional[np.ndarray] = None
+        self._list_offsets: Optional[np.ndarray] = None
+        self._list_rows:    Optional[np.ndarray] = None
+        self._assign = np.zeros(0, dtype=np.int32)     # خوشهٔ هر سطر (-1 = بدون خوشه)
+        self._columns: Dict[str, _Column] = {}           # ستون‌های متادیتا برای فیلتر (lazy)
+        self._journal_rows = 0
+
+    def _load(self) -> None:
+        with self._lock:
+            self._reset()
+            manifest = self._file("manifest.json")
+            if os.path.exists(manifest):
+                with open(manifest, encoding="utf-8") as f:
+                    m = json.load(f)
+                self.dim  = m["dim"]
+                self.ids  = m["ids"]
+                self.meta = m["metadata"]
+                n = len(self.ids)
+                self._base = (np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r", shape=(n, self.dim))
+                              if n else np.zeros((0, self.dim), dtype=np.float32))
+                self._alive  = np.ones(n, dtype=bool)
+                self._assign = np.full(n, -1, dtype=np.int32)
+                self.row_of  = {i: r for r, i in enumerate(self.ids)}
+                if os.path.exists(self._file("ivf.npz")):
+                    ivf = np.load(self._file("ivf.npz"))
+                    self._centroids    = ivf["centroids"]
+                    self._list_offsets = ivf["offsets"]
+                    self._list_rows    = ivf["rows"]
+                    self._assign       = ivf["assign"]
+            self._replay_journal()
+            self._disk_mtime = self._mtime()
+            self._loaded_at  = time.monotonic()
+
+    def _replay_journal(self) -> None:
+        try:
+            f = open(self._file("journal.pkl"), "rb")
+        except FileNotFoundError:
+            return
+        with f:
+            while True:
+                try:
+                    op, payload = pickle.load(f)
+                except EOFError:
+                    break
+                except Exception:
+                    logger.warning("Truncated journal record ignored (interrupted write)")
+                    break
+                if op == "upsert":
+                    self._apply_upsert(*payload)
+                    self._journal_rows += len(payload[0])
+                else:
+                    self._apply_delete(payload)
+                    self._journal_rows += len(payload)
+
+    def _journal(self, op: str, payload: Any, rows: int) -> None:
+        os.makedirs(self.path, exist_ok=True)
+        with open(self._file("journal.pkl"), "ab") as f:
+            pickle.dump((op, payload), f, protocol=pickle.HIGHEST_PROTOCOL)
+        self._journal_rows += rows
+
+    def maybe_reload(self) -> None:
+        """اگر پروسهٔ دیگری (ingest / live_indexer) فایل‌ها را تغییر داده باشد، دوباره بارگذاری می‌شود."""
+        if time.monotonic() - self._loaded_at < RELOAD_INTERVAL:
+            return
+        self._loaded_at = time.monotonic()
+        if self._mtime() != self._disk_mtime:
+            logger.info("Local vector index changed on disk; reloading")
+            self._load()
+
+    # ── نوشتن ────────────────────────────────────────────────────────────
+    def _apply_upsert(self, ids: List[str], values: np.ndarray, metas: List[Dict]) -> None:
+        start = len(self.ids)
+        for i in ids:
+            old = self.row_of.get(i)
+            if old is not None:
+                self._alive[old] = False
+        self.ids.extend(ids)
+        self.meta.extend(metas)
+        for r, i in enumerate(ids, start):
+            self.row_of[i] = r
+        self._extra.append(values)
+        self._matrix_cache = None
+        self._alive = np.concatenate([self._alive, np.ones(len(ids), dtype=bool)])
+        # سطرهای جدید تا save بعدی در فهرست خوشه‌ها نیستند و در هر جستجو بررسی می‌شوند
+        self._assign = np.concatenate([self._assign, np.full(len(ids), -1, dtype=np.int32)])
+        for col in self._columns.values():
+            col.extend(metas)
+
+    def _apply_delete(self, ids: List[str]) -> None:
+        for i in ids:
+            r = self.row_of.pop(i, None)
+            if r is not None:
+                self._alive[r] = False
+
+    def upsert(self, vectors: List[Dict]) -> None:
+        if not vectors:
+            return
+        ids    = [str(v["id"]) for v in vectors]
+        values = _normalize_rows([v["values"] for v in vectors])
+        if values.shape[1] != self.dim:
+            raise ValueError(f"Vector dimension {values.shape[1]} != index dimension {self.dim}")
+        metas  = [v.get("metadata") or {} for v in vectors]
+        with self._lock:
+            self._journal("upsert", (ids, values, metas), len(ids))
+            self._apply_upsert(ids, values, metas)
+
+    def delete(self, ids: List[str]) -> None:
+        ids = [str(i) for i in ids]
+        with self._lock:
+            self._journal("delete", ids, len(ids))
+            self._apply_delete(ids)
+
+    @property
+    def compaction_due(self) -> bool:
+        saved = len(self.ids) - sum(len(e) for e in self._extra)
+        return self._journal_rows >= max(JOURNAL_COMPACT_ROWS, JOURNAL_COMPACT_FRACTION * saved)
+
+    def maybe_compact(self) -> bool:
+        """ادغام journal فقط وقتی به اندازهٔ کافی (بر حسب سطر) بزرگ شده؛ برای پروسه‌های طولانی مثل live_indexer."""
+        if not self.compaction_due:
+            return False
+        self.save()
+        return True
+
+    def _matrix(self) -> np.ndarray:
+        if not self._extra:
+            return self._base
+        if self._matrix_cache is None:
+            self._matrix_cache = np.vstack([self._base, *self._extra])
+        return self._matrix_cache
+
+    def __len__(self) -> int:
+        return len(self.row_of)
+
+    def _column(self, key: str) -> _Column:
+        col = self._columns.get(key)
+        if col is None:
+            col = self._columns[key] = _Column(key)
+            col.extend(self.meta)
+        return col
+
+    # ── ساخت IVF و ذخیره ────────────────────────────────────────────────
+    @staticmethod
+    def _kmeans(x: np.ndarray, nlist: int, iters: int = 10, seed: int = 0) -> np.ndarray:
+        """k-means کروی (شباهت cosine) روی نمونه‌ای از سطرها."""
+        rng = np.random.default_rng(seed)
+        sample = x[rng.choice(len(x), size=min(len(x), nlist * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(iters):
+            assign = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign, sample)
+            empty = ~np.bincount(assign, minlength=nlist).astype(bool)
+            sums[empty] = centroids[empty]
+            centroids = _normalize_rows(sums)
+        return centroids
+
+    def save(self) -> None:
+        """
+        ادغام journal: سطرهای زنده فشرده، IVF (در صورت نیاز) ساخته و فایل‌ها
+        جایگزین می‌شوند. مراکز خوشهٔ فعلی تا وقتی تعداد سطرها از چهار برابر
+        تعداد خوشه‌ها به توان دو نگذشته دوباره استفاده می‌شوند (فقط انتساب، بدون k-means).
+        """
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            rows = np.flatnonzero(self._alive)
+            matrix = np.asarray(self._matrix()[rows], dtype=np.float32)
+            ids  = [self.ids[r] for r in rows]
+            meta = [self.meta[r] for r in rows]
+
+            tmp = self._file("vectors.f32.tmp")
+            if len(ids):
+                out = np.memmap(tmp, dtype=np.float32, mode="w+", shape=matrix.shape)
+                out[:] = matrix
+                out.flush()
+                del out
+            else:
+                open(tmp, "wb").close()
+
+            ivf_tmp = self._file("ivf.tmp.npz")
+            if len(ids) >= IVF_MIN_ROWS:
+                nlist = int(np.sqrt(len(ids)))
+                if self._centroids is not None and len(ids) <= 4 * len(self._centroids) ** 2:
+                    centroids, nlist = self._centroids, len(self._centroids)
+                else:
+                    centroids = self._kmeans(matrix, nlist)
+                assign = np.empty(len(ids), dtype=np.int32)
+                for s in range(0, len(ids), 65536):
+                    assign[s:s + 65536] = np.argmax(matrix[s:s + 65536] @ centroids.T, axis=1)
+                order   = np.argsort(assign, kind="stable").astype(np.int64)
+                offsets = np.concatenate([[0], np.cumsum(np.bincount(assign, minlength=nlist))]).astype(np.int64)
+                np.savez(ivf_tmp, centroids=centroids, offsets=offsets, rows=order, assign=assign)
+            elif os.path.exists(self._file("ivf.npz")):
+                os.remove(self._file("ivf.npz"))
+
+            manifest_tmp = self._file("manifest.json.tmp")
+            with open(manifest_tmp, "w", encoding="utf-8") as f:
+                json.dump({"dim": self.dim, "ids": ids, "metadata": meta}, f, ensure_ascii=False, default=str)
+
+            # ترتیب جایگزینی: داده‌ها، بعد manifest، در آخر پاک کردن journal
+            self._base = None   # رها کردن memmap قبلی قبل از جایگزینی فایل
+            os.replace(tmp, self._file("vectors.f32"))
+            if os.path.exists(ivf_tmp):
+                os.replace(ivf_tmp, self._file("ivf.npz"))
+            os.replace(manifest_tmp, self._file("manifest.json"))
+            if os.path.exists(self._file("journal.pkl")):
+                os.remove(self._file("journal.pkl"))
+            self._load()
+            logger.info(f"Saved local vector index: {len(ids)} vectors"
+                        + (f", IVF with {len(self._centroids)} lists" if self._centroids is not None else ""))
+
+    # ── جستجو ───────────────────────────────────────────────────────────
+    def _candidates(self, q: np.ndarray) -> np.ndarray:
+        alive = self._alive
+        if self._centroids is None:
+            return np.flatnonzero(alive)
+        nprobe = min(self.nprobe, len(self._centroids))
+        probe  = np.argpartition(-(self._centroids @ q), nprobe - 1)[:nprobe]
+        parts  = [self._list_rows[self._list_offsets[c]:self._list_offsets[c + 1]] for c in probe]
+        parts.append(np.flatnonzero(self._assign < 0))       # سطرهای بعد از آخرین save
+        rows = np.concatenate(parts)
+        return rows[alive[rows]]
+
+    def query(self, vector: List[float], k: int = 5, filter: Optional[Dict] = None) -> List[Hit]:
+        self.maybe_reload()
+        pred = compile_filter(filter)
+        q = _normalize_rows(np.asarray(vector, dtype=np.float32))
+        allowed = None
+        with self._lock:
+            matrix = self._matrix()
+            rows   = self._candidates(q)
+            ids, meta = self.ids, self.meta
+            if filter:
+                try:
+                    allowed = compile_mask(filter, self._column, len(ids))
+                except TypeError:
+                    pass
+        if allowed is not None:
+            rows = rows[allowed[rows]]
+        if not len(rows):
+            return []
+        scores = matrix[rows] @ q
+
+        hits: List[Hit] = []
+        if filter and allowed is None:
+            # ستون‌ها بردار نشدند: به ترتیب امتیاز تا پیدا شدن k مورد منطبق
+            for i in np.argsort(-scores):
+                r = rows[i]
+                if pred(meta[r]):
+                    hits.append(Hit(ids[r], float(scores[i]), meta[r]))
+                    if len(hits) == k:
+                        break
+        else:
+            top = np.argpartition(-scores, min(k, len(scores)) - 1)[:k]
+            for i in top[np.argsort(-scores[top])]:
+                r = rows[i]
+                hits.append(Hit(ids[r], float(scores[i]), meta[r]))
+        return hits
+
+    async def aquery(self, vector: List[float], k: int = 5, filter: Optional[Dict] = None) -> List[Hit]:
+        # ضرب ماتریسی numpy GIL را آزاد می‌کند؛ در thread اجرا می‌شود تا loop آزاد بماند
+        return await asyncio.to_thread(self.query, vector, k, filter)
+
+    async def aclose(self) -> None:
+        pass
+
+
+def open_backend(
+    index_factory:  Callable[[], Any],
+    backend:        str = VECTOR_BACKEND,
+    path:           str = LOCAL_VECTOR_PATH,
+    client_factory: Optional[Callable[[], Any]] = None,
+):
+    """
+    backend انتخاب‌شده؛ index_factory (و client_factory برای aquery ناهمگام)
+    فقط برای Pinecone و فقط در صورت نیاز صدا زده می‌شوند.
+    """
+    if backend == "local":
+        return LocalVectorIndex(path)
+    if backend == "pinecone":
+        return PineconeBackend(index_factory(), client_factory() if client_factory else None)
+    raise ValueError(f"Unknown VECTOR_BACKEND: {backend}")